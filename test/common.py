@@ -141,6 +141,10 @@ def make_swig_tmp_folder(input_path):
     return make_tmp_folder(pathlib.Path('swig'), input_path)
 
 
+def make_cython_tmp_folder(input_path):
+    return make_tmp_folder(pathlib.Path('cython'), input_path)
+
+
 def basic_check_fortran_code(case: unittest.TestCase, path, code, **kwargs):
     basic_check_code(case, path, code, 'f77', **kwargs)
 
@@ -0,0 +1,80 @@
+"""Test examples for constant propagation and folding."""
+
+import numpy as np
+import static_typing as st
+
+
+def smooth(data: st.ndarray[1, np.double], n: int):
+    width = 2
+    weight = 1.0 / (2 * width + 1)
+    result = np.zeros((n,), dtype=np.double)
+    for i in range(width, n - width):
+        for j in range(-width, width + 1):
+            result[i] += data[i + j] * weight
+    return result
+
+
+def smooth_folded(data: st.ndarray[1, np.double], n: int):
+    width = 2
+    weight = 0.2
+    result = np.zeros((n,), dtype=np.double)
+    for i in range(2, n - 2):
+        for j in range(-2, 3):
+            result[i] += data[i + j] * 0.2
+    return result
+
+
+def single_precision(data: st.ndarray[1, np.float32], n: int):
+    half = np.float32(1) / np.float32(2)
+    scale: np.float32 = half * np.float32(4)
+    for i in range(n):
+        data[i] = data[i] * scale + half
+    return data
+
+
+def single_precision_folded(data: st.ndarray[1, np.float32], n: int):
+    half = np.float32(0.5)
+    scale: np.float32 = np.float32(2.0)
+    for i in range(n):
+        data[i] = data[i] * np.float32(2.0) + np.float32(0.5)
+    return data
+
+
+def portable_arithmetic(x: int):
+    big = 2 ** 10 - 1
+    exact = (big + 1) // 8 + 1 % 2 + 3 * (-2) ** 2
+    return exact + 7 / 2 + -7 % 2 + 2 ** -1 + x // 4 + (0 < big < 10 ** 4 and not False)
+
+
+def portable_arithmetic_folded(x: int):
+    big = 1023
+    exact = 141
+    return 141 + 7 / 2 + -7 % 2 + 2 ** -1 + x // 4 + True
+
+
+def not_constant(values: list, flag: bool):
+    total = 0
+    count = 10
+    values.append(count)
+    limit = 5
+    limit_ = limit
+    if flag:
+        limit = 6
+    for i in range(count):
+        total += i
+    n: float = 3
+    return total + limit + limit_ + n
+
+
+def not_constant_folded(values: list, flag: bool):
+    total = 0
+    count = 10
+    values.append(count)
+    limit = 5
+    limit_ = limit
+    if flag:
+        limit = 6
+    for i in range(count):
+        total += i
+    n: float = 3
+    return total + limit + limit_ + n
@@ -0,0 +1,44 @@
+"""Test examples for Cython unparser and compiler."""
+
+import numpy as np
+import static_typing as st
+
+
+def smooth(data: st.ndarray[1, np.double]) -> st.ndarray[1, np.double]:
+    result = np.zeros_like(data)  # type: st.ndarray[1, np.double]
+    for i in range(1, data.shape[0] - 1):
+        result[i] = (data[i - 1] + data[i] + data[i + 1]) / 3
+    return result
+
+
+def trace(matrix: st.ndarray[2, np.double], n: int) -> np.double:
+    total = 0.0  # type: np.double
+    for i in range(n):
+        total += matrix[i, i]
+    return total
+
+
+def transpose_add(a: st.ndarray[2, np.double], b: st.ndarray[2, np.double]):
+    for i in range(a.shape[0]):
+        for j in range(a.shape[1]):
+            a[i, j] += b[j, i]
+
+
+def last_column_sum(matrix: st.ndarray[2, np.double]) -> np.double:
+    total = 0.0  # type: np.double
+    for i in range(matrix.shape[0]):
+        total += matrix[i, -1]
+    return total
+
+
+def blur_rows(image: st.ndarray[2, np.double]):
+    for i in range(image.shape[0]):
+        for j in range(1, image.shape[1] - 1):
+            image[i, j] = (image[i, j - 1] + image[i, j + 1]) / 2
+
+
+def weighted_sum(a: st.ndarray[1, np.double], weights: list) -> np.double:
+    total = 0.0  # type: np.double
+    for i in range(a.shape[0]):
+        total += a[i] * weights[i - 1]
+    return total
@@ -0,0 +1,70 @@
+"""Test examples for dead code elimination."""
+
+import numpy as np
+import static_typing as st
+
+counter = 0
+
+
+def accumulate(data: st.ndarray[1, np.double], n: int):
+    unused = 10
+    scaled = n * 2
+    scratch = 0.0
+    total = 0.0
+    for i in range(n):
+        scratch = data[i] * 2.0
+        total += data[i]
+        last = i
+    return total
+    print('unreachable')
+
+
+def accumulate_eliminated(data: st.ndarray[1, np.double], n: int):
+    total = 0.0
+    for i in range(n):
+        total += data[i]
+    return total
+
+
+def count_until(limit: int, flags: list):
+    count = 0
+    steps = 0
+    while count < limit:
+        count += 1
+        steps = count * 2
+        if count > 5:
+            break
+    if False:
+        flags.append(count)
+    else:
+        flags.append(-count)
+    counter = count
+    limit = 0
+    return count
+
+
+def count_until_eliminated(limit: int, flags: list):
+    count = 0
+    while count < limit:
+        count += 1
+        if count > 5:
+            break
+    flags.append(-count)
+    counter = count
+    limit = 0
+    return count
+
+
+def fill(values: list, n: int):
+    temp = n + 1
+    extra = [temp]
+    values.extend(extra)
+    result = np.zeros((n,))
+    return values
+
+
+def fill_eliminated(values: list, n: int):
+    temp = n + 1
+    extra = [temp]
+    values.extend(extra)
+    return values
@@ -80,3 +80,84 @@ def inline_oneliner_inlined(value1=0, value2=0):
 
 # '''def do_work_3d(array):\n    do_work(array, 1)\n    do_work(array, 2)\n''':
 # '''def do_work(array, dim):\n    if dim == 1:\n        array[:, 4] = 2\n    if dim == 2:\n'''
+
+
+def norm_squared(x=0, y=0):
+    return x * x + y * y
+
+
+def sum_of_norms(xs=(), ys=(), n=0):
+    total = 0
+    for i in range(n):
+        total += norm_squared(xs[i], ys[i])
+    return total
+
+
+def sum_of_norms_inlined(xs=(), ys=(), n=0):
+    total = 0
+    for i in range(n):
+        total += ((xs[i] * xs[i]) + (ys[i] * ys[i]))
+    return total
+
+
+def scaled_norm_squared(x=0, y=0, scale=1):
+    return scale * norm_squared(x, y)
+
+
+def sum_of_scaled_norms(xs=(), ys=(), n=0):
+    total = 0
+    for i in range(n):
+        total += scaled_norm_squared(xs[i], ys[i], 2)
+    return total
+
+
+def sum_of_scaled_norms_inlined(xs=(), ys=(), n=0):
+    total = 0
+    for i in range(n):
+        total += (2 * ((xs[i] * xs[i]) + (ys[i] * ys[i])))
+    return total
+
+
+def clamp(values=(), i=0):
+    if values[i] < 0:
+        values[i] = 0
+
+
+def clamp_all(values=(), n=0):
+    for i in range(n):
+        clamp(values, i)
+
+
+def clamp_all_inlined(values=(), n=0):
+    for i in range(n):
+        if (values[i] < 0):
+            values[i] = 0
+
+
+def first_norm(xs=(), ys=()):
+    return norm_squared(xs[0], ys[0])
+
+
+def half_of_norm(x=0, y=0):
+    total = norm_squared(x, y)
+    return total / 2
+
+
+def sum_of_half_norms(xs=(), ys=(), n=0):
+    total = 0
+    for i in range(n):
+        total += half_of_norm(xs[i], ys[i])
+    return total
+
+
+def reset_first(values=(), value=0):
+    values[0] = 0
+    return value
+
+
+def sum_of_reset_firsts(values=(), n=0):
+    total = 0
+    for i in range(n):
+        first = reset_first(values, values[0])
+        total += first
+    return total
@@ -0,0 +1,87 @@
+"""Test examples for algebraic simplification."""
+
+import numpy as np
+import static_typing as st
+
+
+def accumulate_products(c: st.ndarray[1, np.double], a: st.ndarray[1, np.double],
+                        b: st.ndarray[1, np.double], width: int, height: int, scale: float):
+    for y in range(height):
+        for i in range(width):
+            for x in range(height):
+                c[y * height + x] = c[y * height + x] + a[y * width + i] * b[i * height + x] \
+                    * scale ** 2
+    return c
+
+
+def accumulate_products_simplified(
+        c: st.ndarray[1, np.double], a: st.ndarray[1, np.double], b: st.ndarray[1, np.double],
+        width: int, height: int, scale: float):
+    cse_0: int
+    cse_1: int
+    cse_2: int
+    cse_3: float
+    cse_4: int
+    cse_3 = scale * scale
+    for y in range(height):
+        cse_0 = y * height
+        for i in range(width):
+            cse_1 = y * width + i
+            cse_2 = i * height
+            for x in range(height):
+                cse_4 = cse_0 + x
+                c[cse_4] = c[cse_4] + a[cse_1] * b[cse_2 + x] * cse_3
+    return c
+
+
+def reduce_strength(data: st.ndarray[1, np.double], n: int, offset: int):
+    total = 0.0
+    for k in range(n):
+        total += data[k // 4] ** 3 / 4 + data[k % 8] / 2.0 + (k - offset) // 2
+    return total
+
+
+def reduce_strength_simplified(data: st.ndarray[1, np.double], n: int, offset: int):
+    cse_0: int
+    total = 0.0
+    for k in range(n):
+        cse_0 = k >> 2
+        total += data[cse_0] * data[cse_0] * data[cse_0] * 0.25 + data[k & 7] * 0.5 \
+            + (k - offset) // 2
+    return total
+
+
+def not_invariant(data: st.ndarray[1, np.double], n: int, values: list):
+    total = 0.0
+    step: int = 1
+    for i in range(n):
+        total += data[i] * (step + 1)
+        step = step * 2 % 7
+        values.append(n + 1)
+        total += data[i] * (step + 1)
+    return total
+
+
+def not_invariant_simplified(data: st.ndarray[1, np.double], n: int, values: list):
+    cse_0: int
+    total = 0.0
+    step: int = 1
+    cse_0 = n + 1
+    for i in range(n):
+        total += data[i] * (step + 1)
+        step = step * 2 % 7
+        values.append(cse_0)
+        total += data[i] * (step + 1)
+    return total
+
+
+def shift_by(data: st.ndarray[1, np.int64], n: int, x: int, s: int):
+    for i in range(n):
+        data[i] = x >> s
+    return data
+
+
+def shift_by_simplified(data: st.ndarray[1, np.int64], n: int, x: int, s: int):
+    for i in range(n):
+        data[i] = x >> s
+    return data
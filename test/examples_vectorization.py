@@ -0,0 +1,127 @@
+"""Test examples for loop vectorization."""
+
+import numpy as np
+import static_typing as st
+
+
+def scale(data: st.ndarray[1, np.double], factor: np.double, n: int):
+    result = np.zeros((n,), dtype=np.double)
+    for i in range(n):
+        result[i] = data[i] * factor + np.sqrt(data[i])
+    return result
+
+
+def scale_vectorized(data: st.ndarray[1, np.double], factor: np.double, n: int):
+    result = np.zeros((n,), dtype=np.double)
+    result[:max(n, 0)] = data[:max(n, 0)] * factor + np.sqrt(data[:max(n, 0)])
+    return result
+
+
+def stencil(data: st.ndarray[1, np.double], n: int):
+    result = np.zeros((n,), dtype=np.double)
+    for i in range(1, n - 1):
+        result[i] = data[i - 1] + data[i + 1] - 2 * i
+    return result
+
+
+def stencil_vectorized(data: st.ndarray[1, np.double], n: int):
+    result = np.zeros((n,), dtype=np.double)
+    result[1:max(n - 1, 0)] = data[0:max(n - 2, 0)] + data[2:max(n, 0)] - 2 * np.arange(1, n - 1)
+    return result
+
+
+def shift(data: st.ndarray[1, np.double], n: int):
+    result = np.zeros((n,), dtype=np.double)
+    for i in range(1, n):
+        result[i] = data[i - 1]
+    return result
+
+
+def shift_vectorized(data: st.ndarray[1, np.double], n: int):
+    result = np.zeros((n,), dtype=np.double)
+    result[1:max(n, 0)] = data[0:max(n - 1, 0)]
+    return result
+
+
+def increment(a: st.ndarray[1, np.double], b: st.ndarray[1, np.double], n: int):
+    for i in range(n):
+        a[i] = b[i] + 1.0
+    return a
+
+
+def increment_vectorized(a: st.ndarray[1, np.double], b: st.ndarray[1, np.double], n: int):
+    a[:max(n, 0)] = b[:max(n, 0)] + 1.0
+    return a
+
+
+def dot_and_max(a: st.ndarray[1, np.double], b: st.ndarray[1, np.double], n: int):
+    total = 0.0
+    largest = -1.0
+    for i in range(n):
+        total += a[i] * b[i]
+        largest = max(largest, a[i])
+    return total, largest
+
+
+def dot_and_max_vectorized(a: st.ndarray[1, np.double], b: st.ndarray[1, np.double], n: int):
+    total = 0.0
+    largest = -1.0
+    total += np.sum(a[:max(n, 0)] * b[:max(n, 0)])
+    largest = np.amax(a[:max(n, 0)], initial=largest)
+    return total, largest
+
+
+def add_rows(x: st.ndarray[2, np.double], y: st.ndarray[2, np.double], rows: int, cols: int):
+    for i in range(rows):
+        for j in range(cols):
+            x[i, j] = x[i, j] + y[i, j]
+
+
+def add_rows_vectorized(x: st.ndarray[2, np.double], y: st.ndarray[2, np.double],
+                        rows: int, cols: int):
+    x[:max(rows, 0), :max(cols, 0)] = \
+        x[:max(rows, 0), :max(cols, 0)] + y[:max(rows, 0), :max(cols, 0)]
+
+
+def shift_rows(x: st.ndarray[2, np.double], y: st.ndarray[2, np.double], rows: int, cols: int):
+    for i in range(rows):
+        for j in range(i + 1, cols):
+            x[i, j] = y[i, j - 1]
+
+
+def shift_rows_vectorized(x: st.ndarray[2, np.double], y: st.ndarray[2, np.double],
+                          rows: int, cols: int):
+    for i in range(rows):
+        x[i, i + 1:max(cols, 0)] = y[i, i:max(cols - 1, 0)]
+
+
+def prefix_sum(data: st.ndarray[1, np.double], n: int):
+    for i in range(1, n):
+        data[i] = data[i - 1] + data[i]
+    return data
+
+
+def sum_and_product(a: st.ndarray[1, np.double], b: st.ndarray[1, np.double], n: int):
+    total = 0.0
+    for i in range(n):
+        total += a[i]
+        total *= b[i]
+    return total
+
+
+def last_index(data: st.ndarray[1, np.double], n: int):
+    for i in range(n):
+        data[i] = 0
+    return i
+
+
+def user_function(data: st.ndarray[1, np.double], n: int):
+    for i in range(n):
+        data[i] = last_index(data, i)
+
+
+def shift_from(data: st.ndarray[1, np.double], k: int, n: int):
+    result = np.zeros((n,), dtype=np.double)
+    for i in range(k, n):
+        result[i] = data[i - 1]
+    return result
@@ -33,7 +33,9 @@ class Tests(unittest.TestCase):
                 return 'abcde'
 
         my_generalizer = MyGeneralizer()
-        # self.assertEqual(len(my_generalizer._transforms), 2, msg=my_generalizer._transforms)
+        self.assertIn('_some_node', MyGeneralizer._transforms)
+        self.assertIn('_other_node', MyGeneralizer._transforms)
+        self.assertNotIn('_some_node', XmlAstGeneralizer._transforms)
 
         with self.assertRaises(ContinueIteration):
             my_generalizer.generalize(ET.Element('some-node'))
@@ -0,0 +1,66 @@
+"""Unit tests for utility functions."""
+
+import logging
+import unittest
+import unittest.mock
+import xml.etree.ElementTree as ET
+
+import typed_ast.ast3 as typed_ast3
+
+from transpyle.general.misc import \
+    flatten_sequence, flatten_syntax, LazyFormat, lazy_xml, lazy_unparse
+
+
+class Tests(unittest.TestCase):
+
+    def test_flatten_sequence(self):
+        for sequence, flat in [
+                ([], []), ([1, 2, 3], [1, 2, 3]), ([[1], [], [2, [3, [4]]], 5], [1, 2, 3, 4, 5]),
+                ([[[[]]]], [])]:
+            with self.subTest(sequence=sequence):
+                flatten_sequence(sequence)
+                self.assertListEqual(sequence, flat)
+
+    def test_flatten_sequence_long(self):
+        sequence = [[_, [_]] for _ in range(100000)]
+        flatten_sequence(sequence)
+        self.assertEqual(len(sequence), 200000)
+        self.assertListEqual(sequence[:4], [0, 0, 1, 1])
+
+    def test_flatten_syntax(self):
+        tree = typed_ast3.parse('if a:\n    pass\nelse:\n    pass\n')
+        if_ = tree.body[0]
+        inner = typed_ast3.parse('for i in x:\n    pass\n').body[0]
+        inner.body = [[inner.body], []]
+        if_.body = [[if_.body[0], [inner]]]
+        if_.orelse = [[], [if_.orelse]]
+        tree.body = [[if_]]
+        flatten_syntax[typed_ast3](tree, recursive=False)
+        self.assertListEqual(tree.body, [if_])
+        self.assertIsInstance(if_.body[0], list)
+        flatten_syntax[typed_ast3](tree)
+        self.assertEqual(len(if_.body), 2)
+        self.assertIs(if_.body[1], inner)
+        self.assertEqual(len(inner.body), 1)
+        self.assertIsInstance(if_.orelse[0], typed_ast3.Pass)
+
+    def test_lazy_format(self):
+        function = unittest.mock.Mock(return_value='formatted')
+        lazy = LazyFormat(function, 1, 2)
+        function.assert_not_called()
+        self.assertEqual(str(lazy), 'formatted')
+        self.assertEqual('{!r}'.format(lazy), 'formatted')
+        function.assert_called_with(1, 2)
+
+        node = ET.fromstring('<a><b/></a>')
+        self.assertEqual(str(lazy_xml(node)), '<a><b /></a>')
+        tree = typed_ast3.parse('a = 1\nb = 2\n')
+        self.assertEqual(str(lazy_unparse(tree.body[0])), 'a = 1')
+        self.assertEqual(str(lazy_unparse(tree.body)), "['a = 1', 'b = 2']")
+
+    def test_lazy_format_in_disabled_logging(self):
+        function = unittest.mock.Mock(return_value='formatted')
+        logger = logging.getLogger(__name__)
+        with unittest.mock.patch.object(logger, 'isEnabledFor', return_value=False):
+            logger.debug('%s', LazyFormat(function))
+        function.assert_not_called()
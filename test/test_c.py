@@ -1,5 +1,6 @@
 """Tests of C language support."""
 
+import concurrent.futures
 import logging
 import unittest
 
@@ -7,10 +8,12 @@ import timing
 import typed_astunparse
 
 from transpyle.general.code_reader import CodeReader
-from transpyle.c.parser import C99Parser
+from transpyle.c.parser import C99Parser, preprocess_c
 from transpyle.c.ast_generalizer import CAstGeneralizer
 
-from .common import basic_check_c_ast, basic_check_python_ast, execute_on_language_examples
+from .common import \
+    EXAMPLES_ROOTS, EXAMPLES_FILES, c_ast_dump, basic_check_c_ast, basic_check_python_ast, \
+    execute_on_language_examples
 
 _LOG = logging.getLogger(__name__)
 
@@ -29,6 +32,31 @@ class ParserTests(unittest.TestCase):
         basic_check_c_ast(self, input_path, c_ast)
         _LOG.info('parsed "%s" in %fs', input_path, timer.elapsed)
 
+    def test_parse_cached(self):
+        input_path = EXAMPLES_ROOTS['c11'].joinpath('matmul.c')
+        code = CodeReader().read_file(input_path)
+        parser = C99Parser()
+        c_ast = parser.parse(code, input_path)
+        hits = preprocess_c.cache_info().hits
+        with _TIME.measure('parse.cached') as timer:
+            cached_c_ast = parser.parse(code, input_path)
+        self.assertEqual(preprocess_c.cache_info().hits, hits + 1)
+        self.assertIsNot(cached_c_ast, c_ast)
+        self.assertEqual(c_ast_dump(cached_c_ast), c_ast_dump(c_ast))
+        _LOG.info('parsed "%s" again in %fs', input_path, timer.elapsed)
+
+    def test_parse_in_threads(self):
+        code_reader = CodeReader()
+        input_paths = EXAMPLES_FILES['c11']
+        codes = [code_reader.read_file(input_path) for input_path in input_paths]
+        parser = C99Parser()
+        c_asts = [parser.parse(code, input_path) for code, input_path in zip(codes, input_paths)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            threaded_c_asts = list(executor.map(parser.parse, codes * 4, input_paths * 4))
+        for input_path, c_ast, threaded_c_ast in zip(input_paths * 4, c_asts * 4, threaded_c_asts):
+            with self.subTest(input_path=input_path):
+                self.assertEqual(c_ast_dump(threaded_c_ast), c_ast_dump(c_ast))
+
 
 class AstGeneralizerTests(unittest.TestCase):
 
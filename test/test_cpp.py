@@ -4,23 +4,28 @@ import logging
 import os
 import pathlib
 import platform
+import tempfile
 import types
 import unittest
+import unittest.mock
+import xml.etree.ElementTree as ET
 
 from encrypted_config.json_io import json_to_file
 import timing
+import typed_ast.ast3 as typed_ast3
 import typed_astunparse
 
 from transpyle.general.code_reader import CodeReader
 from transpyle.general.binder import Binder
-from transpyle.cpp.parser import CppParser
-from transpyle.cpp.ast_generalizer import CppAstGeneralizer
+from transpyle.cpp.parser import CppParser, find_function_names
+from transpyle.cpp.ast_generalizer import \
+    CppAstGeneralizer, CastXMLTypeResolver, make_const, make_pointer
 from transpyle.cpp.unparser import Cpp14Unparser
 from transpyle.cpp.compiler import CppSwigCompiler
 from transpyle.cpp.compiler_interface import GppInterface
 
 from .common import \
-    PERFORMANCE_RESULTS_ROOT, EXAMPLES_ROOT, EXAMPLES_ROOTS, \
+    PERFORMANCE_RESULTS_ROOT, EXAMPLES_ROOT, EXAMPLES_ROOTS, EXAMPLES_FILES, \
     basic_check_cpp_code, basic_check_cpp_ast, make_swig_tmp_folder, \
     basic_check_python_ast, execute_on_language_examples
 
@@ -41,6 +46,35 @@ class ParserTests(unittest.TestCase):
         basic_check_cpp_ast(self, input_path, cpp_ast)
         _LOG.info('parsed "%s" in %fs', input_path, timer.elapsed)
 
+    @execute_on_language_examples('cpp14')
+    def test_parse_main_file_only_examples(self, input_path):
+        code = CodeReader().read_file(input_path)
+        full_cpp_ast = CppParser(main_file_only=False).parse(code, input_path)
+        cpp_ast = CppParser().parse(code, input_path)
+        self.assertLessEqual(len(cpp_ast), len(full_cpp_ast))
+        generalizer = CppAstGeneralizer(scope={'path': input_path})
+        self.assertEqual(typed_astunparse.dump(generalizer.generalize(cpp_ast)),
+                         typed_astunparse.dump(generalizer.generalize(full_cpp_ast)))
+
+    def test_parse_cached(self):
+        input_path = EXAMPLES_ROOTS['cpp14'].joinpath('addition.cpp')
+        code = CodeReader().read_file(input_path)
+        with tempfile.TemporaryDirectory() as cache_folder:
+            parser = CppParser(cache_path=pathlib.Path(cache_folder))
+            cpp_ast = parser.parse(code, input_path)
+            self.assertEqual(len(list(pathlib.Path(cache_folder).iterdir())), 1)
+            with unittest.mock.patch('transpyle.cpp.parser.run_castxml') as run_castxml:
+                cached_cpp_ast = parser.parse(code, input_path)
+            run_castxml.assert_not_called()
+        self.assertEqual(ET.tostring(cached_cpp_ast), ET.tostring(cpp_ast))
+
+    def test_find_function_names(self):
+        code = (
+            '#include <vector>\nnamespace ns {\nint f(int a) { return g(a); }\n'
+            'class A { void m(int); };\nstd::vector<int> v(int n);\n}\n'
+            'extern "C" { double c(double *); }\nint x = compute(3);\n')
+        self.assertListEqual(find_function_names(code), ['ns::f', 'ns::v', 'c'])
+
     def test_try_parse_invalid(self):
         input_path = EXAMPLES_ROOT.joinpath('invalid', 'invalid_cpp.cpp')
 
@@ -55,6 +89,24 @@ class ParserTests(unittest.TestCase):
 
 class AstGeneralizerTests(unittest.TestCase):
 
+    def test_type_resolver(self):
+        resolved_types = {
+            '_1': typed_ast3.parse('int', mode='eval').body,
+            '_2': make_pointer(typed_ast3.Str('_1', '')),
+            '_3': make_const(make_pointer(typed_ast3.Str('_2', ''))),
+            '_4': make_pointer(typed_ast3.Str('_4', '')),
+            '_5': make_pointer(typed_ast3.Str('_0', ''))}
+        resolver = CastXMLTypeResolver(resolved_types=resolved_types)
+        for id_ in ('_3', '_2', '_1'):
+            resolver.resolve(id_)
+        self.assertEqual(typed_astunparse.unparse(resolved_types['_3']).strip(),
+                         'Const[Pointer[Pointer[int]]]')
+        self.assertIs(resolved_types['_3'].slice.value.slice.value, resolved_types['_2'])
+        self.assertSetEqual(resolver.unresolved_types, set())
+        for id_ in ('_4', '_5'):
+            resolver.resolve(id_)
+        self.assertSetEqual(resolver.unresolved_types, {'_4', '_0'})
+
     @execute_on_language_examples('cpp14')
     def test_generalize_examples(self, input_path):
         code_reader = CodeReader()
@@ -70,6 +122,27 @@ class AstGeneralizerTests(unittest.TestCase):
         _LOG.debug('%s', typed_astunparse.dump(syntax))
         _LOG.debug('%s', typed_astunparse.unparse(syntax))
 
+    @unittest.skipUnless(os.environ.get('TEST_LONG'), 'skipping long test')
+    def test_generalize_examples_with_logging_disabled(self):
+        """Measure generalization cost when debug and info messages are not emitted."""
+        code_reader = CodeReader()
+        parser = CppParser()
+        cpp_asts = {input_path: parser.parse(code_reader.read_file(input_path), input_path)
+                    for input_path in EXAMPLES_FILES['cpp14']}
+        name = 'generalize_quietly'
+        logging.disable(logging.INFO)
+        try:
+            for input_path, cpp_ast in cpp_asts.items():
+                for _ in _TIME.measure_many('{}.{}'.format(
+                        name, input_path.name.replace('.', '_')), 10):
+                    CppAstGeneralizer(scope={'path': input_path}).generalize(cpp_ast)
+        finally:
+            logging.disable(logging.NOTSET)
+        timings_name = '.'.join([__name__, name])
+        summary = timing.query_cache(timings_name).summary
+        _LOG.info('%s', summary)
+        json_to_file(summary, PERFORMANCE_RESULTS_ROOT.joinpath(timings_name + '.json'))
+
 
 class UnparserTests(unittest.TestCase):
 
@@ -96,6 +169,11 @@ class UnparserTests(unittest.TestCase):
         basic_check_cpp_code(self, input_path, code, suffix='.hpp')
         _LOG.info('unparsed "%s" in %fs', input_path, timer.elapsed)
 
+        for unparser_ in (unparser, header_unparser):
+            with self.subTest(headers=unparser_.headers):
+                self.assertEqual(unparser_.unparse_in_parallel(syntax, workers=2),
+                                 unparser_.unparse(syntax))
+
 
 class CompilerTests(unittest.TestCase):
 
@@ -131,6 +209,14 @@ class CompilerTests(unittest.TestCase):
         except OSError:
             pass
 
+    def test_create_header_from_general_ast(self):
+        tree = typed_ast3.parse('def add(a: int, b: int) -> int:\n    return a + b\n')
+        compiler = CppSwigCompiler()
+        with unittest.mock.patch.object(CppParser, '_parse_scope') as parse_scope:
+            header_code = compiler.create_header_file(pathlib.Path('add.cpp'), tree)
+        parse_scope.assert_not_called()
+        self.assertEqual(header_code.strip(), 'int add(int a, int b);')
+
     def test_try_compile_invalid(self):
         input_path = EXAMPLES_ROOT.joinpath('invalid', 'invalid_cpp.cpp')
         output_dir = make_swig_tmp_folder(input_path)
@@ -0,0 +1,118 @@
+"""Tests of Cython language support."""
+
+import logging
+import os
+import pathlib
+import platform
+import types
+import unittest
+
+import numpy as np
+import typed_ast.ast3 as typed_ast3
+
+from transpyle.general.code_reader import CodeReader
+from transpyle.general.binder import Binder
+from transpyle.python.parser import TypedPythonParserWithComments
+from transpyle.cython.unparser import cython_type, FunctionAnalysis, CythonUnparser
+from transpyle.cython.compiler import CythonCompiler
+
+from . import examples_cython
+from .common import EXAMPLES_ROOTS, basic_check_code, make_cython_tmp_folder
+
+_LOG = logging.getLogger(__name__)
+
+_HERE = pathlib.Path(__file__).resolve().parent
+
+EXAMPLES_CYTHON_PATH = _HERE.joinpath('examples_cython.py')
+
+INDEXING_SAFETY = {
+    # function name: (boundscheck is safe, wraparound is safe)
+    'smooth': (False, True),
+    'trace': (False, True),
+    'transpose_add': (False, True),
+    'last_column_sum': (False, False),
+    'blur_rows': (True, True),
+    'weighted_sum': (False, False)}
+
+
+def parse_examples(path: pathlib.Path) -> typed_ast3.Module:
+    code = CodeReader().read_file(path)
+    return TypedPythonParserWithComments().parse(code, path)
+
+
+class UnparserTests(unittest.TestCase):
+
+    def test_cython_type(self):
+        for annotation, type_ in {
+                'int': 'long', 'np.int32': 'int', 'np.double': 'double', 'bool': 'bint',
+                'st.ndarray[1, np.double]': 'double[:]',
+                'st.ndarray[2, np.float32, (10, 10)]': 'float[:, :]',
+                'str': None, 'st.ndarray[2, str]': None}.items():
+            with self.subTest(annotation=annotation):
+                syntax = typed_ast3.parse(annotation, mode='eval').body
+                self.assertEqual(cython_type(syntax), type_)
+
+    def test_indexing_safety(self):
+        tree = parse_examples(EXAMPLES_CYTHON_PATH)
+        for function in tree.body:
+            if not isinstance(function, typed_ast3.FunctionDef):
+                continue
+            with self.subTest(function=function.name):
+                analysis = FunctionAnalysis(function)
+                self.assertEqual((analysis.boundscheck_safe, analysis.wraparound_safe),
+                                 INDEXING_SAFETY[function.name])
+
+    def test_unparse_examples(self):
+        tree = parse_examples(EXAMPLES_CYTHON_PATH)
+        code = CythonUnparser().unparse(tree)
+        basic_check_code(self, EXAMPLES_CYTHON_PATH, code, 'cython')
+        self.assertTrue(code.startswith('# cython: language_level=3\n'), msg=code)
+        self.assertIn('\ncimport cython\n', code)
+        self.assertIn('\ndef smooth(double[:] data):\n', code)
+        self.assertIn('\n    cdef double[:] result = np.zeros_like(data)\n', code)
+        self.assertIn('\n    return np.asarray(result)\n', code)
+        self.assertIn('\ncpdef double trace(double[:, :] matrix, long n):\n', code)
+        self.assertIn('\n    cdef Py_ssize_t i, j\n', code)
+        self.assertIn('@cython.boundscheck(False)\n@cython.wraparound(False)\ndef blur_rows(',
+                      code)
+        self.assertEqual(code.count('@cython.boundscheck(False)'), 1, msg=code)
+        self.assertEqual(code.count('@cython.wraparound(False)'), 4, msg=code)
+
+    def test_unparse_type_comments(self):
+        path = EXAMPLES_ROOTS['python3'].joinpath('compute_pi.py')
+        code = CythonUnparser().unparse(parse_examples(path))
+        self.assertIn('\ncpdef double compute_pi(long segments):\n', code)
+        self.assertIn('\n    cdef Py_ssize_t n\n', code)
+        self.assertIn('\n    cdef double polygon_edge_length_squared = 2.0\n', code)
+        self.assertIn('\n    cdef long polygon_sides = 2\n', code)
+        self.assertNotIn('cimport cython', code)
+
+
+class CompilerTests(unittest.TestCase):
+
+    @unittest.skipUnless(platform.system() == 'Linux', 'tested only on Linux')
+    @unittest.skipUnless(os.environ.get('TEST_LONG'), 'skipping long test')
+    def test_compile_and_bind_examples(self):
+        code = CythonUnparser().unparse(parse_examples(EXAMPLES_CYTHON_PATH))
+        output_dir = make_cython_tmp_folder(EXAMPLES_CYTHON_PATH)
+        output_path = CythonCompiler().compile(
+            code, output_dir.joinpath('cython_examples.pyx'), output_dir)
+        self.assertIsInstance(output_path, pathlib.Path)
+        binder = Binder()
+        with binder.temporarily_bind(output_path) as binding:
+            self.assertIsInstance(binding, types.ModuleType)
+            data = np.random.rand(20)
+            self.assertTrue(np.allclose(binding.smooth(data), examples_cython.smooth(data)))
+            matrix = np.random.rand(8, 8)
+            self.assertAlmostEqual(binding.trace(matrix, 8), examples_cython.trace(matrix, 8))
+            self.assertAlmostEqual(binding.last_column_sum(matrix),
+                                   examples_cython.last_column_sum(matrix))
+            image, expected = matrix.copy(), matrix.copy()
+            binding.blur_rows(image)
+            examples_cython.blur_rows(expected)
+            self.assertTrue(np.allclose(image, expected))
+            weights = list(data)
+            self.assertAlmostEqual(binding.weighted_sum(data, weights),
+                                   examples_cython.weighted_sum(data, weights))
+            with self.assertRaises(IndexError):
+                binding.transpose_add(np.zeros((2, 3)), np.zeros((2, 3)))
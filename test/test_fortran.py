@@ -1,25 +1,34 @@
 """Tests of Fortran language support."""
 
+import io
 import logging
 import operator
+import os
+import pathlib
 import shutil
+import tempfile
 import types
 import unittest
+import xml.etree.ElementTree as ET
 
 from encrypted_config.json_io import json_to_file
 import numpy as np
+import static_typing as st
 import timing
+import typed_ast.ast3 as typed_ast3
+import typed_astunparse
 
 from transpyle.general.code_reader import CodeReader
 from transpyle.general.binder import Binder
 from transpyle.fortran.parser import FortranParser
 from transpyle.fortran.ast_generalizer import FortranAstGeneralizer
-from transpyle.fortran.unparser import Fortran77Unparser
+from transpyle.fortran.unparser import \
+    FortranLineEmitter, FunctionAnalysis, Fortran77Unparser, Fortran2008Unparser
 from transpyle.fortran.compiler import F2PyCompiler
 from transpyle.fortran.compiler_interface import GfortranInterface, PgifortranInterface
 
 from .common import \
-    random_data, EXAMPLES_ROOT, EXAMPLES_ROOTS, PERFORMANCE_RESULTS_ROOT, \
+    random_data, EXAMPLES_ROOT, EXAMPLES_ROOTS, EXAMPLES_FILES, PERFORMANCE_RESULTS_ROOT, \
     basic_check_fortran_ast, basic_check_fortran_code, make_f2py_tmp_folder, \
     basic_check_python_ast, \
     execute_on_language_examples, execute_on_language_fundamentals, accelerated
@@ -50,6 +59,50 @@ class ParserTests(unittest.TestCase):
                 parser.parse('', input_path)
         _LOG.debug('%s', err.exception)
 
+    def test_parse_files(self):
+        input_paths = EXAMPLES_FILES['f77'] + EXAMPLES_FILES['f95']
+        invalid_path = EXAMPLES_ROOT.joinpath('invalid', 'fortran_parser_error.f90')
+        parser = FortranParser()
+        with self.assertLogs(level=logging.ERROR):
+            with _TIME.measure('parse_files') as timer:
+                results = parser.parse_files(input_paths + [invalid_path], workers=4)
+        self.assertListEqual(list(results), input_paths + [invalid_path])
+        for input_path in input_paths:
+            with self.subTest(input_path=input_path):
+                basic_check_fortran_ast(self, input_path, results[input_path])
+        self.assertIsInstance(results[invalid_path], RuntimeError)
+        _LOG.info('parsed %i files in %fs', len(results), timer.elapsed)
+
+    @execute_on_language_examples('f77', 'f95')
+    def test_parse_pruned_examples(self, input_path):
+        full_ast = FortranParser(prune=False).parse('', input_path)
+        fortran_ast = FortranParser().parse('', input_path)
+        basic_check_fortran_ast(self, input_path, fortran_ast)
+        self.assertFalse(any(FortranAstGeneralizer.is_ignorable(_) for _ in fortran_ast.iter()))
+        self.assertLess(len(ET.tostring(fortran_ast)), len(ET.tostring(full_ast)))
+        generalizer = FortranAstGeneralizer()
+        self.assertEqual(typed_astunparse.dump(generalizer.generalize(fortran_ast)),
+                         typed_astunparse.dump(generalizer.generalize(full_ast)))
+
+    @execute_on_language_examples('f77', 'f95')
+    def test_iterparse_units_examples(self, input_path):
+        parser = FortranParser()
+        fortran_ast = parser.parse('', input_path)
+        units = [ET.tostring(unit) for unit in parser.iterparse_units(input_path)]
+        self.assertListEqual(units, [ET.tostring(unit) for unit in fortran_ast[0]])
+
+    def test_iterparse_units_tails(self):
+        xml = ('<ofp>\n  <file path="a.f90">\n    <comment text="! a"/>\n'
+               '    <function name="f">\n      <body/>\n    </function>\n'
+               '    <program name="p"/>\n  </file>\n</ofp>\n')
+        parser = FortranParser()
+        fortran_ast = ET.fromstring(xml)
+        stream = io.BytesIO(xml.encode())
+        # output of the parser arrives in pieces, like from a pipe
+        stream.read = lambda size=-1: io.BytesIO.read(stream, 1)
+        units = [ET.tostring(unit) for unit in parser._iterparse_file_nodes(stream)]
+        self.assertListEqual(units, [ET.tostring(unit) for unit in fortran_ast[0]])
+
 
 class AstGeneralizerTests(unittest.TestCase):
 
@@ -64,6 +117,56 @@ class AstGeneralizerTests(unittest.TestCase):
         basic_check_python_ast(self, input_path, syntax)
         _LOG.info('generalized "%s" in %fs', input_path, timer.elapsed)
 
+    @execute_on_language_examples('f77', 'f95')
+    def test_generalize_units_examples(self, input_path):
+        parser = FortranParser()
+        generalizer = FortranAstGeneralizer()
+        syntax = generalizer.generalize(parser.parse('', input_path))
+        streamed_syntax = generalizer.generalize_units(parser.iterparse_units(input_path))
+        basic_check_python_ast(self, input_path, streamed_syntax)
+        self.assertEqual(typed_astunparse.dump(streamed_syntax), typed_astunparse.dump(syntax))
+
+    @execute_on_language_examples('f77', 'f95')
+    def test_generalize_lazy_typing_examples(self, input_path):
+        fortran_ast = FortranParser().parse('', input_path)
+        syntax = FortranAstGeneralizer().generalize(fortran_ast)
+        generalizer = FortranAstGeneralizer(lazy_typing=True)
+        untyped_syntax = generalizer.generalize(fortran_ast)
+        self.assertNotIsInstance(untyped_syntax, st.nodes.StaticallyTyped[typed_ast3])
+        for node in untyped_syntax.body:
+            if isinstance(node, typed_ast3.FunctionDef):
+                typed_node = generalizer.typed(node)
+                self.assertIsInstance(typed_node, st.nodes.StaticallyTypedFunctionDef[typed_ast3])
+                self.assertIs(generalizer.typed(node), typed_node)
+        typed_syntax = generalizer.typed(untyped_syntax)
+        self.assertIsInstance(typed_syntax, st.nodes.StaticallyTypedModule[typed_ast3])
+        self.assertEqual(typed_astunparse.dump(typed_syntax), typed_astunparse.dump(syntax))
+
+    @unittest.skipUnless(os.environ.get('TEST_LONG'), 'skipping long test')
+    def test_generalize_synthetic_scaling(self):
+        """Generalization time should grow linearly with the number of statements."""
+        parser = FortranParser()
+        generalizer = FortranAstGeneralizer()
+        elapsed = {}
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            for statements_count in (10000, 100000):
+                path = pathlib.Path(tmp_folder, 'synthetic_{}.f90'.format(statements_count))
+                lines = ['subroutine synthetic(a, b)', '  implicit none',
+                         '  integer, intent(inout) :: a', '  integer, intent(inout) :: b']
+                lines += ['  a = a + {}'.format(i) if i % 2 == 0 else '  b = b * a'
+                          for i in range(statements_count)]
+                lines.append('end subroutine synthetic')
+                code = '\n'.join(lines) + '\n'
+                path.write_text(code)
+                fortran_ast = parser.parse(code, path)
+                with _TIME.measure('generalize.synthetic_{}'.format(statements_count)) as timer:
+                    syntax = generalizer.generalize(fortran_ast)
+                assignments = [_ for _ in syntax.body[0].body if isinstance(_, typed_ast3.Assign)]
+                self.assertEqual(len(assignments), statements_count)
+                elapsed[statements_count] = timer.elapsed
+                _LOG.warning('generalized %i statements in %fs', statements_count, timer.elapsed)
+        self.assertLess(elapsed[100000], 20 * elapsed[10000], msg=elapsed)
+
 
 class UnparserTests(unittest.TestCase):
 
@@ -81,6 +184,46 @@ class UnparserTests(unittest.TestCase):
         basic_check_fortran_code(self, input_path, code)
         _LOG.info('unparsed "%s" in %fs', input_path, timer.elapsed)
 
+    def test_line_emitter(self):
+        for fixed_form, max_line_len, continuation, expected in [
+                (False, 20, '    ', "  x = aaaaaa + bb &\n     + cccccccccc\n"
+                 "  s = 'xxxxxxxxxxxx&\n    &xxxxxxxxxxxx'\n"),
+                (True, 20, '      +', "  x = aaaaaa + bb + \n      +cccccccccc\n"
+                 "  s = 'xxxxxxxxxxxxx\n      +xxxxxxxxxxx'\n")]:
+            with self.subTest(fixed_form=fixed_form):
+                stream = io.StringIO()
+                emitter = FortranLineEmitter(stream, fixed_form, max_line_len)
+                emitter.continuation = continuation
+                for text in ('  x = ', 'aaaaaa', ' + ', 'bb', ' + ', 'cccccccccc', '\n',
+                             '  s = ', "'{}'".format('x' * 24), '\n'):
+                    emitter.write(text)
+                emitter.flush()
+                self.assertEqual(stream.getvalue(), expected)
+                for line in stream.getvalue().splitlines():
+                    self.assertLessEqual(len(line), max_line_len)
+
+    def test_function_analysis(self):
+        function = typed_ast3.parse(
+            'def f(a: int, b) -> int:\n    """Doc."""\n    for i in range(a):\n'
+            '        for j in range(i):\n            if j:\n                return c\n'
+            '    return c\n').body[0]
+        analysis = FunctionAnalysis(function)
+        self.assertEqual(analysis.kind, 'function')
+        self.assertTrue(analysis.from_python)
+        self.assertListEqual([_.arg for _ in analysis.annotated_args], ['a'])
+        self.assertEqual(analysis.docstring, 'Doc.')
+        self.assertListEqual([_.target.id for _ in analysis.loops], ['i', 'j'])
+        self.assertEqual(len(analysis.return_values), 2)
+        self.assertEqual(analysis.returned_name(), 'c')
+
+    @execute_on_language_examples('f77', 'f95')
+    def test_unparse_in_parallel_examples(self, input_path):
+        syntax = FortranAstGeneralizer().generalize(FortranParser().parse('', input_path))
+        for unparser in (Fortran77Unparser(), Fortran2008Unparser()):
+            with self.subTest(unparser=type(unparser).__name__):
+                self.assertEqual(unparser.unparse_in_parallel(syntax, workers=2),
+                                 unparser.unparse(syntax))
+
 
 class CompilerTests(unittest.TestCase):
 
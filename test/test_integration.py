@@ -169,6 +169,16 @@ class FortranAndPythonTests(unittest.TestCase):
         python_code = unparser.unparse(syntax)
         basic_check_python_code(self, input_path, python_code)
 
+    @execute_on_examples([EXAMPLES_ROOTS['f95'].joinpath(_ + '.f90')
+                          for _ in {'copy_array', 'itemwise_calc'}])
+    def test_translate_fortran_to_numba(self, input_path):
+        reader = CodeReader()
+        code = reader.read_file(input_path)
+        translator = AutoTranslator(Language.find('Fortran 95'), Language.find('Python+Numba'))
+        python_code = translator.translate(code, input_path)
+        basic_check_python_code(self, input_path, python_code, suffix='.numba.py')
+        self.assertIn("@numba.njit('void(float64[:], float64[:])')", python_code)
+
     @execute_on_language_fundamentals('python3')
     def test_translate_python_to_fortran(self, input_path):
         reader = CodeReader()
@@ -1,25 +1,98 @@
 
 
 import contextlib
+import copy
+import inspect
 import logging
 import os
+import pathlib
+import pickle
+import tempfile
 import types
 import unittest
 
 import horast
+import numpy as np
+import typed_ast.ast3 as typed_ast3
 
-from transpyle.general import CodeReader, Language, Parser
-from transpyle.pair.inlining import inline_syntax, inline
+from transpyle.general import \
+    CodeReader, Language, Parser, AstGeneralizer, Unparser, AutoTranslator
+from transpyle.pair.ast_query import SyntaxFinder, SyntaxIndex
+from transpyle.pair.assertions import syntax_matches
+from transpyle.pair.ast_annotations import \
+    AnnotationStore, annotate_ast, deepcopy_ast, get_annotation, has_annotation, \
+    preserving_annotations
+from transpyle.pair.call_graph import CallGraph, definitions_and_uses
+from transpyle.pair.constant_folding import constant_value, make_constant, fold_constants
+from transpyle.pair.dead_code import eliminate_dead_code
+from transpyle.pair.inlining import inline_syntax, inline, InliningCostModel, inline_hot_calls
+from transpyle.pair.loop_analysis import find_loops, loop_iterations_independent
+from transpyle.pair.pass_manager import ANALYSES, AnalysisCache, Pass, PassManager
+from transpyle.pair.simplification import StrengthReducer, simplify
+from transpyle.pair.structural_hash import \
+    structural_hash, clear_structural_hashes, find_identical_subtrees
+from transpyle.pair.vectorization import vectorize_loops
 
 from .examples_inlining import \
     buy_products, buy, buy_products_inlined, \
     just_return, return_me, just_return_inlined, \
     just_assign, just_assign_inlined, \
     print_and_get_absolute, absolute_value, print_and_get_absolute_inlined, \
-    inline_oneliner, add_squares, inline_oneliner_inlined
+    inline_oneliner, add_squares, inline_oneliner_inlined, \
+    norm_squared, sum_of_norms, sum_of_norms_inlined, \
+    scaled_norm_squared, sum_of_scaled_norms, sum_of_scaled_norms_inlined, \
+    clamp, clamp_all, clamp_all_inlined, first_norm, half_of_norm, sum_of_half_norms, \
+    reset_first, sum_of_reset_firsts
+from .examples_constant_folding import \
+    smooth, smooth_folded, single_precision, single_precision_folded, \
+    portable_arithmetic, portable_arithmetic_folded, not_constant, not_constant_folded
+from .examples_dead_code import \
+    accumulate, accumulate_eliminated, count_until, count_until_eliminated, fill, fill_eliminated
+from .examples_simplification import \
+    accumulate_products, accumulate_products_simplified, \
+    reduce_strength, reduce_strength_simplified, not_invariant, not_invariant_simplified, \
+    shift_by, shift_by_simplified
+from .examples_vectorization import \
+    scale, scale_vectorized, stencil, stencil_vectorized, shift, shift_vectorized, \
+    dot_and_max, dot_and_max_vectorized, add_rows, add_rows_vectorized, \
+    shift_rows, shift_rows_vectorized, increment, increment_vectorized, \
+    prefix_sum, sum_and_product, last_index, user_function, shift_from
+
+from .common import EXAMPLES_ROOTS
 
 _LOG = logging.getLogger(__name__)
 
+FORTRAN_DEAD_CODE = '''
+subroutine compute(x, n, result, status)
+
+  integer, intent(in) :: n
+  real, intent(in) :: x(n)
+  real, intent(out) :: result
+  integer, intent(out) :: status
+  integer :: i, unused, temp, shared
+  real :: total, scratch
+  integer, parameter :: dims = 3
+  common /block/ shared
+
+  temp = n * 2
+  scratch = 0.0
+  total = 0.0
+  do i = 1, n
+    scratch = x(i) * 2.0
+    total = total + x(i)
+  end do
+  shared = 1
+  result = total
+  status = 0
+  if (n .lt. 0) then
+    status = 1
+    stop
+    result = 0.0
+  end if
+
+end subroutine compute
+'''
+
 INLINING_EXAMPLES = {
     (buy_products, buy): buy_products_inlined,
     (just_return, return_me): just_return_inlined,
@@ -27,6 +100,46 @@ INLINING_EXAMPLES = {
     (print_and_get_absolute, absolute_value): print_and_get_absolute_inlined,
     (inline_oneliner, add_squares): inline_oneliner_inlined}
 
+HOT_CALLS_EXAMPLES = [
+    norm_squared, sum_of_norms, scaled_norm_squared, sum_of_scaled_norms, clamp, clamp_all,
+    first_norm, half_of_norm, sum_of_half_norms, reset_first, sum_of_reset_firsts]
+
+HOT_CALLS_INLINED = {
+    sum_of_norms: sum_of_norms_inlined,
+    sum_of_scaled_norms: sum_of_scaled_norms_inlined,
+    clamp_all: clamp_all_inlined}
+
+HOT_CALLS_NOT_INLINED = (first_norm, sum_of_half_norms, sum_of_reset_firsts)
+
+VECTORIZATION_EXAMPLES = {
+    scale: scale_vectorized,
+    stencil: stencil_vectorized,
+    shift: shift_vectorized,
+    dot_and_max: dot_and_max_vectorized,
+    add_rows: add_rows_vectorized,
+    shift_rows: shift_rows_vectorized,
+    increment: increment_vectorized}
+
+NOT_VECTORIZABLE_EXAMPLES = (
+    prefix_sum, sum_and_product, last_index, user_function, shift_from)
+
+DEAD_CODE_EXAMPLES = {
+    accumulate: accumulate_eliminated,
+    count_until: count_until_eliminated,
+    fill: fill_eliminated}
+
+SIMPLIFICATION_EXAMPLES = {
+    accumulate_products: accumulate_products_simplified,
+    reduce_strength: reduce_strength_simplified,
+    not_invariant: not_invariant_simplified,
+    shift_by: shift_by_simplified}
+
+CONSTANT_FOLDING_EXAMPLES = {
+    smooth: smooth_folded,
+    single_precision: single_precision_folded,
+    portable_arithmetic: portable_arithmetic_folded,
+    not_constant: not_constant_folded}
+
 
 class TransformationsTests(unittest.TestCase):
 
@@ -65,3 +178,615 @@ class TransformationsTests(unittest.TestCase):
             with self.subTest(target=target, inlined=inlined):
                 target_inlined_ = inline(target, inlined)
                 self.assertIsInstance(target_inlined_, types.FunctionType)
+
+    def test_inline_in_memory(self):
+        for (target, inlined), target_inlined in INLINING_EXAMPLES.items():
+            with self.subTest(target=target, inlined=inlined):
+                target_inlined_ = inline(target, inlined)
+                self.assertIs(inline(target, inlined).__code__, target_inlined_.__code__)
+                self.assertFalse(pathlib.Path(inspect.getsourcefile(target_inlined_)).exists())
+                globals_ = {'__builtins__': __builtins__}
+                with_globals = inline(target, inlined, globals_)
+                self.assertIsNot(with_globals.__code__, target_inlined_.__code__)
+                self.assertIs(inline(target, inlined, globals_).__code__, with_globals.__code__)
+                reference_code = CodeReader.read_function(target_inlined)
+                self.assertEqual(reference_code.replace('_inlined(', '('),
+                                 CodeReader.read_function(target_inlined_))
+
+    def test_inline_debug(self):
+        target_inlined_ = inline(just_return, return_me, debug=True)
+        path = pathlib.Path(inspect.getsourcefile(target_inlined_))
+        self.assertTrue(path.is_file())
+        self.assertEqual(just_return_inlined(1), target_inlined_(1))
+        path.unlink()
+
+
+class HotCallsInliningTests(unittest.TestCase):
+
+    def setUp(self):
+        self.code = '\n\n'.join(CodeReader.read_function(_) for _ in HOT_CALLS_EXAMPLES)
+        self.parser = Parser.find(Language.find('Python 3'))()
+
+    def test_examples(self):
+        xs, ys = [1, -2, 3], [4, 5, -6]
+        for function, inlined in HOT_CALLS_INLINED.items():
+            with self.subTest(function=function):
+                if function is clamp_all:
+                    values, values_inlined = list(xs), list(xs)
+                    function(values, 3)
+                    inlined(values_inlined, 3)
+                    self.assertListEqual(values, values_inlined)
+                    continue
+                self.assertEqual(function(xs, ys, 3), inlined(xs, ys, 3))
+
+    def test_call_graph(self):
+        graph = CallGraph(self.parser.parse(self.code), loop_trip_count=20)
+        self.assertSetEqual(set(graph.functions), {_.__name__ for _ in HOT_CALLS_EXAMPLES})
+        self.assertTrue(graph.is_leaf('norm_squared'))
+        self.assertFalse(graph.is_leaf('scaled_norm_squared'))
+        self.assertSetEqual(graph.callees('sum_of_scaled_norms'), {'scaled_norm_squared'})
+        self.assertEqual(graph.frequency('sum_of_norms'), 1)
+        self.assertEqual(graph.frequency('scaled_norm_squared'), 20)
+        self.assertEqual(graph.frequency('norm_squared'), 20 + 20 + 1 + 20)
+        order = graph.bottom_up_order()
+        self.assertLess(order.index('norm_squared'), order.index('scaled_norm_squared'))
+        self.assertLess(order.index('scaled_norm_squared'), order.index('sum_of_scaled_norms'))
+
+    def test_inline_hot_calls(self):
+        syntax = inline_hot_calls(self.parser.parse(self.code))
+        functions = {_.name: _ for _ in syntax.body}
+        for function, inlined in HOT_CALLS_INLINED.items():
+            reference_code = CodeReader.read_function(inlined).replace('_inlined(', '(')
+            with self.subTest(function=function):
+                self.assertEqual(horast.unparse(self.parser.parse(reference_code)).lstrip(),
+                                 horast.unparse(functions[function.__name__]).lstrip())
+        for function in HOT_CALLS_NOT_INLINED:
+            reference_code = CodeReader.read_function(function)
+            with self.subTest(function=function):
+                self.assertEqual(horast.unparse(self.parser.parse(reference_code)).lstrip(),
+                                 horast.unparse(functions[function.__name__]).lstrip())
+
+    def test_cost_model(self):
+        syntax = inline_hot_calls(self.parser.parse(self.code),
+                                  InliningCostModel(max_body_size=10))
+        functions = {_.name: _ for _ in syntax.body}
+        self.assertNotIn('norm_squared(', horast.unparse(functions['sum_of_norms']))
+        self.assertIn('clamp(', horast.unparse(functions['clamp_all']))
+        syntax = inline_hot_calls(self.parser.parse(self.code),
+                                  InliningCostModel(min_call_frequency=100))
+        functions = {_.name: _ for _ in syntax.body}
+        self.assertIn('norm_squared(', horast.unparse(functions['sum_of_norms']))
+
+    def test_translate(self):
+        language = Language.find('Python 3')
+        translator = AutoTranslator(language, language, transformations=[inline_hot_calls])
+        code = translator.translate(self.code)
+        self.assertNotIn('norm_squared(xs[i], ys[i])', code)
+        self.assertIn('total += half_of_norm(xs[i], ys[i])', code)
+
+
+class LoopAnalysisTests(unittest.TestCase):
+
+    def test_independent(self):
+        for code in [
+                'for i in range(n):\n    b[i] = a[i] * 2\n',
+                'for i in range(n):\n    s += a[i]\n',
+                'for i in range(n):\n    s += a[i]\n    s -= b[i]\n']:
+            with self.subTest(code=code):
+                loop = typed_ast3.parse(code).body[0]
+                self.assertTrue(loop_iterations_independent(loop))
+
+    def test_mixed_reductions(self):
+        for code in [
+                'for i in range(n):\n    s += a[i]\n    s *= 2.0\n',
+                'for i in range(n):\n    s = s * a[i]\n    s = s - b[i]\n']:
+            with self.subTest(code=code):
+                loop = typed_ast3.parse(code).body[0]
+                self.assertFalse(loop_iterations_independent(loop))
+
+    def test_control_flow(self):
+        for code in [
+                'for i in range(n):\n    if a[i] > 0:\n        break\n    b[i] = a[i]\n',
+                'for i in range(n):\n    if a[i] > 0:\n        continue\n    b[i] = a[i]\n',
+                'for i in range(n):\n    b[i] = a[i]\n    if a[i] > 0:\n        return i\n',
+                'for i in range(n):\n    if a[i] < 0:\n        raise ValueError()\n',
+                'for i in range(n):\n    yield a[i]\n',
+                'for i in range(n):\n    for j in range(m):\n        break\n']:
+            with self.subTest(code=code):
+                loop = typed_ast3.parse('def f():\n' + ''.join(
+                    '    {}\n'.format(_) for _ in code.splitlines())).body[0].body[0]
+                self.assertFalse(loop_iterations_independent(loop))
+
+
+class VectorizationTests(unittest.TestCase):
+
+    def test_examples(self):
+        for function, vectorized in VECTORIZATION_EXAMPLES.items():
+            with self.subTest(function=function):
+                for size in (0, 1, 2, 5, 100):
+                    if function in (add_rows, shift_rows):
+                        x = np.random.rand(size, size + 1)
+                        x_copy = x.copy()
+                        y = np.random.rand(size, size + 1)
+                        function(x, y, size, size + 1)
+                        vectorized(x_copy, y, size, size + 1)
+                        self.assertTrue(np.allclose(x, x_copy))
+                        continue
+                    args = [np.random.rand(size) for _ in range(function.__code__.co_argcount - 1)]
+                    if function is scale:
+                        args[1] = 0.5
+                    self.assertTrue(np.allclose(function(*args, size), vectorized(*args, size)))
+
+    def test_negative_bound(self):
+        a, b = np.random.rand(5), np.random.rand(5)
+        self.assertTrue(np.array_equal(increment(a.copy(), b, -3),
+                                       increment_vectorized(a.copy(), b, -3)))
+        self.assertTrue(np.array_equal(dot_and_max(a, b, -3), dot_and_max_vectorized(a, b, -3)))
+        x, y = np.random.rand(5, 5), np.random.rand(5, 5)
+        x_copy = x.copy()
+        add_rows(x, y, -3, 5)
+        add_rows_vectorized(x_copy, y, -3, 5)
+        self.assertTrue(np.array_equal(x, x_copy))
+        shift_rows(x, y, 2, -2)
+        shift_rows_vectorized(x_copy, y, 2, -2)
+        self.assertTrue(np.array_equal(x, x_copy))
+
+    def test_vectorize_loops(self):
+        language = Language.find('Python 3')
+        parser = Parser.find(language)()
+        for function, vectorized in VECTORIZATION_EXAMPLES.items():
+            code = CodeReader.read_function(function)
+            reference_code = CodeReader.read_function(vectorized).replace('_vectorized(', '(')
+            with self.subTest(function=function):
+                syntax = vectorize_loops(parser.parse(code).body[0])
+                self.assertEqual(horast.unparse(parser.parse(reference_code)).lstrip(),
+                                 horast.unparse(syntax).lstrip())
+
+    def test_not_vectorizable(self):
+        language = Language.find('Python 3')
+        parser = Parser.find(language)()
+        for function in NOT_VECTORIZABLE_EXAMPLES:
+            code = CodeReader.read_function(function)
+            with self.subTest(function=function):
+                syntax = parser.parse(code).body[0]
+                reference_code = horast.unparse(syntax)
+                self.assertEqual(reference_code, horast.unparse(vectorize_loops(syntax)))
+
+
+class ConstantFoldingTests(unittest.TestCase):
+
+    def test_examples(self):
+        data = np.random.rand(20)
+        self.assertTrue(np.allclose(smooth(data, 20), smooth_folded(data, 20)))
+        data = np.random.rand(20).astype(np.float32)
+        self.assertTrue(np.array_equal(single_precision(data.copy(), 20),
+                                       single_precision_folded(data.copy(), 20)))
+        self.assertEqual(portable_arithmetic(9), portable_arithmetic_folded(9))
+        for flag in (False, True):
+            self.assertEqual(not_constant([], flag), not_constant_folded([], flag))
+
+    def test_constants(self):
+        for value in (0, 42, -3, 1.5, -0.25, True, False, np.float32(-2.5), np.int16(7),
+                      np.bool_(True)):
+            with self.subTest(value=value):
+                value_ = constant_value(make_constant(value))
+                self.assertEqual(value_, value)
+                self.assertIs(type(value_), type(value))
+
+    def test_fold_constants(self):
+        language = Language.find('Python 3')
+        parser = Parser.find(language)()
+        for function, folded in CONSTANT_FOLDING_EXAMPLES.items():
+            code = CodeReader.read_function(function)
+            reference_code = CodeReader.read_function(folded).replace('_folded(', '(')
+            with self.subTest(function=function):
+                syntax = fold_constants(parser.parse(code))
+                self.assertEqual(horast.unparse(parser.parse(reference_code)).lstrip(),
+                                 horast.unparse(syntax).lstrip())
+
+    def test_fold_fortran_parameters(self):
+        language = Language.find('Fortran 77')
+        path = EXAMPLES_ROOTS['f77'].joinpath('matmul.f')
+        syntax = Parser.find(language)().parse(CodeReader().read_file(path), path)
+        syntax = fold_constants(AstGeneralizer.find(language)().generalize(syntax))
+        code = horast.unparse(syntax)
+        self.assertIn('\n    max_input = 1048576\n', code)
+        self.assertIn('\n    max_output = 1048576\n', code)
+        self.assertIn('((max_width * max_height),)', code)
+        self.assertIn('\n    data(a, max_input)\n', code)
+
+    def test_translate(self):
+        language = Language.find('Python 3')
+        translator = AutoTranslator(language, language, transformations=[fold_constants])
+        code = translator.translate(CodeReader.read_function(smooth))
+        self.assertIn('for i in range(2, (n - 2)):', code)
+        self.assertIn('result[i] += (data[(i + j)] * 0.2)', code)
+
+
+class DeadCodeEliminationTests(unittest.TestCase):
+
+    def test_examples(self):
+        data = np.random.rand(20)
+        self.assertEqual(accumulate(data, 20), accumulate_eliminated(data, 20))
+        for limit in (0, 3, 10):
+            flags, flags_eliminated = [], []
+            self.assertEqual(count_until(limit, flags),
+                             count_until_eliminated(limit, flags_eliminated))
+            self.assertListEqual(flags, flags_eliminated)
+        self.assertListEqual(fill([], 3), fill_eliminated([], 3))
+
+    def test_eliminate_dead_code(self):
+        language = Language.find('Python 3')
+        parser = Parser.find(language)()
+        for function, eliminated in DEAD_CODE_EXAMPLES.items():
+            # module variable is needed in the context of the function
+            code = 'counter = 0\n\n\n{}'.format(CodeReader.read_function(function))
+            reference_code = CodeReader.read_function(eliminated).replace('_eliminated(', '(')
+            with self.subTest(function=function):
+                syntax = eliminate_dead_code(parser.parse(code))
+                self.assertEqual(horast.unparse(parser.parse(reference_code)).lstrip(),
+                                 horast.unparse(syntax.body[-1]).lstrip())
+
+    def test_eliminate_fortran_dead_code(self):
+        language = Language.find('Fortran 2008')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = pathlib.Path(tmpdir, 'dead_code.f90')
+            path.write_text(FORTRAN_DEAD_CODE)
+            syntax = Parser.find(language)().parse(FORTRAN_DEAD_CODE, path)
+        syntax = eliminate_dead_code(AstGeneralizer.find(language)().generalize(syntax))
+        code = horast.unparse(syntax)
+        for removed in ('unused', 'temp', 'scratch', 'dims', 'result = 0.0'):
+            self.assertNotIn(removed, code)
+        for kept in ('\n    result: float\n', '\n    status: int\n', '\n    shared = 1\n',
+                     '\n    total = 0.0\n', '\n        exit()\n'):
+            self.assertIn(kept, code)
+
+    def test_translate(self):
+        language = Language.find('Python 3')
+        translator = AutoTranslator(language, language, transformations=[
+            fold_constants, eliminate_dead_code])
+        code = translator.translate(CodeReader.read_function(smooth))
+        self.assertIn('for j in range((- 2), 3):', code)
+        self.assertNotIn('width', code)
+        self.assertNotIn('weight', code)
+
+
+class SimplificationTests(unittest.TestCase):
+
+    def test_examples(self):
+        width, height = 3, 4
+        a, b = np.random.rand(height * width), np.random.rand(width * height)
+        c, c_simplified = np.random.rand(height * height), np.zeros((height * height,))
+        c_simplified[:] = c
+        self.assertTrue(np.allclose(
+            accumulate_products(c, a, b, width, height, 0.5),
+            accumulate_products_simplified(c_simplified, a, b, width, height, 0.5)))
+        data = np.random.rand(20)
+        self.assertAlmostEqual(reduce_strength(data, 20, 7),
+                               reduce_strength_simplified(data, 20, 7))
+        values, values_simplified = [], []
+        self.assertEqual(not_invariant(data, 20, values),
+                         not_invariant_simplified(data, 20, values_simplified))
+        self.assertListEqual(values, values_simplified)
+        shifted = np.zeros((4,), dtype=np.int64)
+        self.assertTrue(np.array_equal(shift_by(shifted, 0, 1, -1),
+                                       shift_by_simplified(shifted, 0, 1, -1)))
+
+    def test_simplify(self):
+        language = Language.find('Python 3')
+        parser = Parser.find(language)()
+        for function, simplified in SIMPLIFICATION_EXAMPLES.items():
+            code = CodeReader.read_function(function)
+            reference_code = CodeReader.read_function(simplified).replace('_simplified(', '(')
+            with self.subTest(function=function):
+                syntax = simplify(parser.parse(code))
+                self.assertEqual(horast.unparse(parser.parse(reference_code)).lstrip(),
+                                 horast.unparse(syntax).lstrip())
+
+    def test_simplify_fortran(self):
+        language = Language.find('Fortran 77')
+        path = EXAMPLES_ROOTS['f77'].joinpath('matmul.f')
+        syntax = Parser.find(language)().parse(CodeReader().read_file(path), path)
+        syntax = simplify(AstGeneralizer.find(language)().generalize(syntax))
+        code = Unparser.find(language)().unparse(syntax)
+        self.assertIn('\n         integer :: cse_0\n', code)
+        self.assertIn('\n             cse_0 = ((y - 1) * height)\n', code)
+        self.assertIn('\n                 cse_3 = (cse_0 + x)\n', code)
+        self.assertLess(code.index('integer :: cse_3'), code.index('data(a, max_input)'))
+
+    def test_unparse_bit_operations(self):
+        parser = Parser.find(Language.find('Python 3'))()
+        syntax = parser.parse('def f(k: int) -> int:\n    return (k >> 2) + (k & 7)\n')
+        code = Unparser.find(Language.find('Fortran 95'))().unparse(syntax)
+        self.assertIn('f = (ishft(k, -2) + iand(k, 7))', code)
+        code = Unparser.find(Language.find('C++14'))().unparse(syntax)
+        self.assertIn('return ((k >> 2) + (k & 7));', code)
+
+    def test_translate(self):
+        language = Language.find('Python 3')
+        translator = AutoTranslator(language, language, transformations=[simplify])
+        code = translator.translate(CodeReader.read_function(accumulate_products))
+        self.assertNotIn('**', code)
+        self.assertIn('cse_3 = (scale * scale)', code)
+
+
+PASS_MANAGER_EXAMPLE = '''
+def scale(data: st.ndarray[1, np.double], n: int, factor: float) -> None:
+    for i in range(n):
+        data[i] = data[i] * factor / 2.0
+
+def total(data: st.ndarray[1, np.double], n: int) -> float:
+    result = 0.0
+    for i in range(n):
+        result = 0.5 * result + data[i]
+    return result
+'''
+
+
+class PassManagerTests(unittest.TestCase):
+
+    def test_resolve(self):
+        first = Pass('first', lambda syntax: syntax)
+        second = Pass('second', lambda syntax: syntax, requires=['first'])
+        third = Pass('third', lambda syntax: syntax, requires=['second', 'first'])
+        registry = {_.name: _ for _ in (first, second, third)}
+        manager = PassManager(['third', 'second'], registry)
+        self.assertListEqual([_.name for _ in manager.passes], ['first', 'second', 'third'])
+        first.requires.append('third')
+        with self.assertRaises(ValueError):
+            PassManager(['second'], registry)
+        with self.assertRaises(KeyError):
+            PassManager(['fourth'], registry)
+        manager = PassManager([vectorize_loops, 'fold-constants'])
+        self.assertListEqual([_.name for _ in manager.passes],
+                             ['vectorize_loops', 'fold-constants'])
+
+    def test_analysis_cache(self):
+        syntax = Parser.find(Language.find('Python 3'))().parse(PASS_MANAGER_EXAMPLE)
+        scale, total = syntax.body
+        cache = AnalysisCache(dict(ANALYSES, loops=find_loops))
+        types = cache.get('types', scale)
+        self.assertEqual(types.scalars['factor'], 'float')
+        self.assertIs(cache.get('types', scale), types)
+        loops = cache.get('loops', total)
+        self.assertEqual(len(loops), 1)
+        self.assertFalse(loops[0].independent)
+        self.assertTrue(cache.get('loops', scale)[0].independent)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+        self.assertEqual(cache.invalidate(syntax), 0)
+        scale.body.append(typed_ast3.Return(value=None))
+        self.assertEqual(cache.invalidate(syntax), 1)
+        self.assertIsNot(cache.get('types', scale), types)
+        self.assertIs(cache.get('loops', total), loops)
+        with self.assertRaises(KeyError):
+            cache.get('aliases', scale)
+
+    def test_definitions_and_uses(self):
+        syntax = Parser.find(Language.find('Python 3'))().parse(PASS_MANAGER_EXAMPLE)
+        chains = definitions_and_uses(syntax.body[1])
+        definitions, uses = chains['result']
+        self.assertEqual(len(definitions), 2)
+        self.assertTrue(all(isinstance(_, typed_ast3.Assign) for _ in definitions))
+        self.assertEqual(len(uses), 2)
+        self.assertTrue(all(isinstance(_, typed_ast3.For) for _ in chains['i'][0]))
+        self.assertEqual(len(chains['i'][1]), 1)
+
+    def test_run(self):
+        syntax = Parser.find(Language.find('Python 3'))().parse(PASS_MANAGER_EXAMPLE)
+        requested = []
+
+        def count_loops(syntax, analyses):
+            for function in syntax.body:
+                requested.append(len(analyses.get('loops', function)))
+            return syntax
+
+        manager = PassManager([
+            Pass('count-loops', count_loops, analyses=['loops']), 'reduce-strength',
+            Pass('count-loops-again', count_loops, analyses=['loops'])],
+            analyses=dict(ANALYSES, loops=find_loops))
+        syntax = manager.run(syntax)
+        self.assertIn('(data[i] * factor) * 0.5', horast.unparse(syntax))
+        self.assertListEqual(requested, [1, 1, 1, 1])
+        # only analyses of the function modified by strength reduction are recomputed
+        self.assertEqual(manager.analysis_cache.hits, 1)
+        self.assertListEqual([name for name, _ in manager.timings],
+                             ['count-loops', 'reduce-strength', 'count-loops-again'])
+        report = manager.report()
+        self.assertIn('reduce-strength', report)
+        self.assertIn('total', report)
+
+    def test_run_registered(self):
+        syntax = Parser.find(Language.find('Python 3'))().parse(PASS_MANAGER_EXAMPLE)
+        manager = PassManager(['reduce-strength', 'vectorize-loops'])
+        self.assertListEqual([_.name for _ in manager.passes],
+                             ['reduce-strength', 'fold-constants', 'vectorize-loops'])
+        syntax = manager.run(syntax)
+        self.assertIn('data[:max(n, 0)] = (data[:max(n, 0)] * factor) * 0.5',
+                      horast.unparse(syntax))
+        self.assertListEqual([name for name, _ in manager.timings],
+                             ['reduce-strength', 'fold-constants', 'vectorize-loops'])
+        # non-negative names of the function untouched by strength reduction are reused
+        self.assertEqual(manager.analysis_cache.hits, 1)
+
+
+class SyntaxIndexTests(unittest.TestCase):
+
+    def test_find(self):
+        syntax = Parser.find(Language.find('Python 3'))().parse(PASS_MANAGER_EXAMPLE)
+        index = SyntaxIndex(syntax)
+        for node_types, names in [((typed_ast3.For,), None), (None, {'data', 'result'}),
+                                  ((typed_ast3.stmt,), None), ((typed_ast3.Name,), {'i'}),
+                                  ((typed_ast3.FunctionDef, typed_ast3.Return), None)]:
+            with self.subTest(node_types=node_types, names=names):
+                finder = SyntaxFinder(node_types, names)
+                finder.visit(syntax)
+                self.assertCountEqual(index.find(node_types, names), finder.found)
+                indexed_finder = SyntaxFinder(node_types, names)
+                indexed_finder.visit_index(index)
+                self.assertCountEqual(indexed_finder.found, finder.found)
+        scale, total = syntax.body
+        self.assertListEqual(index.find((typed_ast3.FunctionDef, typed_ast3.For)),
+                             [scale, scale.body[0], total, total.body[1]])
+        self.assertEqual(len(index.find((typed_ast3.For,), within=total)), 1)
+        self.assertEqual(len(index.find(names={'np.double'})), 2)
+        loop = total.body[1]
+        self.assertIs(index.parent(loop), total)
+        self.assertEqual(index.location(loop), (total, 'body', 1))
+        self.assertListEqual(list(index.ancestors(loop.body[0])), [loop, total, syntax])
+
+    def test_update(self):
+        parser = Parser.find(Language.find('Python 3'))()
+        syntax = parser.parse(PASS_MANAGER_EXAMPLE)
+        index = SyntaxIndex(syntax)
+        size = len(index)
+        scale, total = syntax.body
+        loop = scale.body[0]
+        index.replace(loop, parser.parse('data[:n] = data[:n] * factor / 2.0').body[0])
+        self.assertNotIn(loop, index)
+        self.assertEqual(len(index.find((typed_ast3.For,))), 1)
+        self.assertEqual(len(index.find((typed_ast3.Slice,), within=scale)), 2)
+        self.assertIs(index.parent(scale.body[0]), scale)
+        total.body.insert(0, parser.parse('del data').body[0])
+        index.update(total)
+        self.assertEqual(len(index.find((typed_ast3.Delete,))), 1)
+        self.assertEqual(len(SyntaxIndex(syntax)), len(index))
+        self.assertLess(len(index), size)
+        index.transform(StrengthReducer(), scale)
+        self.assertListEqual([_.n for _ in index.find((typed_ast3.Num,), within=scale.body[0])],
+                             [0.5])
+        attribute = scale.args.args[0].annotation.slice.value.elts[1]
+        index.replace(attribute.value, typed_ast3.Name(id='numpy', ctx=typed_ast3.Load()))
+        self.assertListEqual(index.find(names={'numpy.double'}), [attribute])
+        self.assertEqual(len(index.find(names={'np.double'})), 1)
+        self.assertEqual(len(SyntaxIndex(syntax)), len(index))
+
+
+class StructuralHashTests(unittest.TestCase):
+
+    def test_consistent_with_dump(self):
+        parser = Parser.find(Language.find('Python 3'))()
+        nodes = [_ for function in SIMPLIFICATION_EXAMPLES for _ in typed_ast3.walk(
+            parser.parse(CodeReader.read_function(function)))]
+        nodes += [_ for _ in typed_ast3.walk(parser.parse('x = (1, 1.0, True, "1", None)'))]
+        hashes = {}
+        for node in nodes:
+            hashes.setdefault(structural_hash(node), set()).add(typed_ast3.dump(node))
+        self.assertTrue(all(len(dumps) == 1 for dumps in hashes.values()))
+        self.assertEqual(len(hashes), len({typed_ast3.dump(_) for _ in nodes}))
+
+    def test_cache(self):
+        parser = Parser.find(Language.find('Python 3'))()
+        syntax = parser.parse(PASS_MANAGER_EXAMPLE)
+        scale, total = syntax.body
+        digest = structural_hash(syntax)
+        scale_digest = structural_hash(scale)
+        self.assertEqual(structural_hash(copy.deepcopy(syntax)), digest)
+        other = parser.parse(PASS_MANAGER_EXAMPLE)
+        self.assertTrue(syntax_matches(other.body[0], scale))
+        self.assertFalse(syntax_matches(other.body[0], total))
+        # nodes without fields, like Load() and Add(), are shared between trees
+        self.assertFalse(any(hasattr(_, '_structural_hash') for _ in typed_ast3.walk(other)
+                             if _._fields))
+        scale.body.append(typed_ast3.Pass())
+        # cached digests are reused until they are cleared
+        self.assertEqual(structural_hash(syntax), digest)
+        self.assertNotEqual(structural_hash(syntax, cache=False), digest)
+        clear_structural_hashes(scale, syntax)
+        self.assertNotEqual(structural_hash(scale), scale_digest)
+        self.assertNotEqual(structural_hash(syntax), digest)
+        index = SyntaxIndex(syntax)
+        scale.body.pop()
+        index.update(scale)
+        self.assertEqual(structural_hash(syntax), digest)
+        loop = scale.body[0]
+        index.replace(loop.target, typed_ast3.Name(id='j', ctx=typed_ast3.Store()))
+        self.assertNotEqual(structural_hash(syntax), digest)
+        self.assertEqual(structural_hash(syntax, refresh=True), structural_hash(syntax))
+        loop.target.id = 'i'
+        index.update(loop.target)
+        self.assertEqual(structural_hash(syntax), digest)
+        clear_structural_hashes(syntax, recursive=True)
+        self.assertFalse(any(hasattr(_, '_structural_hash') for _ in typed_ast3.walk(syntax)))
+        self.assertEqual(structural_hash(syntax), digest)
+
+    def test_find_identical_subtrees(self):
+        parser = Parser.find(Language.find('Python 3'))()
+        syntax = parser.parse(PASS_MANAGER_EXAMPLE)
+        other = parser.parse('result = 0.0\nfor i in range(n):\n    pass\n')
+        groups = find_identical_subtrees(syntax, other)
+        self.assertListEqual([len(_) for _ in groups], [2])
+        self.assertIs(groups[0][1], other.body[0])
+        groups = find_identical_subtrees(syntax, types=(typed_ast3.arg,))
+        self.assertListEqual([[_.arg for _ in group] for group in groups],
+                             [['data', 'data'], ['n', 'n']])
+
+
+class AnnotationStoreTests(unittest.TestCase):
+
+    def test_annotate(self):
+        store = AnnotationStore()
+        syntax = typed_ast3.parse('print(x)\nprint(y)\n')
+        first, second = [_.value for _ in syntax.body]
+        store.annotate(first, 'is_statement', True)
+        store.annotate(first, 'custom', [1, 2])
+        store.annotate(second, 'nature', 'intrinsic')
+        self.assertTrue(store.has(first, 'is_statement'))
+        self.assertFalse(store.has(second, 'is_statement'))
+        self.assertEqual(store.get(second, 'nature'), 'intrinsic')
+        self.assertIsNone(store.get(second, 'custom'))
+        self.assertDictEqual(store.annotations(first), {'is_statement': True, 'custom': [1, 2]})
+        self.assertFalse(hasattr(first, 'annotations'))
+        with self.assertRaises(AssertionError):
+            store.annotate(second, 'is_statement', 'yes')
+        self.assertEqual(len(store), 2)
+        store.discard(first)
+        self.assertFalse(store.has(first, 'is_statement'))
+        del syntax, first, second
+        self.assertEqual(len(store), 0)
+
+    def test_export_and_restore(self):
+        syntax = typed_ast3.parse('print(x)\nprint(y)\n')
+        annotate_ast(syntax.body[1].value, 'is_statement', True)
+        copied = preserving_annotations(copy.deepcopy, syntax)
+        self.assertTrue(get_annotation(copied.body[1].value, 'is_statement'))
+        self.assertFalse(has_annotation(copied.body[0].value, 'is_statement'))
+        store = AnnotationStore()
+        store.annotate(syntax.body[0], 'nature', 'intrinsic')
+        unpickled, exported = pickle.loads(pickle.dumps((syntax, store.export(syntax))))
+        store.restore(unpickled, exported)
+        self.assertEqual(store.get(unpickled.body[0], 'nature'), 'intrinsic')
+        self.assertEqual(len(store), 2)
+
+    def test_deepcopy(self):
+        syntax = typed_ast3.parse('print(x)\nprint(y)\n')
+        annotate_ast(syntax.body[1].value, 'is_statement', True)
+        copied = deepcopy_ast(syntax)
+        self.assertTrue(get_annotation(copied.body[1].value, 'is_statement'))
+        self.assertFalse(has_annotation(copied.body[0].value, 'is_statement'))
+        copied_twice = deepcopy_ast(copied)
+        self.assertTrue(get_annotation(copied_twice.body[1].value, 'is_statement'))
+        store = AnnotationStore()
+        store.annotate(syntax.body[0], 'nature', 'intrinsic')
+        memo = {}
+        copied_body = store.deepcopy(syntax.body, memo)
+        self.assertIs(memo[id(syntax.body[0])], copied_body[0])
+        self.assertEqual(store.get(copied_body[0], 'nature'), 'intrinsic')
+        self.assertIs(store.deepcopy(syntax.body[0], memo), copied_body[0])
+        self.assertFalse(store.has(copied_body[1], 'nature'))
+        metadata = {'dimensions': syntax.body[0].value.args[0]}
+        annotate_ast(syntax.body[0], 'fortran_metadata', metadata)
+        copied = deepcopy_ast(syntax)
+        copied_metadata = get_annotation(copied.body[0], 'fortran_metadata')
+        self.assertIsNot(copied_metadata, metadata)
+        self.assertIs(copied_metadata['dimensions'], copied.body[0].value.args[0])
+
+    def test_fortran(self):
+        language = Language.find('Fortran 77')
+        path = EXAMPLES_ROOTS['f77'].joinpath('matmul.f')
+        syntax = Parser.find(language)().parse(CodeReader().read_file(path), path)
+        syntax = AstGeneralizer.find(language)().generalize(syntax)
+        calls = [_ for _ in typed_ast3.walk(syntax) if has_annotation(_, 'is_statement')]
+        self.assertEqual(len(calls), 4)
+        self.assertTrue(all(isinstance(_, typed_ast3.Call) for _ in calls))
+        self.assertTrue(any(has_annotation(_, 'fortran_metadata') for _ in typed_ast3.walk(syntax)))
+        self.assertFalse(any('fortran_metadata' in vars(_) for _ in typed_ast3.walk(syntax)))
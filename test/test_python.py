@@ -2,8 +2,10 @@
 
 import ast
 import logging
+import types
 import unittest
 
+import numpy as np
 import timing
 import typed_ast.ast3
 
@@ -12,9 +14,11 @@ from transpyle.python import PythonAstGeneralizer
 from transpyle.python.parser import \
     NativePythonParser, TypedPythonParser, TypedPythonParserWithComments
 from transpyle.python.unparser import \
-    NativePythonUnparser, TypedPythonUnparser, TypedPythonUnparserWithComments
+    NativePythonUnparser, TypedPythonUnparser, TypedPythonUnparserWithComments, \
+    NumbaPythonUnparser
 
-from .common import EXAMPLES_PY3, basic_check_python_ast, execute_on_language_examples
+from .common import \
+    EXAMPLES_PY3, EXAMPLES_ROOTS, basic_check_python_ast, execute_on_language_examples
 
 _LOG = logging.getLogger(__name__)
 
@@ -116,3 +120,64 @@ class UnparserTests(unittest.TestCase):
                                              .format(new_code)) from err
                     self.assertEqual(unparser.dump(tree), unparser.dump(new_tree))
                     self.assertEqual(example, new_code)
+
+    @execute_on_language_examples('python3')
+    def test_unparse_in_parallel_examples(self, input_path):
+        code = CodeReader().read_file(input_path)
+        tree = TypedPythonParserWithComments().parse(code, input_path)
+        unparser = TypedPythonUnparserWithComments()
+        self.assertEqual(unparser.unparse_in_parallel(tree, workers=2), unparser.unparse(tree))
+
+
+NUMBA_PARALLEL_EXAMPLE = """import numpy as np
+import static_typing as st
+
+
+def sum_and_scale(a: st.ndarray[1, np.double], b: st.ndarray[1, np.double], n: int) -> np.double:
+    total = 0.0
+    for i in range(n):
+        scaled = a[i] * 2
+        b[i] = scaled + 1
+        total += scaled
+    for i in range(1, n):
+        b[i] = b[i - 1] + a[i]
+    return total
+"""
+
+
+class NumbaUnparserTests(unittest.TestCase):
+
+    def _execute(self, code: str) -> types.ModuleType:
+        module = types.ModuleType('numba_example')
+        exec(compile(code, '<numba_example>', 'exec'), module.__dict__)
+        return module
+
+    def test_unparse_with_signature(self):
+        path = EXAMPLES_ROOTS['python3'].joinpath('compute_pi.py')
+        code = CodeReader().read_file(path)
+        tree = TypedPythonParserWithComments().parse(code, path)
+        unparser = NumbaPythonUnparser()
+        numba_code = unparser.unparse(tree)
+        self.assertIn('import numba', numba_code)
+        self.assertIn("@numba.njit('float64(int64)')", numba_code)
+        self.assertNotIn('numba.njit', code)
+        python_module = self._execute(code)
+        numba_module = self._execute(numba_code)
+        self.assertAlmostEqual(python_module.compute_pi(20), numba_module.compute_pi(20))
+
+    def test_unparse_parallel(self):
+        tree = TypedPythonParserWithComments().parse(NUMBA_PARALLEL_EXAMPLE)
+        unparser = NumbaPythonUnparser(parallel=True)
+        numba_code = unparser.unparse(tree)
+        _LOG.debug('%s', numba_code)
+        self.assertIn("@numba.njit('float64(float64[:], float64[:], int64)', parallel=True)",
+                      numba_code)
+        self.assertIn('for i in numba.prange(n):', numba_code)
+        self.assertIn('for i in range(1, n):', numba_code)
+        python_module = self._execute(NUMBA_PARALLEL_EXAMPLE)
+        numba_module = self._execute(numba_code)
+        data = np.random.rand(100)
+        python_result, numba_result = np.zeros(100), np.zeros(100)
+        self.assertAlmostEqual(python_module.sum_and_scale(data, python_result, 100),
+                               numba_module.sum_and_scale(data, numba_result, 100))
+        self.assertTrue(np.allclose(python_result, numba_result))
@@ -2,6 +2,8 @@
 
 import contextlib
 import io
+import pathlib
+import tempfile
 import unittest
 
 from .test_setup import run_module
@@ -32,3 +34,16 @@ class Tests(unittest.TestCase):
         text = sio.getvalue()
         self.assertIn('support', text)
         self.assertIn('transpyle', text)
+
+    def test_transformations(self):
+        source = pathlib.Path(__file__).resolve().parent.joinpath('examples_simplification.py')
+        with tempfile.TemporaryDirectory() as output_dir:
+            target = pathlib.Path(output_dir, 'simplified.py')
+            sio = io.StringIO()
+            with contextlib.redirect_stdout(sio):
+                run_module('transpyle', str(source), str(target), '--from', 'Python 3',
+                           '--to', 'Python 3', '--transformations', 'fold-constants', 'simplify')
+            code = target.read_text()
+        self.assertIn('cse_0 = (k >> 2)', code)
+        self.assertIn('fold-constants', sio.getvalue())
+        self.assertIn('simplify', sio.getvalue())
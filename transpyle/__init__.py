@@ -20,10 +20,10 @@ try:
 except ImportError:
     _LOG.warning("C++ unavailable")
 
-# try:
-#    from .cython import *
-# except ImportError:
-#    _LOG.warning("Cython unavailable")
+try:
+    from .cython import *
+except ImportError:
+    _LOG.warning("Cython unavailable")
 
 try:
     from .fortran import *
@@ -1,9 +1,10 @@
 """Parsing of C language."""
 
+import functools
 import io
 import logging
 import pathlib
-import tempfile
+import threading
 import typing as t
 
 import pcpp
@@ -12,8 +13,7 @@ from pcpp.preprocessor import LexToken  # ply.lex.LexToken
 # import pcpp.ply as ply
 import pycparser
 
-from ..general import CodeReader, CodeWriter, Parser
-from ..general.tools import run_tool
+from ..general import Parser
 
 _LOG = logging.getLogger(__name__)
 
@@ -170,53 +170,67 @@ class C99Preprocessor(pcpp.Preprocessor):
         tok.type = 'CPP_WS'
 
 
+@functools.lru_cache(maxsize=256)
+def preprocess_c(code: str, path_str: str) -> str:
+    """Preprocess C code, and expand supported standard headers included in it.
+
+    Supported headers are replaced by minimal ones bundled with transpyle, which are expanded
+    in memory. Other includes are kept in the code as string constants.
+
+    Result depends only on the code, its path and the bundled headers, therefore it is cached.
+    """
+    preprocessor = C99Preprocessor()
+    preprocessor.parse(code, path_str)
+    code_io = io.StringIO()
+    preprocessor.write(code_io)
+    preprocessed_code = code_io.getvalue()
+    if preprocessed_code != code:
+        _LOG.debug('code was preprocessed:\n%s', preprocessed_code)
+
+    # add selected includes
+    includes = ''
+    for name in preprocessor.include_names:
+        if name in C_SUPPORTED_HEADERS:
+            includes = '#include<{}>\n{}'.format(name, includes)
+    if not includes:
+        return preprocessed_code
+
+    _LOG.debug('expanding supported headers in "%s"', path_str)
+    headers_preprocessor = pcpp.Preprocessor()
+    headers_preprocessor.add_path(str(TRANSPYLE_C_RESOURCES_PATH))
+    headers_preprocessor.parse('{}\n{}'.format(includes, preprocessed_code), path_str)
+    code_io = io.StringIO()
+    headers_preprocessor.write(code_io)
+    return code_io.getvalue()
+
+
+_C_PARSERS = threading.local()
+
+
+def _c_parser() -> pycparser.CParser:
+    """Get pycparser parser of the current thread.
+
+    Creating a parser takes about as much time as parsing a small file, but parser keeps
+    the state of the parse in progress -- therefore one parser is reused in each thread.
+    """
+    parser = getattr(_C_PARSERS, 'parser', None)
+    if parser is None:
+        parser = pycparser.CParser()
+        _C_PARSERS.parser = parser
+    return parser
+
+
 class C99Parser(Parser):
 
-    """Parser for C99 based on pycparser package."""
+    """Parser for C99 based on pycparser package.
 
-    def __init__(self, default_scopes=None):
-        super().__init__(default_scopes)
-        self._preprocessor = C99Preprocessor()
-        self._parser = pycparser.CParser()
+    Preprocessed code is cached, and pycparser parser is reused, so that parsing the same
+    or many files in one process does not repeat the costly setup.
+    """
 
     def _parse_scope(self, code: str, path: pathlib.Path = None):
         assert path is not None, 'path is required'
         path_str = str(path)
         # return pycparser.parser_file(path_str, use_cpp=False, cpp_path='cpp', cpp_args='')
-
-        # preprocess
-        # code = pycparser.preprocess_file(path_str, cpp_path='cpp', cpp_args='')
-        self._preprocessor.parse(code, path_str)
-        code_io = io.StringIO()
-        self._preprocessor.write(code_io)
-        preprocessed_code = code_io.getvalue()
-        if preprocessed_code != code:
-            _LOG.debug('code was preprocessed:\n%s', preprocessed_code)
-
-        # add selected includes
-        includes = ''
-        for name in self._preprocessor.include_names:
-            if name in C_SUPPORTED_HEADERS:
-                includes = '#include<{}>\n{}'.format(name, includes)
-        self._preprocessor.include_names.clear()
-
-        if includes:
-            preprocessed_code = '{}\n{}'.format(includes, preprocessed_code)
-            with tempfile.TemporaryDirectory() as tmpdir:
-                output_folder = pathlib.Path(tmpdir)
-            output_folder.mkdir()
-            _LOG.warning('running C preprocessor on file in "%s"', output_folder)
-            intermediate_path = output_folder.joinpath(path.name)
-            CodeWriter(path.suffix).write_file(preprocessed_code, intermediate_path)
-            output_path = output_folder.joinpath(
-                '{}{}{}'.format(path.stem, '_preprocessed', path.suffix))
-            run_tool(pathlib.Path('gcc'), [
-                '-I', str(TRANSPYLE_C_RESOURCES_PATH), '-o', output_path, '-E', intermediate_path],
-                     cwd=output_folder)
-            preprocessed_code = CodeReader().read_file(output_path)
-            path_str = str(output_path)
-
-        # parse
-        tree = self._parser.parse(preprocessed_code, path_str)
-
-        return tree
+        preprocessed_code = preprocess_c(code, path_str)
+        return _c_parser().parse(preprocessed_code, path_str)
@@ -1,9 +1,9 @@
 """Generalizing C++ AST."""
 
+import collections
 import logging
 import pprint
 # import re
-import typing as t
 import xml.etree.ElementTree as ET
 
 import horast
@@ -12,6 +12,7 @@ import typed_ast.ast3 as typed_ast3
 
 from ..general import XmlAstGeneralizer
 from ..general.exc import ContinueIteration, AstGeneralizationError
+from ..general.misc import LazyFormat, lazy_xml, lazy_unparse
 from .definitions import CPP_PYTHON_TYPE_PAIRS, CPP_PYTHON_CLASS_PAIRS, CPP_STL_CLASSES
 
 NAMESPACE_NODES = {'Namespace'}
@@ -102,51 +103,46 @@ class CastXMLTypeFinder(XmlAstGeneralizer):
         self.file_id = self._determine_file_id(node)
         self.find_types(node)
 
-        while self._new_relevant_types:
-            _LOG.debug('there are %i new relevant types', len(self._new_relevant_types))
-            self.relevant_types.update(self._new_relevant_types)
+        pending = collections.deque(self._new_relevant_types.items())
+        self._new_relevant_types = {}
+        while pending:
+            id_, node_ = pending.popleft()
+            self.relevant_types[id_] = node_
+            if id_ in self.resolved_types:
+                continue
+            self.resolved_types[id_] = self.transform_one(node_)
+            _LOG.debug('resolved %s into %s',
+                       lazy_xml(node_), lazy_unparse(self.resolved_types[id_]))
+            pending.extend(self._new_relevant_types.items())
             self._new_relevant_types = {}
-            new_resolved_types = {}
-            for id_, node_ in self.relevant_types.items():
-                if id_ in self.resolved_types:
-                    continue
-                new_resolved_types[id_] = self.transform_one(node_)
-                _LOG.debug('resolved %s into %s', ET.tostring(node_).decode().rstrip(),
-                           horast.unparse(new_resolved_types[id_]))
-            self.resolved_types.update(new_resolved_types)
 
         self._fix_resolved_types(self.resolved_types)
 
-        _LOG.info('type resolution complete: %s', pprint.pformat(
-            {_: horast.unparse(type_).strip() for _, type_ in self.resolved_types.items()}))
+        _LOG.info('type resolution complete: %s', LazyFormat(lambda: pprint.pformat(
+            {_: horast.unparse(type_).strip() for _, type_ in self.resolved_types.items()})))
 
-    def find_types(self, root_node: ET.Element) -> t.Tuple[dict, dict]:
+    def find_types(self, root_node: ET.Element) -> None:
+        """Index all types by their ids, and find types used directly by relevant functions."""
         self._new_relevant_types = {}
         self.transform_all_subnodes(root_node, ignored={'File'} | TYPE_NODES)
-        for type_ in TYPE_NODES:
-            for node in self.get_all(root_node, './{}'.format(type_), require_results=False):
-                id_ = node.attrib['id']
+        for node in root_node:
+            if node.tag in TYPE_NODES:
                 self.all_types[node.attrib['id']] = node
-                if id_ not in self._new_relevant_types:
-                    continue
-                self._new_relevant_types[node.attrib['id']] = node
-        assert all(v is not None for v in self._new_relevant_types.values()), \
-            self._new_relevant_types
+        for id_ in self._new_relevant_types:
+            assert id_ in self.all_types, id_
+            self._new_relevant_types[id_] = self.all_types[id_]
         _LOG.info('found %i relevant types (out of %i) in "%s"',
                   len(self._new_relevant_types), len(self.all_types), self.scope['path'])
 
     def _fix_resolved_types(self, resolved_types: dict) -> None:
         resolver = CastXMLTypeResolver(resolved_types=resolved_types)
-        resolver.modified = True
-        while resolver.modified:
-            resolver.modified = False
-            for _, type_ in resolved_types.items():
-                resolver.visit(type_)
+        for id_ in resolved_types:
+            resolver.resolve(id_)
         if resolver.unresolved_types:
             _LOG.error('after type resolution for "%s", %i types remain unresolved',
                        self.scope['path'], len(resolver.unresolved_types))
             _LOG.debug('the following types remain unresolved:\n%s',
-                       pprint.pformat(resolver.unresolved_types))
+                       LazyFormat(pprint.pformat, resolver.unresolved_types))
             raise NotImplementedError(
                 'could not resolve some types: {}'.format(resolver.unresolved_types))
 
@@ -202,7 +198,7 @@ class CastXMLTypeFinder(XmlAstGeneralizer):
         if type_id not in self.relevant_types and type_id not in self._new_relevant_types:
             self._new_relevant_types[type_id] = self.all_types[type_id]
             _LOG.debug('type makred as relevant through a pointer: %s',
-                       ET.tostring(self.all_types[type_id]).decode().rstrip())
+                       lazy_xml(self.all_types[type_id]))
         type_info = make_pointer(typed_ast3.Str(type_id, ''))
         if is_const:
             type_info = make_const(type_info)
@@ -270,7 +266,7 @@ class CastXMLTypeFinder(XmlAstGeneralizer):
                         and referenced_id not in self._new_relevant_types:
                     self._new_relevant_types[referenced_id] = self.all_types[referenced_id]
                     _LOG.debug('type marked as relevant due to being container value type %s',
-                               ET.tostring(self.all_types[referenced_id]).decode().rstrip())
+                               lazy_xml(self.all_types[referenced_id]))
                 body.append(typed_ast3.Expr(typed_ast3.Str(referenced_id, '')))
                 value_type = referenced_id
             '''
@@ -297,25 +293,37 @@ class CastXMLTypeFinder(XmlAstGeneralizer):
 
 class CastXMLTypeResolver(RecursiveAstTransformer[typed_ast3]):
 
+    """Replace type ids in resolved types with the types they refer to.
+
+    Each type is processed once, after all types it refers to (i.e. in topological order
+    of the dependency graph of types). Ids that cannot be resolved, including those
+    that would make a type contain itself, are left as they are and gathered in unresolved_types.
+    """
+
     def __init__(self, *args, resolved_types, **kwargs):
-        super().__init__(*args, **kwargs)
+        super().__init__(*args, fields_first=True, **kwargs)
         self.resolved_types = resolved_types
         self.unresolved_types = set()
-        self.modified = False
+        self._in_progress = set()
+        self._done = set()
+
+    def resolve(self, id_: str) -> typed_ast3.AST:
+        if id_ not in self._done:
+            self._in_progress.add(id_)
+            self.visit(self.resolved_types[id_])
+            self._in_progress.remove(id_)
+            self._done.add(id_)
+        return self.resolved_types[id_]
 
     def visit_node(self, node):
         if not isinstance(node, typed_ast3.Str):
             return node
-        try:
-            resolved_type = self.resolved_types[node.s]
-        except KeyError:
+        if node.s not in self.resolved_types or node.s in self._in_progress:
             self.unresolved_types.add(node.s)
-            _LOG.debug('cannot currently resolve %s', node.s)
+            _LOG.debug('cannot resolve %s', node.s)
             return node
-        if node.s in self.unresolved_types:
-            self.unresolved_types.remove(node.s)
-        _LOG.debug('resolved %s into %s', node.s, typed_ast3.dump(resolved_type))
-        self.modified = True
+        resolved_type = self.resolve(node.s)
+        _LOG.debug('resolved %s into %s', node.s, LazyFormat(typed_ast3.dump, resolved_type))
         return resolved_type
 
 
@@ -358,7 +366,7 @@ class CppAstGeneralizer(XmlAstGeneralizer):
         try:
             node_str = node.attrib['kind']
         except KeyError:
-            _LOG.debug('unexpected behavior: %s', ET.tostring(node).decode().rstrip())
+            _LOG.debug('unexpected behavior: %s', lazy_xml(node))
             try:
                 node_str = node.attrib['type_class']
             except KeyError:
@@ -9,6 +9,7 @@ import tempfile
 import typing as t
 
 import argunparse
+import typed_ast.ast3 as typed_ast3
 
 from ..general import \
     temporarily_change_dir, run_tool, \
@@ -101,16 +102,22 @@ class SwigCompiler(Compiler):
         self.language = language
         self.argunparser = argunparse.ArgumentUnparser()
 
-    def create_header_file(self, path: pathlib.Path) -> str:
-        """Create a header for a given C/C++ source code file."""
-        code_reader = CodeReader()
-        parser = Parser.find(self.language)()
-        ast_generalizer = AstGeneralizer.find(self.language)({'path': path})
+    def create_header_file(self, path: pathlib.Path,
+                           general_ast: t.Optional[typed_ast3.AST] = None) -> str:
+        """Create a header for a given C/C++ source code file.
+
+        If general_ast, from which the code in the file was unparsed, is given,
+        the header is created from it without parsing the file again.
+        """
+        if general_ast is None:
+            code_reader = CodeReader()
+            parser = Parser.find(self.language)()
+            ast_generalizer = AstGeneralizer.find(self.language)({'path': path})
+            code = code_reader.read_file(path)
+            cpp_tree = parser.parse(code, path)
+            general_ast = ast_generalizer.generalize(cpp_tree)
         unparser = Unparser.find(self.language)(headers=True)
-        code = code_reader.read_file(path)
-        cpp_tree = parser.parse(code, path)
-        tree = ast_generalizer.generalize(cpp_tree)
-        header_code = unparser.unparse(tree)
+        header_code = unparser.unparse(general_ast)
         _LOG.debug('unparsed raw header file: """%s"""', header_code)
         return header_code
 
@@ -165,12 +172,18 @@ class CppSwigCompiler(SwigCompiler):
                              'Darwin': ClangppInterface()}[platform.system()]
 
     def compile(self, code: str, path: t.Optional[pathlib.Path] = None,
-                output_folder: t.Optional[pathlib.Path] = None, **kwargs) -> pathlib.Path:
+                output_folder: t.Optional[pathlib.Path] = None,
+                general_ast: t.Optional[typed_ast3.AST] = None, **kwargs) -> pathlib.Path:
+        """Compile C++ code and create its Python binding using SWIG.
+
+        If the code was unparsed from a general AST, e.g. by a translator, passing it as
+        general_ast avoids parsing the code again to create the header.
+        """
         if output_folder is None:
             with tempfile.TemporaryDirectory() as tmpdir:
                 output_folder = pathlib.Path(tmpdir)
             output_folder.mkdir()
-        header_code = self.create_header_file(path)
+        header_code = self.create_header_file(path, general_ast)
         hpp_path = output_folder.joinpath(path.name).with_suffix('.hpp')
         with hpp_path.open('w') as header_file:
             header_file.write(header_code)
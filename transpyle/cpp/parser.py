@@ -1,13 +1,18 @@
 """Parsing C++."""
 
+import functools
+import hashlib
 import logging
 import pathlib
 import platform
+import re
 import tempfile
+import typing as t
 import xml.etree.ElementTree as ET
 
 import argunparse
 
+from ..configuration import CACHE_PATH
 from ..general import Parser
 from ..general.tools import run_tool
 
@@ -15,34 +20,174 @@ _LOG = logging.getLogger(__name__)
 
 CASTXML_PATH = pathlib.Path('castxml')
 
+CASTXML_CACHE_PATH = CACHE_PATH.joinpath('castxml')
+"""Default location of cached CastXML output, i.e. CppParser(cache_path=CASTXML_CACHE_PATH)."""
 
-def run_castxml(input_path: pathlib.Path, output_path: pathlib.Path, gcc: bool = False):
-    """Run CastXML with given arguments."""
+_CPP_TOKEN = re.compile(
+    r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|^[ \t]*#(?:\\\n|[^\n])*'
+    r'|[A-Za-z_]\w*(?:\s*::\s*[A-Za-z_]\w*)*|\S', re.DOTALL | re.MULTILINE)
+
+_CPP_NON_DECLARATION_KEYWORDS = {
+    'alignas', 'alignof', 'decltype', 'delete', 'new', 'noexcept', 'operator', 'return', 'sizeof',
+    'static_assert', 'throw', 'typeid'}
+
+_CPP_LOCAL_INCLUDE = re.compile(r'^[ \t]*#[ \t]*include[ \t]*"([^"]+)"', re.MULTILINE)
+
+
+def castxml_compiler() -> t.Optional[str]:
+    """Get name of the compiler that CastXML simulates on this platform, if any."""
+    return {'Linux': 'g++', 'Darwin': 'clang++'}.get(platform.system())
+
+
+def run_castxml(input_path: pathlib.Path, output_path: pathlib.Path, gcc: bool = False,
+                start: t.Optional[t.Sequence[str]] = None):
+    """Run CastXML with given arguments.
+
+    If start is given, output is limited to the declarations of given qualified names
+    and to the declarations they refer to.
+    """
     args = ['-std=c++17', '-fcolor-diagnostics', input_path]
     kwargs = {}
     if gcc:
         kwargs['castxml-gccxml'] = True
     else:
         kwargs['castxml-output=1'] = True
-    if platform.system() == 'Linux':
-        kwargs['castxml-cc-gnu'] = 'g++'
-    elif platform.system() == 'Darwin':
-        kwargs['castxml-cc-gnu'] = 'clang++'
+    compiler = castxml_compiler()
+    if compiler is not None:
+        kwargs['castxml-cc-gnu'] = compiler
+    if start:
+        kwargs['castxml-start'] = ','.join(start)
     kwargs['o'] = str(output_path)
     return run_tool(CASTXML_PATH, args, kwargs,
                     argunparser=argunparse.ArgumentUnparser(opt_value=' '))
 
 
+@functools.lru_cache(maxsize=None)
+def castxml_toolchain_version() -> str:
+    """Get versions of CastXML and of the compiler it simulates.
+
+    Declarations from system headers depend only on them, therefore they key the cache
+    of CastXML output.
+    """
+    executables = [CASTXML_PATH]
+    if castxml_compiler() is not None:
+        executables.append(pathlib.Path(castxml_compiler()))
+    return '\n'.join(run_tool(executable, kwargs={'version': True}).stdout
+                     for executable in executables)
+
+
+def find_function_names(code: str) -> t.List[str]:
+    """Find qualified names of functions declared or defined in C++ code at namespace scope.
+
+    This is a lexical approximation that does not expand macros, meant only to limit CastXML
+    output to the declarations from a given file.
+    """
+    names = []  # type: t.List[str]
+    scopes = []  # type: t.List[t.Optional[str]]
+    paren_depth = 0
+    previous = None
+    previous_previous = None
+    for match in _CPP_TOKEN.finditer(code):
+        token = match.group()
+        if token[:2] in ('//', '/*') or token.lstrip().startswith('#'):
+            continue
+        if token == '(':
+            if paren_depth == 0 and all(_ is not None for _ in scopes) \
+                    and _is_identifier(previous) and previous not in _CPP_NON_DECLARATION_KEYWORDS \
+                    and (_is_identifier(previous_previous) or previous_previous in ('*', '&', '>')):
+                name = '::'.join([_ for _ in scopes if _] + [re.sub(r'\s+', '', previous)])
+                if name not in names:
+                    names.append(name)
+            paren_depth += 1
+        elif token == ')':
+            paren_depth -= 1
+        elif token == '{':
+            if previous_previous == 'namespace' and _is_identifier(previous):
+                scopes.append(previous)
+            elif previous == 'namespace' or previous_previous == 'extern' and previous[0] == '"':
+                scopes.append('')
+            else:
+                scopes.append(None)
+        elif token == '}' and scopes:
+            scopes.pop()
+        previous_previous, previous = previous, token
+    return names
+
+
+def _is_identifier(token: t.Optional[str]) -> bool:
+    return token is not None and (token[0].isalpha() or token[0] == '_')
+
+
+def _local_include_paths(code: str, directory: pathlib.Path,
+                         found: t.Optional[t.List[pathlib.Path]] = None) -> t.List[pathlib.Path]:
+    """Find files included by #include "..." in given code, recursively."""
+    if found is None:
+        found = []
+    for include in _CPP_LOCAL_INCLUDE.findall(code):
+        path = directory.joinpath(include)
+        if path in found or not path.is_file():
+            continue
+        found.append(path)
+        _local_include_paths(path.read_text(), path.parent, found)
+    return found
+
+
 class CppParser(Parser):
 
-    """C++ parser using CastXML."""
+    """C++ parser using CastXML.
+
+    Unless main_file_only is False, output is limited to the functions declared in the parsed file
+    and to the declarations they refer to, instead of all declarations from all included headers.
+
+    If cache_path is given, CastXML output is stored there and reused as long as the parsed file,
+    its local headers, and versions of CastXML and of the compiler do not change.
+    """
+
+    def __init__(self, default_scopes: t.Sequence[t.Tuple[int, t.Optional[int]]] = None,
+                 main_file_only: bool = True, cache_path: t.Optional[pathlib.Path] = None):
+        super().__init__(default_scopes)
+        self.main_file_only = main_file_only
+        self.cache_path = cache_path
 
     def _parse_scope(self, code, path=None):
+        start = find_function_names(code) if self.main_file_only else None
+        cached_path = None
+        if self.cache_path is not None:
+            key = self._cache_key(code, path, start)
+            cached_path = self.cache_path.joinpath('{}.xml'.format(key))
+            if cached_path.is_file():
+                _LOG.debug('using cached CastXML output "%s" for "%s"', cached_path, path)
+                return ET.parse(str(cached_path)).getroot()
+        output = self._run_castxml(path, start)
+        if cached_path is not None:
+            self.cache_path.mkdir(parents=True, exist_ok=True)
+            cached_path.write_text(output)
+        return ET.fromstring(output)
+
+    def _run_castxml(self, path: pathlib.Path, start: t.Optional[t.List[str]]) -> str:
         output_path = None
         with tempfile.NamedTemporaryFile(delete=False) as temporary_file:
             output_path = pathlib.Path(temporary_file.name)
-        _ = run_castxml(path, output_path, gcc=False)
-        with open(str(output_path)) as output_file:
-            output = output_file.read()
-        output_path.unlink()
-        return ET.fromstring(output)
+        try:
+            if start:
+                try:
+                    run_castxml(path, output_path, gcc=False, start=start)
+                except RuntimeError:
+                    _LOG.warning('CastXML failed for functions %s of "%s", using complete output',
+                                 start, path)
+                    start = None
+            if not start:
+                run_castxml(path, output_path, gcc=False)
+            with open(str(output_path)) as output_file:
+                return output_file.read()
+        finally:
+            output_path.unlink()
+
+    def _cache_key(self, code: str, path: pathlib.Path, start: t.Optional[t.List[str]]) -> str:
+        key = hashlib.sha256()
+        for part in (castxml_toolchain_version(), str(path), repr(start), code):
+            key.update(part.encode())
+        for include_path in _local_include_paths(code, path.parent):
+            key.update(str(include_path).encode())
+            key.update(include_path.read_bytes())
+        return key.hexdigest()
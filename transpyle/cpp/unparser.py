@@ -529,14 +529,26 @@ class Cpp14HeaderUnparserBackend(Cpp14UnparserBackend):
 
 class Cpp14Unparser(Unparser):
 
+    parallel_unparsing = True
+
     def __init__(self, headers: bool = False):
         super().__init__(Language.find('C++14'))
         self.headers = headers
 
     def unparse(self, tree) -> str:
+        return self._join_units([self._unparse_unit(tree)])
+
+    def _unparse_unit(self, tree) -> t.Tuple[t.List[str], str]:
         stream = io.StringIO()
         backend = Cpp14HeaderUnparserBackend if self.headers else Cpp14UnparserBackend
         instance = backend(tree, file=stream)
-        # _LOG.debug('writing %i includes...', len(instance._includes))
-        includes = '\n'.join('#include <{}>'.format(_) for _ in instance._includes)
-        return '{}{}{}'.format(includes, '\n' if includes else '', stream.getvalue())
+        return list(instance._includes), stream.getvalue()
+
+    def _join_units(self, unparsed_units: t.List[t.Tuple[t.List[str], str]]) -> str:
+        all_includes = {}
+        for includes, _ in unparsed_units:
+            all_includes.update({_: True for _ in includes})
+        # _LOG.debug('writing %i includes...', len(all_includes))
+        includes = '\n'.join('#include <{}>'.format(_) for _ in all_includes)
+        code = super()._join_units([code for _, code in unparsed_units])
+        return '{}{}{}'.format(includes, '\n' if includes else '', code)
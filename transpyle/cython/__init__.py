@@ -0,0 +1,15 @@
+"""Support for Cython language."""
+
+from ..general import Language, Unparser, Compiler, Binder
+from .unparser import CythonUnparser
+from .compiler import CythonCompiler
+
+__all__ = ['CythonUnparser', 'CythonCompiler']
+
+Language.register(Language(['Cython'], ['.pyx']), ['Cython'])
+
+Unparser.register(CythonUnparser, (Language.find('Cython'),))
+
+Compiler.register(CythonCompiler, (Language.find('Cython'),))
+
+Binder.register(Binder, (Language.find('Cython'),))
@@ -0,0 +1,52 @@
+"""Compiling of Cython."""
+
+import logging
+import pathlib
+import platform
+import tempfile
+import typing as t
+
+from Cython.Build import cythonize
+from setuptools import Extension
+
+from ..general import temporarily_change_dir, Language, Compiler
+from ..cpp.compiler_interface import GppInterface, ClangppInterface
+
+_LOG = logging.getLogger(__name__)
+
+
+class CythonCompiler(Compiler):
+
+    """Cython-based compiler: translates .pyx into C++ and builds an extension module."""
+
+    def __init__(self):
+        super().__init__()
+        self.language = Language.find('Cython')
+        self.cpp_compiler = {'Linux': GppInterface(),
+                             'Darwin': ClangppInterface()}[platform.system()]
+
+    def cythonize(self, pyx_path: pathlib.Path) -> pathlib.Path:
+        """Translate a given .pyx file into C++ source code file."""
+        _LOG.info('running Cython on "%s"', pyx_path)
+        extension = Extension(pyx_path.with_suffix('').name, [str(pyx_path)], language='c++')
+        cythonize([extension], force=True, quiet=True, compiler_directives={'language_level': 3})
+        cpp_path = pyx_path.with_suffix('.cpp')
+        assert cpp_path.is_file(), cpp_path
+        return cpp_path
+
+    def compile(self, code: str, path: t.Optional[pathlib.Path] = None,
+                output_folder: t.Optional[pathlib.Path] = None, **kwargs) -> pathlib.Path:
+        if output_folder is None:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                output_folder = pathlib.Path(tmpdir)
+            output_folder.mkdir()
+        pyx_path = output_folder.joinpath(path.name).with_suffix('.pyx')
+        with pyx_path.open('w') as pyx_file:
+            pyx_file.write(code)
+        with temporarily_change_dir(output_folder):
+            cpp_path = self.cythonize(pyx_path)
+            result = self.cpp_compiler.compile(
+                None, input_paths=[cpp_path], output_path=pyx_path.with_suffix('.so'))
+            assert result['results']['compile'].returncode == 0
+            assert result['results']['link'].returncode == 0
+        return pyx_path.with_suffix('.so')
@@ -0,0 +1,498 @@
+"""Unparsing Python AST into Cython."""
+
+import io
+import logging
+import typing as t
+
+import horast.unparser
+import typed_ast.ast3 as typed_ast3
+
+from ..general import Language, Unparser
+from ..general.misc import lazy_unparse
+from ..pair.loop_analysis import is_range_loop
+
+_LOG = logging.getLogger(__name__)
+
+PYTHON_CYTHON_TYPES = {
+    'bool': 'bint',
+    'int': 'long',
+    'float': 'double',
+    'complex': 'double complex',
+    'np.bool_': 'bint',
+    'np.int8': 'signed char',
+    'np.int16': 'short',
+    'np.int32': 'int',
+    'np.int64': 'long long',
+    'np.uint8': 'unsigned char',
+    'np.uint16': 'unsigned short',
+    'np.uint32': 'unsigned int',
+    'np.uint64': 'unsigned long long',
+    'np.single': 'float',
+    'np.float32': 'float',
+    'np.double': 'double',
+    'np.float64': 'double',
+    'np.complex64': 'float complex',
+    'np.complex128': 'double complex'}
+
+CYTHON_INDEX_TYPE = 'Py_ssize_t'
+
+
+def cython_type(annotation: typed_ast3.AST) -> t.Optional[str]:
+    """Translate a PAIR type annotation into Cython type, or None if it's not supported.
+
+    Scalar types like int and np.float64 become C types, and st.ndarray of those
+    becomes a typed memoryview like double[:, :].
+    """
+    if isinstance(annotation, typed_ast3.Name):
+        return PYTHON_CYTHON_TYPES.get(annotation.id)
+    if isinstance(annotation, typed_ast3.Attribute) \
+            and isinstance(annotation.value, typed_ast3.Name):
+        return PYTHON_CYTHON_TYPES.get('{}.{}'.format(annotation.value.id, annotation.attr))
+    if isinstance(annotation, typed_ast3.Subscript) \
+            and isinstance(annotation.value, typed_ast3.Attribute) \
+            and isinstance(annotation.value.value, typed_ast3.Name) \
+            and annotation.value.value.id == 'st' and annotation.value.attr == 'ndarray' \
+            and isinstance(annotation.slice, typed_ast3.Index) \
+            and isinstance(annotation.slice.value, typed_ast3.Tuple) \
+            and len(annotation.slice.value.elts) >= 2:
+        dimensions, data_type = annotation.slice.value.elts[:2]
+        data_type = cython_type(data_type)
+        if not isinstance(dimensions, typed_ast3.Num) or data_type is None:
+            return None
+        return '{}[{}]'.format(data_type, ', '.join(':' for _ in range(dimensions.n)))
+    return None
+
+
+def is_memoryview_type(type_: t.Optional[str]) -> bool:
+    return type_ is not None and type_.endswith(']')
+
+
+def _type_comment_annotation(stmt: typed_ast3.Assign) -> t.Optional[typed_ast3.AST]:
+    if getattr(stmt, 'type_comment', None) is None:
+        return None
+    try:
+        return typed_ast3.parse(stmt.type_comment, mode='eval').body
+    except SyntaxError:
+        return None
+
+
+def _target_names(target: typed_ast3.AST) -> t.List[str]:
+    if isinstance(target, typed_ast3.Name):
+        return [target.id]
+    if isinstance(target, (typed_ast3.Tuple, typed_ast3.List)):
+        return [name for elt in target.elts for name in _target_names(elt)]
+    if isinstance(target, typed_ast3.Starred):
+        return _target_names(target.value)
+    return []
+
+
+def _walk_scope(node: typed_ast3.AST):
+    """Like ast.walk, but don't descend into nested functions, lambdas and classes."""
+    yield node
+    for child in typed_ast3.iter_child_nodes(node):
+        if isinstance(child, (typed_ast3.FunctionDef, typed_ast3.AsyncFunctionDef,
+                              typed_ast3.Lambda, typed_ast3.ClassDef)):
+            continue
+        yield from _walk_scope(child)
+
+
+def _nonnegative_literal(node: typed_ast3.AST) -> t.Optional[int]:
+    if isinstance(node, typed_ast3.Num) and isinstance(node.n, int) and node.n >= 0:
+        return node.n
+    return None
+
+
+def _shape_of(node: typed_ast3.AST) -> t.Optional[t.Tuple[str, t.Optional[int]]]:
+    """Match x.shape[k], len(x) or x.size and return (x, k), with k None for x.size."""
+    if isinstance(node, typed_ast3.Subscript) and isinstance(node.value, typed_ast3.Attribute) \
+            and isinstance(node.value.value, typed_ast3.Name) and node.value.attr == 'shape' \
+            and isinstance(node.slice, typed_ast3.Index) \
+            and _nonnegative_literal(node.slice.value) is not None:
+        return node.value.value.id, node.slice.value.n
+    if isinstance(node, typed_ast3.Call) and isinstance(node.func, typed_ast3.Name) \
+            and node.func.id == 'len' and len(node.args) == 1 and not node.keywords \
+            and isinstance(node.args[0], typed_ast3.Name):
+        return node.args[0].id, 0
+    if isinstance(node, typed_ast3.Attribute) and isinstance(node.value, typed_ast3.Name) \
+            and node.attr == 'size':
+        return node.value.id, None
+    return None
+
+
+def _affine(node: typed_ast3.AST) -> t.Optional[t.Tuple[t.Optional[str], int]]:
+    """Match expressions like 5, i, i + 2 or i - 1 and return (name, offset)."""
+    if isinstance(node, typed_ast3.Num) and isinstance(node.n, int):
+        return None, node.n
+    if isinstance(node, typed_ast3.Name):
+        return node.id, 0
+    if isinstance(node, typed_ast3.BinOp) and isinstance(node.op, (typed_ast3.Add, typed_ast3.Sub)):
+        left, right = _affine(node.left), _affine(node.right)
+        if left is None or right is None:
+            return None
+        if isinstance(node.op, typed_ast3.Add):
+            if left[0] is not None and right[0] is not None:
+                return None
+            return left[0] or right[0], left[1] + right[1]
+        if right[0] is not None:
+            return None
+        return left[0], left[1] - right[1]
+    return None
+
+
+class _RangeBounds:
+
+    """Bounds of a loop over range() as far as they matter for indexing arrays."""
+
+    def __init__(self, loop: typed_ast3.For):
+        args = loop.iter.args
+        start = args[0] if len(args) > 1 else typed_ast3.Num(n=0)
+        stop = args[1] if len(args) > 1 else args[0]
+        step = args[2] if len(args) > 2 else typed_ast3.Num(n=1)
+        step = _nonnegative_literal(step)
+        self.ascending = step is not None and step > 0
+        self.start = _nonnegative_literal(start)
+        self.stop = None  # type: t.Optional[t.Tuple[str, t.Optional[int], int]]
+        margin = 0
+        if isinstance(stop, typed_ast3.BinOp) and isinstance(stop.op, typed_ast3.Sub) \
+                and _nonnegative_literal(stop.right) is not None:
+            stop, margin = stop.left, stop.right.n
+        shape = _shape_of(stop)
+        if shape is not None:
+            self.stop = shape + (margin,)
+
+
+class FunctionAnalysis:
+
+    """Types and indexing safety of variables in one function, as needed by Cython unparser.
+
+    Types of parameters are taken from annotations, or from variable annotations in the body
+    as created when generalizing Fortran declarations. Other annotated variables in the body
+    become cdef declarations, and variables of loops over range() become Py_ssize_t.
+
+    The checks of memoryview indexing are conservative: wraparound is disabled only if
+    every index is provably nonnegative, and boundscheck only if every index is a loop
+    variable (optionally with a constant offset) of a loop over range() that is bounded
+    by the shape of the very same array in the very same dimension. Neither is disabled
+    in a function that subscripts anything other than a memoryview.
+    """
+
+    def __init__(self, function: typed_ast3.FunctionDef):
+        self.function = function
+        self.arg_types = {}  # type: t.Dict[str, str]
+        self.local_types = {}  # type: t.Dict[str, str]
+        self.cdef_statements = set()  # type: t.Set[int]
+        self.loop_indices = []  # type: t.List[str]
+        self._stores = {}  # type: t.Dict[str, t.List[typed_ast3.AST]]
+        self._collect_stores()
+        self._analyze_declarations()
+        self._analyze_loop_indices()
+        self.memoryviews = {name for name, type_ in self.types.items()
+                            if is_memoryview_type(type_)}
+        self.boundscheck_safe, self.wraparound_safe = self._analyze_indexing()
+
+    @property
+    def types(self) -> t.Dict[str, str]:
+        types = dict(self.arg_types)
+        types.update(self.local_types)
+        types.update({_: CYTHON_INDEX_TYPE for _ in self.loop_indices})
+        return types
+
+    def _collect_stores(self):
+        for node in _walk_scope(self.function):
+            if node is self.function:
+                continue
+            targets = []
+            if isinstance(node, typed_ast3.Assign):
+                targets = node.targets
+            elif isinstance(node, (typed_ast3.AugAssign, typed_ast3.For,
+                                   typed_ast3.comprehension)):
+                targets = [node.target]
+            elif isinstance(node, typed_ast3.AnnAssign) and node.value is not None:
+                targets = [node.target]
+            elif isinstance(node, typed_ast3.withitem) and node.optional_vars is not None:
+                targets = [node.optional_vars]
+            for target in targets:
+                for name in _target_names(target):
+                    self._stores.setdefault(name, []).append(node)
+
+    def _analyze_declarations(self):
+        args = self.function.args
+        arg_names = [_.arg for _ in args.args]
+        declarations = {
+            stmt.target.id: stmt.annotation for stmt in self.function.body
+            if isinstance(stmt, typed_ast3.AnnAssign) and isinstance(stmt.target, typed_ast3.Name)
+            and stmt.target.id in arg_names}
+        for arg in args.args:
+            annotation = arg.annotation
+            if annotation is None and arg.arg in declarations:
+                annotation = declarations[arg.arg]
+            arg_type = None if annotation is None else cython_type(annotation)
+            if arg_type is not None:
+                self.arg_types[arg.arg] = arg_type
+
+        used = set(arg_names)
+        for stmt in self.function.body:
+            target, annotation = None, None
+            if isinstance(stmt, typed_ast3.AnnAssign):
+                target, annotation = stmt.target, stmt.annotation
+            elif isinstance(stmt, typed_ast3.Assign) and len(stmt.targets) == 1:
+                target, annotation = stmt.targets[0], _type_comment_annotation(stmt)
+            if isinstance(target, typed_ast3.Name) and annotation is not None \
+                    and target.id not in used:
+                type_ = cython_type(annotation)
+                if type_ is not None:
+                    self.local_types[target.id] = type_
+                    self.cdef_statements.add(id(stmt))
+            used |= {_.id for _ in _walk_scope(stmt) if isinstance(_, typed_ast3.Name)}
+
+    def _analyze_loop_indices(self):
+        for node in _walk_scope(self.function):
+            if not is_range_loop(node):
+                continue
+            name = node.target.id
+            if name in self.arg_types or name in self.local_types or name in self.loop_indices:
+                continue
+            if self._is_loop_index(name):
+                self.loop_indices.append(name)
+
+    def _is_loop_index(self, name: str) -> bool:
+        """Check if the variable is assigned only as a target of loops over range()."""
+        stores = self._stores.get(name, [])
+        return bool(stores) and all(is_range_loop(_) for _ in stores)
+
+    def _is_constant(self, name: str) -> bool:
+        """Check if the variable is never reassigned after initialization."""
+        stores = self._stores.get(name, [])
+        if name in self.arg_types:
+            return not stores
+        return len(stores) == 1 and id(stores[0]) in self.cdef_statements
+
+    def _index_safety(self, index: typed_ast3.AST, array: str, dim: int,
+                      loops: t.Dict[str, _RangeBounds]) -> t.Tuple[bool, bool]:
+        """Return (in bounds, nonnegative) for a single index of a memoryview."""
+        affine = _affine(index)
+        if affine is None:
+            return False, False
+        name, offset = affine
+        if name is None:
+            return False, offset >= 0
+        if name not in loops or not self._is_loop_index(name):
+            return False, False
+        bounds = loops[name]
+        if not bounds.ascending or bounds.start is None:
+            return False, False
+        nonnegative = bounds.start + offset >= 0
+        if not nonnegative or bounds.stop is None:
+            return False, nonnegative
+        stop_array, stop_dim, margin = bounds.stop
+        if stop_dim is None and len(self.types[array].split(',')) == 1:
+            stop_dim = 0
+        in_bounds = stop_array == array and stop_dim == dim and offset <= margin \
+            and self._is_constant(array)
+        return in_bounds, nonnegative
+
+    def _slice_bound_nonnegative(self, bound: t.Optional[typed_ast3.AST],
+                                 loops: t.Dict[str, _RangeBounds]) -> bool:
+        if bound is None or _shape_of(bound) is not None:
+            return True
+        affine = _affine(bound)
+        if affine is None:
+            return False
+        name, offset = affine
+        if name is None:
+            return offset >= 0
+        bounds = loops.get(name)
+        return bounds is not None and self._is_loop_index(name) and bounds.ascending \
+            and bounds.start is not None and bounds.start + offset >= 0
+
+    def _subscript_safety(
+            self, subscript: typed_ast3.Subscript,
+            loops: t.Dict[str, _RangeBounds]) -> t.List[t.Tuple[t.Optional[bool], bool]]:
+        """Return (in bounds, nonnegative) for each index of a memoryview subscript.
+
+        Slices are never out of bounds, hence they are reported as None instead.
+        """
+        array = subscript.value.id
+        slice_ = subscript.slice
+        if isinstance(slice_, typed_ast3.Index):
+            dims = slice_.value.elts if isinstance(slice_.value, typed_ast3.Tuple) \
+                else [slice_.value]
+            dims = [typed_ast3.Index(value=_) for _ in dims]
+        elif isinstance(slice_, typed_ast3.ExtSlice):
+            dims = slice_.dims
+        else:
+            dims = [slice_]
+        results = []
+        for dim, index in enumerate(dims):
+            if isinstance(index, typed_ast3.Index):
+                results.append(self._index_safety(index.value, array, dim, loops))
+            elif isinstance(index, typed_ast3.Slice):
+                step = _nonnegative_literal(index.step) if index.step is not None else 1
+                results.append((None, step is not None and step > 0 and all(
+                    self._slice_bound_nonnegative(_, loops) for _ in (index.lower, index.upper))))
+            else:
+                results.append((False, False))
+        return results
+
+    def _analyze_indexing(self) -> t.Tuple[bool, bool]:
+        """Check if bounds checking and wraparound can be disabled for the whole function.
+
+        Directives apply to every subscript in the function, therefore any subscript
+        of something else than a memoryview makes both of them unsafe.
+        """
+        results = []
+
+        def visit(node, loops: t.Dict[str, _RangeBounds]):
+            if node is self.function:
+                for stmt in node.body:
+                    visit(stmt, loops)
+                return
+            if isinstance(node, (typed_ast3.FunctionDef, typed_ast3.AsyncFunctionDef,
+                                 typed_ast3.Lambda, typed_ast3.ClassDef)):
+                return
+            if isinstance(node, typed_ast3.AnnAssign):
+                # annotations, like st.ndarray[1, np.double], are not evaluated as subscripts
+                for child in (node.target, node.value):
+                    if child is not None:
+                        visit(child, loops)
+                return
+            if is_range_loop(node):
+                visit(node.iter, loops)
+                inner_loops = dict(loops)
+                inner_loops[node.target.id] = _RangeBounds(node)
+                for stmt in node.body:
+                    visit(stmt, inner_loops)
+                return
+            if isinstance(node, typed_ast3.Subscript):
+                if isinstance(node.value, typed_ast3.Name) and node.value.id in self.memoryviews:
+                    results.extend(self._subscript_safety(node, loops))
+                else:
+                    results.append((False, False))
+            for child in typed_ast3.iter_child_nodes(node):
+                visit(child, loops)
+
+        visit(self.function, {})
+        in_bounds = [index_in_bounds for index_in_bounds, _ in results
+                     if index_in_bounds is not None]
+        nonnegative = [index_nonnegative for _, index_nonnegative in results]
+        return bool(in_bounds) and all(in_bounds), bool(nonnegative) and all(nonnegative)
+
+
+class CythonUnparserBackend(horast.unparser.Unparser):
+
+    """Implementation of Cython unparser.
+
+    Types from PAIR annotations become C types of parameters and cdef declarations
+    of local variables, with arrays represented as typed memoryviews.
+    """
+
+    lang_name = 'Cython'
+
+    def __init__(self, *args, **kwargs):
+        self._analyses = {}  # type: t.Dict[int, FunctionAnalysis]
+        self._analysis = None  # type: t.Optional[FunctionAnalysis]
+        self._arg_types = {}  # type: t.Dict[str, str]
+        self._function_depth = 0
+        super().__init__(*args, **kwargs)
+
+    def _analyze(self, function: typed_ast3.FunctionDef) -> FunctionAnalysis:
+        if id(function) not in self._analyses:
+            self._analyses[id(function)] = FunctionAnalysis(function)
+        return self._analyses[id(function)]
+
+    def _Module(self, tree):
+        self.write('# cython: language_level=3')
+        needs_cimport = any(
+            analysis.boundscheck_safe or analysis.wraparound_safe
+            for analysis in (self._analyze(_) for _ in typed_ast3.walk(tree)
+                             if isinstance(_, typed_ast3.FunctionDef)))
+        for i, stmt in enumerate(tree.body):
+            is_docstring = i == 0 and isinstance(stmt, typed_ast3.Expr) \
+                and isinstance(stmt.value, typed_ast3.Str)
+            if needs_cimport and not is_docstring \
+                    and not isinstance(stmt, (typed_ast3.Import, typed_ast3.ImportFrom)):
+                self.fill('cimport cython')
+                needs_cimport = False
+            self.dispatch(stmt)
+        if needs_cimport:
+            self.fill('cimport cython')
+
+    def _FunctionDef(self, t):
+        analysis = self._analyze(t)
+        self.write('\n')
+        for decorator in t.decorator_list:
+            self.fill('@')
+            self.dispatch(decorator)
+        if analysis.boundscheck_safe:
+            self.fill('@cython.boundscheck(False)')
+        if analysis.wraparound_safe:
+            self.fill('@cython.wraparound(False)')
+        return_type = None if t.returns is None else cython_type(t.returns)
+        if self._function_depth == 0 and return_type is not None \
+                and not is_memoryview_type(return_type):
+            self.fill('cpdef {} {}('.format(return_type, t.name))
+        else:
+            self.fill('def {}('.format(t.name))
+        self._arg_types = analysis.arg_types
+        self.dispatch(t.args)
+        self._arg_types = {}
+        self.write(')')
+        self.enter()
+        if analysis.loop_indices:
+            self.fill('cdef {} {}'.format(CYTHON_INDEX_TYPE, ', '.join(analysis.loop_indices)))
+        outer_analysis, self._analysis = self._analysis, analysis
+        self._function_depth += 1
+        self.dispatch(t.body)
+        self._function_depth -= 1
+        self._analysis = outer_analysis
+        self.leave()
+
+    def _arg(self, t):
+        arg_type = self._arg_types.get(t.arg)
+        if arg_type is not None:
+            self.write('{} '.format(arg_type))
+        self.write(t.arg)
+
+    def _cdef(self, target: typed_ast3.Name, value: t.Optional[typed_ast3.AST]):
+        self.fill('cdef {} {}'.format(self._analysis.local_types[target.id], target.id))
+        if value is not None:
+            self.write(' = ')
+            self.dispatch(value)
+
+    def _AnnAssign(self, t):
+        if self._analysis is not None and id(t) in self._analysis.cdef_statements:
+            self._cdef(t.target, t.value)
+            return
+        if t.value is None:
+            _LOG.debug('omitting declaration of "%s" of unsupported type', lazy_unparse(t))
+            return
+        self.fill()
+        self.dispatch(t.target)
+        self.write(' = ')
+        self.dispatch(t.value)
+
+    def _Assign(self, t):
+        if self._analysis is not None and id(t) in self._analysis.cdef_statements:
+            self._cdef(t.targets[0], t.value)
+            return
+        super()._Assign(t)
+
+    def _Return(self, t):
+        if self._analysis is not None and isinstance(t.value, typed_ast3.Name) \
+                and t.value.id in self._analysis.memoryviews:
+            self.fill('return np.asarray({})'.format(t.value.id))
+            return
+        super()._Return(t)
+
+
+class CythonUnparser(Unparser):
+
+    """Generate Cython code from PAIR."""
+
+    def __init__(self):
+        super().__init__(Language.find('Cython'))
+
+    def unparse(self, tree) -> str:
+        stream = io.StringIO()
+        CythonUnparserBackend(tree, file=stream)
+        return stream.getvalue()
@@ -6,6 +6,7 @@ import itertools
 import logging
 import re
 import typing as t
+import weakref
 import xml.etree.ElementTree as ET
 
 import horast
@@ -16,11 +17,12 @@ import typed_ast.ast3 as typed_ast3
 import typed_astunparse
 
 from ..pair import \
-    annotate_ast, get_annotation, \
+    annotate_ast, get_annotation, preserving_annotations, \
     make_expression_from_slice, make_numpy_constructor, make_st_ndarray, fix_stmts_in_body, \
     separate_args_and_keywords
+from ..pair.ast_annotations import AST_ANNOTATIONS
 from ..general.exc import ContinueIteration
-from ..general.misc import flatten_sequence
+from ..general.misc import flatten_sequence, flatten_syntax, lazy_xml, lazy_unparse
 from ..general import Language, XmlAstGeneralizer
 from .definitions import \
     FORTRAN_PYTHON_TYPE_PAIRS, FORTRAN_PYTHON_OPERATORS, INTRINSICS_FORTRAN_TO_PYTHON, \
@@ -28,6 +30,8 @@ from .definitions import \
 
 _LOG = logging.getLogger(__name__)
 
+IGNORABLE_NODES = {'start-of-file', 'end-of-file'}
+
 FORTRAN_PYTHON_FORMAT_SPEC = {
     'a': str,
     'i': int,
@@ -43,15 +47,81 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
     Typed Python AST is provided by typed-ast package.
     """
 
-    def __init__(self, split_declarations: bool = True):
+    def __init__(self, split_declarations: bool = True, lazy_typing: bool = False):
+        """Initialize new FortranAstGeneralizer instance.
+
+        If lazy_typing is True, generalized AST is not statically typed right away,
+        and typed() has to be used to get typed version of each needed part of the AST.
+        """
         super().__init__(Language.find('Fortran 2008'))
         self._split_declarations = split_declarations
         self._now_parsing_file = False
+        self.lazy_typing = lazy_typing
+        self._typed_nodes = \
+            weakref.WeakKeyDictionary()  # type: t.MutableMapping[typed_ast3.AST, typed_ast3.AST]
+
+    @staticmethod
+    def is_ignorable(node: ET.Element) -> bool:
+        """Determine if a given node is never used in generalization.
+
+        Such nodes are markers of file boundaries and markers of beginnings of lists.
+        Empty nodes marking ends of lists are not among them, because they distinguish
+        calls without arguments from plain names.
+        """
+        return node.tag in IGNORABLE_NODES or node.tag.endswith('__begin')
 
     def generalize(self, syntax: ET.Element):
         self._now_parsing_file = False
         generalized = super().generalize(syntax)
-        return st.augment(generalized, eval_=False, locals_={'np': np, 'st': st})
+        if self.lazy_typing:
+            return generalized
+        return self.typed(generalized)
+
+    def generalize_units(self, units: t.Iterable[ET.Element]) -> typed_ast3.Module:
+        """Generalize top-level nodes of a single file, given one by one.
+
+        Result is the same as of generalizing the whole file at once, but each node can be
+        discarded as soon as it is generalized -- see FortranParser.iterparse_units().
+        Unless typing is lazy, generalized nodes are also statically typed one by one.
+        """
+        self._import_statements = dict()
+        self._now_parsing_file = True
+        body = []
+        for unit in units:
+            if self.is_ignorable(unit):
+                continue
+            generalized = self.transform_all([unit])
+            flatten_syntax[typed_ast3](generalized)
+            if not self.lazy_typing:
+                generalized = [self.typed(_) for _ in generalized]
+            body += generalized
+        self._now_parsing_file = False
+        module = typed_ast3.Module(body=self.import_statements + body, type_ignores=[])
+        if self.lazy_typing:
+            return module
+        return self.typed(module)
+
+    def typed(self, syntax: typed_ast3.AST) -> typed_ast3.AST:
+        """Get statically typed version of a given generalized AST node.
+
+        Typing of each node is done only once, and a module is typed statement by statement,
+        so that statements that were already typed before (e.g. single functions) are reused.
+        """
+        if isinstance(syntax, st.nodes.StaticallyTyped[typed_ast3]):
+            return syntax
+        typed_syntax = self._typed_nodes.get(syntax)
+        if typed_syntax is not None:
+            return typed_syntax
+        if isinstance(syntax, typed_ast3.Module):
+            typed_syntax = typed_ast3.Module(
+                body=[self.typed(_) for _ in syntax.body], type_ignores=syntax.type_ignores)
+            typed_syntax = st.nodes.StaticallyTypedModule[typed_ast3].from_other(typed_syntax)
+            AST_ANNOTATIONS.copy(syntax, typed_syntax)
+        else:
+            typed_syntax = preserving_annotations(st.augment, syntax, eval_=False,
+                                                  locals_={'np': np, 'st': st})
+        self._typed_nodes[syntax] = typed_syntax
+        return typed_syntax
 
     def _ofp(self, node: ET.Element):
         assert len(node) == 1
@@ -60,7 +130,7 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
     def _file(self, node: ET.Element) -> t.Union[typed_ast3.Module, typed_ast3.Expr]:
         if not self._now_parsing_file:
             self._now_parsing_file = True
-            body = self.transform_all_subnodes(node, ignored={'start-of-file', 'end-of-file'})
+            body = self.transform_all_subnodes(node, ignored=IGNORABLE_NODES)
             self._now_parsing_file = False
             body = self.import_statements + body
         else:
@@ -149,7 +219,7 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
             members = self.transform_all_subnodes(members_node, ignored={
                 'internal-subprogram', 'internal-subprogram-part'})
             assert members
-            function_def.fortran_metadata = {'contains': members}
+            annotate_ast(function_def, 'fortran_metadata', {'contains': members})
         return function_def
 
     def _arguments(self, node: ET.Element) -> typed_ast3.arguments:
@@ -187,8 +257,7 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
                 args.append(typed_ast3.Num(int(stop_code)))
             finally:
                 if not args:
-                    _LOG.warning('ignoring exit code in """%s"""',
-                                 ET.tostring(node).decode().rstrip())
+                    _LOG.warning('ignoring exit code in """%s"""', lazy_xml(node))
         return typed_ast3.Call(func=typed_ast3.Name(id='exit', ctx=typed_ast3.Load()),
                                args=args, keywords=[])
 
@@ -207,7 +276,7 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
     def _declaration(self, node: ET.Element) -> typed_ast3.AnnAssign:
         declaration_type = node.attrib.get('type', None)
         if declaration_type is None:
-            _LOG.warning('declaration without a type:\n%s', ET.tostring(node).decode().rstrip())
+            _LOG.warning('declaration without a type:\n%s', lazy_xml(node))
             return self.transform_all_subnodes(node, ignored={})
         if declaration_type in {'implicit', 'variable', 'parameter', 'include', 'data', 'common',
                                 'external', 'save'}:
@@ -244,7 +313,7 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
         implicit = typed_ast3.AnnAssign(
             target=typed_ast3.Name(id='implicit', ctx=typed_ast3.Store()), annotation=annotation,
             value=None, simple=True)
-        implicit.fortran_metadata = {'is_declaration': True}
+        annotate_ast(implicit, 'fortran_metadata', {'is_declaration': True})
         return implicit
 
     def _letter_ranges(self, node) -> t.List[typed_ast3.Str]:
@@ -278,7 +347,7 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
 
         # dimensionality information (only for array types)
         dimensions_node = node.find('./dimensions')
-        variable_dimensions = [getattr(var, 'fortran_metadata', {}).get('dimensions', None)
+        variable_dimensions = [get_annotation(var, 'fortran_metadata', {}).get('dimensions', None)
                                for var in variables]
         has_variable_dimensions = any([_ is not None for _ in variable_dimensions])
         if has_variable_dimensions and not self._split_declarations:
@@ -292,7 +361,7 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
                     .format(ET.tostring(node).decode().rstrip()))
             _LOG.warning(
                 'prioritizing per-variable dimensions over declaration dimension data in:\n%s',
-                ET.tostring(node).decode().rstrip())
+                lazy_xml(node))
         if dimensions_node is not None:
             dimensions = self.transform_one(dimensions_node)
             assert len(dimensions) >= 1
@@ -347,7 +416,7 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
         if metadata:
             new_assignments = []
             for assignment in assignments:
-                assignment.fortran_metadata = metadata
+                annotate_ast(assignment, 'fortran_metadata', metadata)
                 new_assignments.append(assignment)
                 new_assignments.append(metadata_node)
             assignments = new_assignments
@@ -368,7 +437,7 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
         for constant, value in constants:
             assert isinstance(constant, typed_ast3.AST)
             assignment = typed_ast3.Assign(targets=[constant], value=value, type_comment=None)
-            assignment.fortran_metadata = {'is_constant': True}
+            annotate_ast(assignment, 'fortran_metadata', {'is_constant': True})
             assignments.append(assignment)
         return assignments
 
@@ -445,7 +514,7 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
         var = typed_ast3.Name(id='format_label_{}'.format(label), ctx=typed_ast3.Store())
         annotation = typed_ast3.Str('Fortran label', '')
         format_ = typed_ast3.AnnAssign(target=var, annotation=annotation, value=value, simple=True)
-        format_.fortran_metadata = {'is_format': True}
+        annotate_ast(format_, 'fortran_metadata', {'is_format': True})
         return format_
 
     def _format_items(self, node) -> typed_ast3.JoinedStr:
@@ -675,7 +744,7 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
                 else:
                     assert isinstance(case, typed_ast3.AST), type(case)
                     items.append(case)
-                _LOG.debug('accumulated %s', [horast.unparse(_) for _ in items])
+                _LOG.debug('accumulated %s', lazy_unparse(items))
                 continue
             assert not isinstance(case.test, list), case.test
             if get_annotation(case, 'is_default_case'):
@@ -688,7 +757,7 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
                 op_ = typed_ast3.Eq()
             case.test = typed_ast3.Compare(left=var, ops=[op_], comparators=[case.test])
             if items:
-                _LOG.debug('prepending %s', [horast.unparse(_) for _ in items])
+                _LOG.debug('prepending %s', lazy_unparse(items))
                 case.body = items + case.body
                 items = []
             if first_case is None:
@@ -700,8 +769,8 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
             prev_case = case
         if items:
             prev_case.body += items
-            _LOG.debug('appending %s', [horast.unparse(_) for _ in items])
-        first_case.fortran_metadata = {'is_select': True}
+            _LOG.debug('appending %s', lazy_unparse(items))
+        annotate_ast(first_case, 'fortran_metadata', {'is_select': True})
         return first_case
 
     def _case(self, node: ET.Element) -> t.Union[typed_ast3.If, t.List[typed_ast3.AST]]:
@@ -714,8 +783,7 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
             header = self.transform_all_subnodes(header_node, ignored={
                 'executable-construct', 'execution-part-construct'})
             if len(header) > 1:
-                _LOG.warning('many case values: %s',
-                             [typed_astunparse.unparse(_).rstrip() for _ in header])
+                _LOG.warning('many case values: %s', lazy_unparse(header))
                 header = [typed_ast3.Tuple(elts=header, ctx=typed_ast3.Load())]
         body = self._if_body(self.get_one(node, './body'))
         if type_ not in {'specific', 'default'}:
@@ -809,10 +877,10 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
                     ctx=typed_ast3.Load()))])
             assert isinstance(var, typed_ast3.AST)
             assignment = typed_ast3.Assign(targets=[var], value=val, type_comment=None)
-            assignment.fortran_metadata = {'is_allocation': True}
+            annotate_ast(assignment, 'fortran_metadata', {'is_allocation': True})
             assignments.append(assignment)
-            assignments.append(horast_nodes.Comment(
-                ' Fortran metadata: {}'.format(repr(assignment.fortran_metadata)), True))
+            assignments.append(horast_nodes.Comment(' Fortran metadata: {}'.format(
+                repr(get_annotation(assignment, 'fortran_metadata'))), True))
         return assignments
 
     def _deallocate(self, node: ET.Element) -> typed_ast3.Delete:
@@ -850,14 +918,14 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
                 if name_node is not None else False
             if is_intrinsic:
                 if isinstance(call, typed_ast3.Call):
-                    call.fortran_metadata = {'is_procedure_call': True}
+                    annotate_ast(call, 'fortran_metadata', {'is_procedure_call': True})
                 return call
-            _LOG.warning('called an ambiguous node:\n%s', ET.tostring(node).decode().rstrip())
+            _LOG.warning('called an ambiguous node:\n%s', lazy_xml(node))
             call = typed_ast3.Call(func=call, args=[], keywords=[])
         if isinstance(call.func, typed_ast3.Name) and call.func.id.startswith('MPI_'):
             call = self._transform_mpi_call(call)
         if isinstance(call, typed_ast3.Call):
-            call.fortran_metadata = {'is_procedure_call': True}
+            annotate_ast(call, 'fortran_metadata', {'is_procedure_call': True})
         return call
 
     def _write(self, node) -> t.Union[typed_ast3.Expr, typed_ast3.Assign]:
@@ -897,8 +965,7 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
         if io_controls:
             _LOG.info(
                 'ignoring remaining %i parameters of read call %s in"\n%s',
-                len(io_controls), [typed_astunparse.unparse(_) for _ in io_controls],
-                ET.tostring(node).decode().rstrip())
+                len(io_controls), lazy_unparse(io_controls), lazy_xml(node))
         assert all(isinstance(input_, typed_ast3.AST) for input_ in inputs), inputs
         return [
             typed_ast3.Assign(
@@ -1102,7 +1169,7 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
 
     def _pointer_assignment(self, node: ET.Element):
         assignment = self._assignment(node)
-        assignment.fortran_metadata = {'is_pointer_assignment': True}
+        annotate_ast(assignment, 'fortran_metadata', {'is_pointer_assignment': True})
         return assignment
 
     def _operation(self, node: ET.Element) -> typed_ast3.AST:
@@ -1215,9 +1282,9 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
         operand = self.transform_all_subnodes(node, ignored={
             'add-operand__add-op', 'mult-operand__mult-op', 'and-operand__not-op'})
         if len(operand) != 1:
-            _LOG.warning('%s', ET.tostring(node).decode().rstrip())
+            _LOG.warning('%s', lazy_xml(node))
             # _LOG.error("%s", operand)
-            _LOG.error([typed_astunparse.unparse(_).rstrip() for _ in operand])
+            _LOG.error('%s', lazy_unparse(operand))
             raise SyntaxError(
                 'expected exactly one operand but got {} in:\n{}'
                 .format(len(operand), ET.tostring(node).decode().rstrip()))
@@ -1330,8 +1397,7 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
                         value=type_, slice=typed_ast3.Index(value=length), ctx=typed_ast3.Load())
                 else:
                     _LOG.warning(
-                        'ignoring string length "%s" in:\n%s',
-                        length, ET.tostring(node).decode().rstrip())
+                        'ignoring string length "%s" in:\n%s', length, lazy_xml(node))
             return type_
         elif length is not None:
             self.ensure_import('numpy', 'np')
@@ -1400,7 +1466,7 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
         if dimensions_node is not None:
             metadata['dimensions'] = self.transform_one(dimensions_node)
         if metadata:
-            variable.fortran_metadata = metadata
+            annotate_ast(variable, 'fortran_metadata', metadata)
         return variable, value
 
     def _names(self, node: ET.Element) -> typed_ast3.arguments:
@@ -1578,7 +1644,7 @@ class FortranAstGeneralizer(XmlAstGeneralizer):
             end = node.attrib['value'][-1]
             assert begin == end
             return typed_ast3.Str(node.attrib['value'][1:-1], '')
-        _LOG.warning('%s', ET.tostring(node).decode().rstrip())
+        _LOG.warning('%s', lazy_xml(node))
         raise NotImplementedError('literal type "{}" not supported'.format(literal_type))
 
 
@@ -5,7 +5,7 @@ import typing as t
 import typed_ast.ast3 as typed_ast3
 
 from ..general.misc import dict_mirror
-from ..pair import make_slice_from_call
+from ..pair import annotate_ast, get_annotation, make_slice_from_call
 
 
 def attribute_chain_components(attribute: typed_ast3.Attribute) -> t.List[typed_ast3.AST]:
@@ -181,9 +181,11 @@ INTRINSICS_PYTHON_TO_FORTRAN = dict_mirror(INTRINSICS_FORTRAN_TO_PYTHON)
 
 
 def _transform_print_call(call):
-    if not hasattr(call, 'fortran_metadata'):
-        call.fortran_metadata = {}
-    call.fortran_metadata['is_transformed'] = True
+    metadata = get_annotation(call, 'fortran_metadata')
+    if metadata is None:
+        annotate_ast(call, 'fortran_metadata', {'is_transformed': True})
+    else:
+        metadata['is_transformed'] = True
     if len(call.args) == 1:
         arg = call.args[0]
         if isinstance(arg, typed_ast3.Call) and isinstance(arg.func, typed_ast3.Attribute):
@@ -1,18 +1,173 @@
 """Fortran Parser which simply delegates the work to Open Fortran Parser XML generator."""
 
+import concurrent.futures
+import logging
+import os
 import pathlib
+import subprocess
+import tempfile
+import typing as t
 import xml.etree.ElementTree as ET
 
-import open_fortran_parser
+from open_fortran_parser.config import JAVA as java_config
 
 from ..general import Parser
 from ..general.tools import summarize_completed_process
+from .ast_generalizer import FortranAstGeneralizer
+
+_LOG = logging.getLogger(__name__)
+
+OFP_EXECUTABLE = pathlib.Path('open_fortran_parser')
+
+# for short-lived parser processes, full JIT compilation costs more than it saves
+OFP_BATCH_JAVA_OPTIONS = ['-XX:+TieredCompilation', '-XX:TieredStopAtLevel=1', '-Xshare:auto']
+
+
+def _ofp_command(input_path: pathlib.Path, verbosity: int,
+                 extra_java_options: t.Sequence[str] = ()) -> t.List[str]:
+    """Create command equivalent to the one run by open_fortran_parser.execute_parser()."""
+    command = [str(java_config['executable'])]
+    if java_config['classpath'] is not None:
+        command += ['-cp', str(java_config['classpath'])]
+    if java_config['options'] is not None:
+        command += java_config['options']
+    command += extra_java_options
+    command += [java_config['ofp_class'], '--class', java_config['ofp_xml_class'],
+                '--verbosity', str(verbosity), str(input_path)]
+    return command
 
 
 class FortranParser(Parser):
 
+    """Parse Fortran code into XML using Open Fortran Parser.
+
+    Output of the parser is parsed as it is being produced. Unless prune is False, nodes
+    that FortranAstGeneralizer never uses are dropped from the XML as soon as they are
+    complete, which reduces memory use.
+    """
+
+    def __init__(self, default_scopes: t.Sequence[t.Tuple[int, t.Optional[int]]] = None,
+                 prune: bool = True):
+        super().__init__(default_scopes)
+        self.prune = prune
+
     def _parse_scope(self, code: str, path: pathlib.Path = None) -> ET.Element:
         assert path is not None, path
-        result = open_fortran_parser.execute_parser(path, None, verbosity=100)
-        summarize_completed_process(result, executable=pathlib.Path('open_fortran_parser'))
-        return ET.fromstring(result.stdout)
+        return self._parse_file(_ofp_command(path, 100))
+
+    def _parse_file(self, command: t.List[str]) -> ET.Element:
+        """Run the parser and build the XML tree incrementally from its output."""
+        _LOG.debug('executing %s...', command)
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr)
+            try:
+                root = None
+                events = ET.iterparse(process.stdout, events=('start', 'end'))
+                for root, _ in self._pruned_end_events(events):
+                    pass
+            except ET.ParseError:
+                self._finish(process, stderr, command)
+                raise
+            finally:
+                process.stdout.close()
+            self._finish(process, stderr, command)
+        return root
+
+    def _pruned_end_events(self, events: t.Iterable[t.Tuple[str, ET.Element]]) \
+            -> t.Iterator[t.Tuple[ET.Element, t.List[ET.Element]]]:
+        """Drop ignorable nodes as soon as they are complete, and yield the remaining ones.
+
+        Along with each yielded node, the current list of its ancestors is given.
+        """
+        ancestors = []  # type: t.List[ET.Element]
+        for event, node in events:
+            if event == 'start':
+                ancestors.append(node)
+                continue
+            ancestors.pop()
+            if self.prune and ancestors and FortranAstGeneralizer.is_ignorable(node):
+                ancestors[-1].remove(node)
+                continue
+            yield node, ancestors
+
+    def parse_files(
+            self, paths: t.Iterable[pathlib.Path], workers: t.Optional[int] = None,
+            verbosity: int = 100) -> t.Dict[pathlib.Path, t.Union[ET.Element, Exception]]:
+        """Parse many files concurrently, using a pool of threads.
+
+        Each thread runs a separate parser process, and thus starts a new JVM, for every file.
+        Result maps each path to its XML tree or, if parsing of that file failed, to the
+        exception that was raised -- so that one invalid file does not stop the whole batch.
+
+        By default, there are as many threads, and so at most as many parser processes
+        running at the same time, as there are CPUs.
+        """
+        paths = list(paths)
+        for path in paths:
+            assert isinstance(path, pathlib.Path), type(path)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        results = {}  # type: t.Dict[pathlib.Path, t.Union[ET.Element, Exception]]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self._parse_file_in_batch, path, verbosity): path
+                       for path in paths}
+            for future in concurrent.futures.as_completed(futures):
+                path = futures[future]
+                try:
+                    results[path] = future.result()
+                except (RuntimeError, ET.ParseError) as err:
+                    _LOG.warning('failed to parse "%s": %s', path, err)
+                    results[path] = err
+        return {path: results[path] for path in paths}
+
+    def _parse_file_in_batch(self, path: pathlib.Path, verbosity: int) -> ET.Element:
+        return self._parse_file(_ofp_command(path, verbosity, OFP_BATCH_JAVA_OPTIONS))
+
+    def iterparse_units(self, path: pathlib.Path, verbosity: int = 100) -> t.Iterator[ET.Element]:
+        """Parse a given file and yield its top-level nodes one by one, as soon as each is complete.
+
+        Program units (i.e. programs, modules, subroutines and functions), as well as comments
+        and other nodes between them, are read incrementally from the output of the parser,
+        and each node is detached from the tree after it is consumed -- so that at any time
+        only the unit being processed is kept in memory, instead of the whole XML.
+        """
+        assert isinstance(path, pathlib.Path), type(path)
+        command = _ofp_command(path, verbosity)
+        _LOG.debug('executing %s...', command)
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr)
+            try:
+                yield from self._iterparse_file_nodes(process.stdout)
+            except GeneratorExit:
+                process.kill()
+                process.wait()
+                raise
+            except ET.ParseError:
+                self._finish(process, stderr, command)
+                raise
+            finally:
+                process.stdout.close()
+            self._finish(process, stderr, command)
+
+    def _iterparse_file_nodes(self, stream: t.BinaryIO) -> t.Iterator[ET.Element]:
+        """Yield each top-level node only after the next node in the file ends.
+
+        Text that follows a node (its tail) is known only after the next tag is read.
+        """
+        events = ET.iterparse(stream, events=('start', 'end'))
+        completed = None  # type: t.Optional[t.Tuple[ET.Element, ET.Element]]
+        for node, ancestors in self._pruned_end_events(events):
+            if completed is not None:
+                unit, parent = completed
+                completed = None
+                yield unit
+                parent.remove(unit)
+            if len(ancestors) == 2:
+                completed = node, ancestors[-1]
+        assert completed is None, completed
+
+    def _finish(self, process: subprocess.Popen, stderr: t.BinaryIO, command: t.List[str]):
+        process.wait()
+        stderr.seek(0)
+        result = subprocess.CompletedProcess(command, process.returncode, b'', stderr.read())
+        summarize_completed_process(result, executable=OFP_EXECUTABLE)
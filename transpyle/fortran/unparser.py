@@ -6,6 +6,8 @@ import copy
 import io
 import itertools
 import logging
+import sys
+import typing as t
 
 from astunparse.unparser import INFSTR
 import horast
@@ -18,6 +20,7 @@ from ..pair import \
     has_annotation, get_annotation, is_ast_none, \
     function_returns, syntax_matches, _match_array, _match_io, returns_array
 from ..general import Language, Unparser
+from ..general.misc import lazy_dump
 from ..general.unparser import unparsing_unsupported
 from .definitions import \
     attribute_chain_components, \
@@ -26,6 +29,164 @@ from .definitions import \
 _LOG = logging.getLogger(__name__)
 
 
+class FunctionAnalysis:
+
+    """Facts about one function that are needed by Fortran unparser.
+
+    Return statements and loops are collected in a single pre-order traversal of the function.
+    """
+
+    def __init__(self, function: typed_ast3.FunctionDef):
+        self.function = function
+        self.returns = function_returns(function)
+        self.returns_array = self.returns and returns_array(function)
+        self.kind = 'function' if self.returns and not self.returns_array else 'subroutine'
+        self.annotated_args = [arg for arg in function.args.args if arg.annotation]
+        self.from_python = bool(self.annotated_args)
+        self.docstring = typed_ast3.get_docstring(function)
+        self.generic_var_formulas = {}  # type: t.Dict[str, typed_ast3.Attribute]
+        self.return_values = []  # type: t.List[typed_ast3.AST]
+        self.loops = []  # type: t.List[typed_ast3.For]
+        self._analyze_args()
+        self._analyze_body()
+
+    def _analyze_args(self):
+        for arg in self.function.args.args:
+            if not hasattr(arg, 'resolved_annotation') or not _match_array(arg.resolved_annotation):
+                continue
+            shape = arg.resolved_annotation.slice.value.elts[2]
+            for i, value in enumerate(shape.elts):
+                if isinstance(value, typed_ast3.Name):
+                    assert len(shape.elts) == 1 and i == 0, 'only 1D generic arrays supported'
+                    self.generic_var_formulas[value.id] = typed_ast3.Attribute(
+                        value=typed_ast3.Name(id=arg.arg, ctx=typed_ast3.Load()),
+                        attr='size', ctx=typed_ast3.Load())
+                    _LOG.warning('generic size %s', shape)
+
+    def _analyze_body(self):
+        nodes = [self.function]
+        while nodes:
+            node = nodes.pop()
+            if isinstance(node, typed_ast3.Return):
+                if node.value is not None:
+                    self.return_values.append(node.value)
+            elif isinstance(node, typed_ast3.For):
+                self.loops.append(node)
+            nodes += reversed(list(typed_ast3.iter_child_nodes(node)))
+
+    def returned_name(self) -> str:
+        """Get the name returned by all return statements of the function."""
+        if not self.return_values:
+            raise SyntaxError('expected return statements in function "{}" but zero found'
+                              .format(self.function.name))
+        returned_name = None
+        for return_value in self.return_values:
+            assert isinstance(return_value, typed_ast3.Name), 'only simple name can be returned'
+            if returned_name is None:
+                returned_name = return_value.id
+            else:
+                assert returned_name == return_value.id, \
+                    'all return statements must return the same name'
+        return returned_name
+
+
+class FortranLineEmitter:
+
+    """Write Fortran code to a given file, wrapping too long lines.
+
+    Text is collected until the end of each line, and then the line is wrapped once:
+    in fixed form, by continuation lines marked in column 6, and in free form by '&'.
+    A line is broken only between pieces of text given to write(), except that a string
+    literal that does not fit in a whole continuation line is split into parts.
+
+    Text written while wrapping is False is never moved to a continuation line.
+    Prefix of continuation lines (excluding the '&' at the end of the previous line
+    in free form) should be set via continuation, before the text of each line is written.
+    """
+
+    def __init__(self, file, fixed_form: bool = True, max_line_len: t.Optional[int] = 72):
+        self.file = file
+        self.fixed_form = fixed_form
+        self.max_line_len = max_line_len
+        self.wrapping = True
+        self.continuation = '      +' if fixed_form else ''
+        self._texts = []  # type: t.List[str]
+        self._unwrappable = set()  # type: t.Set[int]
+        self._line_len = 0
+
+    def write(self, text: str) -> None:
+        if '\n' in text:
+            lines = text.split('\n')
+            self.write(lines[0])
+            for line in lines[1:]:
+                self._write_line()
+                self.file.write('\n')
+                self.write(line)
+            return
+        if not text:
+            return
+        if not self.wrapping:
+            self._unwrappable.add(len(self._texts))
+        self._texts.append(text)
+        self._line_len += len(text)
+
+    def flush(self) -> None:
+        self._write_line()
+        self.file.flush()
+
+    def _write_line(self) -> None:
+        if self.max_line_len is None or self._line_len <= self.max_line_len:
+            self.file.write(''.join(self._texts))
+        else:
+            self.file.write(''.join(self._wrapped_line()))
+        self._texts = []
+        self._unwrappable = set()
+        self._line_len = 0
+
+    def _wrapped_line(self) -> t.List[str]:
+        line_end = '' if self.fixed_form else ' &'
+        continuation_len = len(self.continuation)
+        last = len(self._texts) - 1
+        wrapped = []
+        line_len = 0
+        for i, text in enumerate(self._texts):
+            if i in self._unwrappable \
+                    or line_len + len(text) + (0 if i == last else len(line_end)) \
+                    <= self.max_line_len:
+                pass
+            elif continuation_len + len(text) > self.max_line_len and _is_string_literal(text):
+                line_len = self._split_string_literal(text, wrapped, line_len)
+                continue
+            else:
+                wrapped += [line_end, '\n', self.continuation]
+                line_len = continuation_len
+            wrapped.append(text)
+            line_len += len(text)
+        return wrapped
+
+    def _split_string_literal(self, text: str, wrapped: t.List[str], line_len: int) -> int:
+        """Split a string literal across continuation lines, and return length of last line.
+
+        Content of the literal continues right after the continuation mark -- in fixed form
+        in column 7, and in free form after the '&' that begins the continuation line.
+        """
+        if self.fixed_form:
+            line_end, continuation = '', '      +'
+        else:
+            line_end, continuation = '&', '{}&'.format(self.continuation)
+        while line_len + len(text) > self.max_line_len:
+            split_at = max(self.max_line_len - line_len - len(line_end), 1)
+            wrapped += [text[:split_at], line_end, '\n', continuation]
+            text = text[split_at:]
+            line_len = len(continuation)
+        wrapped.append(text)
+        return line_len + len(text)
+
+
+def _is_string_literal(text: str) -> bool:
+    return len(text) >= 2 and text[0] in ('"', "'") and text[-1] == text[0]
+
+
 class Fortran77UnparserBackend(horast.unparser.Unparser):
 
     """Implementation of Fortran 77 unparser."""
@@ -33,47 +194,39 @@ class Fortran77UnparserBackend(horast.unparser.Unparser):
     lang_name = 'Fortran 77'
 
     def __init__(
-            self, *args, indent: int = 2, fixed_form: bool = True, max_line_len: int = 72,
-            **kwargs):
+            self, tree, file=sys.stdout, *args, indent: int = 2, fixed_form: bool = True,
+            max_line_len: int = 72, **kwargs):
         self._indent_level = indent
         self._fixed_form = fixed_form
-        self._line_len = 0
         self._max_line_len = max_line_len
         self._context = None
         self._context_input_args = False
-        self._syntax = args[0]
-        super().__init__(*args, **kwargs)
+        self._analyses = {}  # type: t.Dict[int, FunctionAnalysis]
+        self._syntax = tree
+        file = FortranLineEmitter(file, fixed_form, max_line_len)
+        super().__init__(tree, file, *args, **kwargs)
 
     @contextlib.contextmanager
     def _ignore_max_line_len(self):
         _max_line_len = self._max_line_len
         self._max_line_len = None
+        self.f.wrapping = False
         yield
         self._max_line_len = _max_line_len
+        self.f.wrapping = True
 
     def fill(self, text='', continuation: bool = False):
         self.write('\n')
+        indentation = ' ' * (self._indent_level * self._indent)
         if self._fixed_form:
+            self.f.continuation = '      +' + indentation
             self.write('      ')
             self.write('+' if continuation else ' ')
-        self.write(' ' * (self._indent_level * self._indent))
+        else:
+            self.f.continuation = indentation + ' ' * self._indent_level
+        self.write(indentation)
         self.write(text)
 
-    def write(self, text):
-        if text == '\n':
-            self._line_len = 0
-        elif '\n' in text:
-            raise NotImplementedError('long text printing not yet implemented')
-        if not self._fixed_form:
-            if self._max_line_len is not None and self._line_len + len(text) > self._max_line_len:
-                super().write(' &')
-                self.fill(' ' * self._indent_level)
-        if self._fixed_form:
-            if self._max_line_len is not None and self._line_len + len(text) > self._max_line_len:
-                self.fill('', continuation=True)
-        super().write(text)
-        self._line_len += len(text)
-
     def enter(self):
         self._indent += 1
 
@@ -197,7 +350,7 @@ class Fortran77UnparserBackend(horast.unparser.Unparser):
         interleave(lambda: self.write(', '), self.dispatch, t.names)
 
     def _Assign(self, t):
-        metadata = getattr(t, 'fortran_metadata', {})
+        metadata = get_annotation(t, 'fortran_metadata', {})
         if get_annotation(t, 'is_nullification'):
             self.fill('nullify(')
             interleave(lambda: self.write(', '), self.dispatch, t.targets)
@@ -265,7 +418,7 @@ class Fortran77UnparserBackend(horast.unparser.Unparser):
             self.write(' ')
             self.dispatch(t.annotation)
             return
-        metadata = getattr(t, 'fortran_metadata', {})
+        metadata = get_annotation(t, 'fortran_metadata', {})
         if metadata.get('is_format', False):
             self.write(t.target.id.replace('format_label_', ''))
             self.write(' ')
@@ -285,7 +438,7 @@ class Fortran77UnparserBackend(horast.unparser.Unparser):
         assert self._context is not None
         function = self._context
         if t.value:
-            if function_returns(function) and returns_array(function):
+            if self._analyze(function).returns_array:
                 pass
             else:
                 self.fill(function.name)
@@ -346,89 +499,39 @@ class Fortran77UnparserBackend(horast.unparser.Unparser):
     def _ClassDef(self, t):
         self._unsupported_syntax(t)
 
+    def _analyze(self, function: typed_ast3.FunctionDef) -> 'FunctionAnalysis':
+        if id(function) not in self._analyses:
+            self._analyses[id(function)] = FunctionAnalysis(function)
+        return self._analyses[id(function)]
+
     def _FunctionDef(self, t):
         self.write('\n')
         if t.decorator_list:
             self._unsupported_syntax(t)
-        function_kind = 'function' if function_returns(t) and not returns_array(t) else 'subroutine'
-        # function_kind = 'subroutine'  # TODO: temporary
-
-        from_python = False
-        if t.args:
-            # try:
-            annotated_args = [arg for arg in t.args.args if arg.annotation]
-            # except:
-            #    raise ValueError(horast.dump(t.args))
-            if annotated_args:
-                from_python = True
-        '''
-        if from_python:
-            assert isinstance(t, st.nodes.StaticallyTypedFunctionDef[typed_ast3])
-            try:
-                static_t = st.augment(t, eval_=False)
-            except:
-                import ipdb; ipdb.set_trace()
-            assert isinstance(static_t,
-                              st.nodes.StaticallyTypedFunctionDef[typed_ast3]), type(static_t)
-        '''
+        analysis = self._analyze(t)
+        function_kind = analysis.kind
+        from_python = analysis.from_python
         static_t = t
 
         # _LOG.warning('%s', type(self._syntax))
         # _LOG.warning('%s', self._syntax._module_vars)
         # for var in self._syntax._module_vars:
         #    if var._
-        generic_var_formulas = {}
-        for arg in t.args.args:
-            if hasattr(arg, 'resolved_annotation') and _match_array(arg.resolved_annotation):
-                shape = arg.resolved_annotation.slice.value.elts[2]
-                for index, value in enumerate(shape.elts):
-                    if isinstance(value, typed_ast3.Name):
-                        assert len(shape.elts) == 1 and index == 0, 'only 1D generic arrays supported'
-                        generic_var_formulas[value.id] = typed_ast3.Attribute(
-                            value=typed_ast3.Name(id=arg.arg, ctx=typed_ast3.Load()),
-                            attr='size', ctx=typed_ast3.Load())
-                        _LOG.warning('generic size %s', arg.resolved_annotation.slice.value.elts[2])
-            # _LOG.warning('%s', arg.resolved_annotation)
-            # _LOG.warning('%s', typed_ast3.dump(arg.resolved_annotation))
 
         # move return type into arguments
-        if function_kind == 'subroutine' and function_returns(t):
-
-            class Visitor(st.ast_manipulation.RecursiveAstVisitor[typed_ast3]):
-                return_expressions = []
-
-                def visit_node(self, node):
-                    if isinstance(node, typed_ast3.Return) and node.value is not None:
-                        self.return_expressions.append(node.value)
-            visitor = Visitor()
-            visitor.visit(static_t)
-            _LOG.warning('return expressions: %s', visitor.return_expressions)
-            if not visitor.return_expressions:
-                # import ipdb; ipdb.set_trace()
-                raise SyntaxError('expected return statements in function "{}" but zero found'
-                                  .format(t.name))
-            returned_name = None
-            for return_expression in visitor.return_expressions:
-                assert isinstance(return_expression, typed_ast3.Name), \
-                    'only simple name can be returned'
-                if returned_name is None:
-                    returned_name = return_expression.id
-                else:
-                    assert returned_name == return_expression.id, \
-                        'all return statements must return the same name'
-            # raise NotImplementedError('there are {} return expressions'
-            #                          .format(len(visitor.return_expressions)))
-            assert isinstance(returned_name, str)
+        if function_kind == 'subroutine' and analysis.returns:
+            _LOG.warning('return expressions: %s', analysis.return_values)
+            returned_name = analysis.returned_name()
 
         self.fill('{} {} ('.format(function_kind, t.name))
         self.dispatch(t.args)
-        if function_kind == 'subroutine' and function_returns(t):
+        if function_kind == 'subroutine' and analysis.returns:
             self.write(', ')
             self.write(returned_name)
         self.write(')')
         self.enter()
 
-        docstring = typed_ast3.get_docstring(t)
+        docstring = analysis.docstring
         # _LOG.warning(docstring)
         if docstring is not None:
             for stmt in t.body:
@@ -441,7 +544,7 @@ class Fortran77UnparserBackend(horast.unparser.Unparser):
         if from_python:
             self._context_input_args = True
             self.fill('! input arguments')
-            for arg in annotated_args:
+            for arg in analysis.annotated_args:
                 self.fill()
                 self.dispatch_var_type(arg.annotation)
                 self.write(', intent(in)')
@@ -451,7 +554,7 @@ class Fortran77UnparserBackend(horast.unparser.Unparser):
             self._context_input_args = False
 
         if function_kind == 'subroutine':
-            if function_returns(t):
+            if analysis.returns:
                 self.fill('! output arguments')
                 self.fill()
                 self.dispatch_var_type(t.returns)
@@ -479,21 +582,14 @@ class Fortran77UnparserBackend(horast.unparser.Unparser):
         if from_python and static_t._local_vars:
             self.fill('! local vars')
             for var in static_t._local_vars:
-
-                class Visitor(st.ast_manipulation.RecursiveAstVisitor[typed_ast3]):
-                    def visit_node(self, node):
-                        if isinstance(node, typed_ast3.For) and node.target.id == var \
-                                and node.type_comment is not None:
-                            node.type_comment = None
-                            declaration = typed_ast3.AnnAssign(
-                                target=node.target, value=None, annotation=node.resolved_type_comment)
-                            raise ValueError(declaration)
-                visitor = Visitor()
-                try:
-                    visitor.visit(static_t)
+                for node in analysis.loops:
+                    if node.target.id == var and node.type_comment is not None:
+                        node.type_comment = None
+                        self.dispatch(typed_ast3.AnnAssign(
+                            target=node.target, value=None, annotation=node.resolved_type_comment))
+                        break
+                else:
                     self.fill('! oh la la')
-                except ValueError as err:
-                    self.dispatch(err.args[0])
                 # for stmt in static_t.body:
                 #    if isinstance(stmt, typed_ast3.For) and stmt.type_comment is not None:
                 #        stmt.type_comment = None
@@ -512,7 +608,7 @@ class Fortran77UnparserBackend(horast.unparser.Unparser):
             self.dispatch(stmt)
         self._context = None
 
-        metadata = getattr(t, 'fortran_metadata', {})
+        metadata = get_annotation(t, 'fortran_metadata', {})
         if 'contains' in metadata:
             self.write('\n')
             self.fill('contains')
@@ -543,7 +639,7 @@ class Fortran77UnparserBackend(horast.unparser.Unparser):
         self._unsupported_syntax(t)
 
     def _If(self, t):
-        metadata = getattr(t, 'fortran_metadata', {})
+        metadata = get_annotation(t, 'fortran_metadata', {})
         if metadata.get('is_select'):
             return self._select(t)
         elif metadata:
@@ -649,7 +745,7 @@ class Fortran77UnparserBackend(horast.unparser.Unparser):
 
     def _NameConstant(self, t):
         if t.value is None:
-            _LOG.info('possibly invalid Fortran in """%s"""', typed_astunparse.dump(t))
+            _LOG.info('possibly invalid Fortran in """%s"""', lazy_dump(t))
         self.write({
             None: 'none',
             False: '.false.',
@@ -707,17 +803,24 @@ class Fortran77UnparserBackend(horast.unparser.Unparser):
 
     binop = {'Add': '+', 'Sub': '-', 'Mult': '*', 'Div': '/', 'FloorDiv': '/', 'Pow': '**'}
 
+    binop_intrinsics = {
+        'LShift': 'ishft', 'RShift': 'ishft', 'BitOr': 'ior', 'BitXor': 'ieor', 'BitAnd': 'iand'}
+
     def _BinOp(self, binop):
-        if binop.op.__class__.__name__ in {
-                'Mod', 'LShift', 'RShift', 'BitOr', 'BitXor', 'BitAnd', 'MatMult'}:
+        if binop.op.__class__.__name__ in {'Mod', 'MatMult'}:
             # TODO: implement Mod through MODULO(n, p) intrinsic
-            # TODO: implement LShift through LSHIFT(n, p) intrinsic
-            # TODO: implement RShift through RSHIFT(n, p) intrinsic
-            # TODO: implement BitOr through IOR(k, j) intrinsic
-            # TODO: implement BitXor through IEOR(k, j) intrinsic
-            # TODO: implement BitAnd through IAND(k, j) intrinsic
             # TODO: implement MatMult through MATMUL(m1, m2) intrinsic
             raise NotImplementedError('not yet implemented: {}'.format(horast.dump(binop)))
+        if binop.op.__class__.__name__ in self.binop_intrinsics:
+            self.write(self.binop_intrinsics[binop.op.__class__.__name__])
+            self.write('(')
+            self.dispatch(binop.left)
+            self.write(', ')
+            if isinstance(binop.op, typed_ast3.RShift):
+                self.write('-')
+            self.dispatch(binop.right)
+            self.write(')')
+            return
         super()._BinOp(binop)
 
     cmpops = {
@@ -759,7 +862,7 @@ class Fortran77UnparserBackend(horast.unparser.Unparser):
         '''
 
     def _Call(self, t):
-        if getattr(t, 'fortran_metadata', {}).get('is_procedure_call', False):
+        if get_annotation(t, 'fortran_metadata', {}).get('is_procedure_call', False):
             self.write('call ')
         func_name = horast.unparse(t.func).strip()
         if has_annotation(t, 'is_mpi_call'):
@@ -819,7 +922,7 @@ class Fortran77UnparserBackend(horast.unparser.Unparser):
             t.args.insert(0, t.func.value)
             t.func = typed_ast3.Name(id='size', ctx=typed_ast3.Load())
         elif func_name in PYTHON_FORTRAN_INTRINSICS \
-                and not getattr(t, 'fortran_metadata', {}).get('is_transformed', False):
+                and not get_annotation(t, 'fortran_metadata', {}).get('is_transformed', False):
             new_func = PYTHON_FORTRAN_INTRINSICS[func_name]
             if isinstance(new_func, collections.abc.Callable):
                 self.dispatch(new_func(t))
@@ -973,6 +1076,8 @@ class Fortran77UnparserBackend(horast.unparser.Unparser):
 
 class Fortran77Unparser(Unparser):
 
+    parallel_unparsing = True
+
     def __init__(self):
         super().__init__(Language.find('Fortran 77'))
 
@@ -1000,6 +1105,8 @@ class Fortran2008UnparserBackend(Fortran77UnparserBackend):
 
 class Fortran2008Unparser(Unparser):
 
+    parallel_unparsing = True
+
     def __init__(self):
         super().__init__(Language.find('Fortran 2008'))
 
@@ -1,6 +1,7 @@
 """Generailzation of language-specific ASTs."""
 
 import collections.abc
+import inspect
 import itertools
 import logging
 import typing as t
@@ -9,7 +10,7 @@ import xml.etree.ElementTree as ET
 import typed_ast.ast3 as typed_ast3
 
 from .exc import ContinueIteration
-from .misc import flatten_syntax
+from .misc import flatten_sequence, flatten_syntax, lazy_xml
 from .registry import Registry
 
 _LOG = logging.getLogger(__name__)
@@ -39,18 +40,34 @@ class IdentityAstGeneralizer(AstGeneralizer):
         return syntax
 
 
+def _find_transforms(cls) -> t.Dict[str, t.Callable]:
+    """Map names of all single-underscore methods of a class to the functions implementing them."""
+    return {name: getattr(cls, name) for name in dir(cls)
+            if name.startswith('_') and not name.startswith('__')
+            and inspect.isfunction(getattr(cls, name))}
+
+
 class XmlAstGeneralizer(AstGeneralizer):
 
     """Generalize an XML-based AST.
 
     Limitation of XML node name recognition: dash '-' and underscore '_' are not differentiated,
     therefore <some_node> and <some-node> will be handled by the same handler (i.e. _some_node)
+
+    Handlers are found once per class, when the class is created. Lists of statements
+    are flattened only shallowly after each handler, and the whole generalized AST
+    is flattened once at the end of generalize().
     """
 
+    _transforms = {}  # type: t.Dict[str, t.Callable]
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._transforms = _find_transforms(cls)
+
     def __init__(self, scope=None, case_sensitive: bool = False):
         super().__init__(scope)
         self.case_sensitive = case_sensitive
-        self._transforms = [f for f in dir(self) if f.startswith('_') and not f.startswith('__')]
         self._import_statements = dict()
 
     @property
@@ -91,7 +108,9 @@ class XmlAstGeneralizer(AstGeneralizer):
 
     def generalize(self, syntax: ET.Element):
         self._import_statements = dict()
-        return self.transform_one(syntax)
+        generalized = self.transform_one(syntax)
+        flatten_syntax[typed_ast3](generalized)
+        return generalized
 
     def no_transform(self, node: ET.Element):
         raise NotImplementedError(
@@ -101,8 +120,8 @@ class XmlAstGeneralizer(AstGeneralizer):
                       parent: t.Optional[ET.Element] = None):
         """Transform a single node."""
         assert isinstance(node, ET.Element), type(node)
-        transform_name = '_{}'.format(node.tag.replace('-', '_'))
-        if transform_name not in self._transforms:
+        _transform = self._transforms.get('_{}'.format(node.tag.replace('-', '_')))
+        if _transform is None:
             if ignored and node.tag in ignored:
                 raise ContinueIteration()
             if warn:
@@ -111,7 +130,7 @@ class XmlAstGeneralizer(AstGeneralizer):
                 else:
                     _LOG.warning('no transformer available for node "%s", a subnode of "%s"',
                                  node.tag, parent.tag)
-                _LOG.debug('%s', ET.tostring(node).decode().rstrip())
+                _LOG.debug('%s', lazy_xml(node))
                 raise ContinueIteration()
             if parent is None:
                 raise NotImplementedError('no transformer available for node "{}":\n{}'
@@ -123,9 +142,8 @@ class XmlAstGeneralizer(AstGeneralizer):
         if ignored and node.tag in ignored:
             _LOG.info('ignoring existing transformer for %s', node.tag)
             raise ContinueIteration()
-        _transform = getattr(self, transform_name)
-        transformed = _transform(node)
-        flatten_syntax[typed_ast3](transformed)
+        transformed = _transform(self, node)
+        flatten_syntax[typed_ast3](transformed, recursive=False)
         return transformed
 
     def transform_all(
@@ -142,7 +160,7 @@ class XmlAstGeneralizer(AstGeneralizer):
                 transformed.append(self.transform_one(node, warn, ignored, parent))
             except ContinueIteration:
                 continue
-        flatten_syntax[typed_ast3](transformed)
+        flatten_sequence(transformed)
         return transformed
 
     def transform_all_subnodes(
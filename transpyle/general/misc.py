@@ -3,59 +3,111 @@
 import ast
 import collections.abc
 import typing as t
+import xml.etree.ElementTree as ET
 
+import horast
 import typed_ast.ast3 as typed_ast3
+import typed_astunparse
 
 
 def dict_mirror(dict_: dict):
     return {value: key for key, value in dict_.items() if value is not None}
 
 
+def _extend_flat(flat: t.List[t.Any], sequence: t.Iterable[t.Any]) -> None:
+    for elem in sequence:
+        if isinstance(elem, collections.abc.MutableSequence):
+            _extend_flat(flat, elem)
+        else:
+            flat.append(elem)
+
+
 def flatten_sequence(sequence: t.MutableSequence[t.Any]) -> None:
-    """Transform a given list of lists of lists (...) of lists into a flat list in-place."""
+    """Transform a given list of lists of lists (...) of lists into a flat list in-place.
+
+    Takes time linear in the total number of elements.
+    """
     assert isinstance(sequence, collections.abc.MutableSequence), type(sequence)
-    for i, elem in enumerate(sequence):
-        if isinstance(elem, collections.abc.MutableSequence):
-            flatten_sequence(elem)
-            for value in reversed(elem):
-                sequence.insert(i, value)
-            del sequence[i + len(elem)]
+    if not any(isinstance(elem, collections.abc.MutableSequence) for elem in sequence):
+        return
+    flat = []  # type: t.List[t.Any]
+    _extend_flat(flat, sequence)
+    sequence[:] = flat
+
+
+STATEMENT_LIST_FIELDS = ('body', 'orelse', 'handlers', 'finalbody')
 
 
 def make_flatten_syntax(ast_module):
 
-    def flatten_syntax(syntax: t.Union[ast_module.AST, t.MutableSequence[t.Any]]) -> None:
-        """Flatten all lists of lists within the given syntax in-place."""
-        if isinstance(syntax, (ast_module.Module, ast_module.FunctionDef, ast_module.ClassDef,
-                               ast_module.For, ast_module.While, ast_module.If, ast_module.With,
-                               ast_module.Try, ast_module.ExceptHandler,
-                               ast_module.AsyncFunctionDef, ast_module.AsyncFor,
-                               ast_module.AsyncWith)):
-            for node in syntax.body:
-                flatten_syntax(node)
-            flatten_sequence(syntax.body)
-            return
-        if isinstance(syntax, (ast_module.For, ast_module.While, ast_module.If, ast_module.Try,
-                               ast_module.AsyncFor)):
-            for node in syntax.orelse:
-                flatten_syntax(node)
-            flatten_sequence(syntax.orelse)
-            return
-        if isinstance(syntax, ast_module.Try):
-            for node in syntax.handlers:
-                flatten_syntax(node)
-            # flatten_sequence(syntax.handlers)  # unnecessary
-            for node in syntax.finalbody:
-                flatten_syntax(node)
-            flatten_sequence(syntax.finalbody)
+    def flatten_syntax(syntax: t.Union[ast_module.AST, t.MutableSequence[t.Any]],
+                       recursive: bool = True) -> None:
+        """Flatten all lists of lists within the given syntax in-place.
+
+        If recursive is False, only the given list, or lists of statements that are direct
+        fields of the given node, are flattened.
+        """
+        if isinstance(syntax, collections.abc.MutableSequence):
+            flatten_sequence(syntax)
+            if recursive:
+                for node in syntax:
+                    flatten_syntax(node)
             return
-        if not isinstance(syntax, collections.abc.MutableSequence):
+        if not isinstance(syntax, ast_module.AST):
             return
-        for node in syntax:
-            flatten_syntax(node)
-        flatten_sequence(syntax)
+        for field in STATEMENT_LIST_FIELDS:
+            value = getattr(syntax, field, None)
+            if isinstance(value, list):
+                flatten_syntax(value, recursive)
 
     return flatten_syntax
 
 
 flatten_syntax = {ast_module: make_flatten_syntax(ast_module) for ast_module in (ast, typed_ast3)}
+
+
+class LazyFormat:
+
+    """Object whose string representation is computed only when it is needed.
+
+    Meant to be passed as an argument of logging calls, so that serializing syntax for
+    diagnostics costs nothing when the message is not emitted, e.g.:
+
+    _LOG.debug('resolved %s', LazyFormat(horast.unparse, tree))
+    """
+
+    __slots__ = ('_function', '_args')
+
+    def __init__(self, function: t.Callable[..., t.Any], *args):
+        self._function = function
+        self._args = args
+
+    def __str__(self):
+        return str(self._function(*self._args))
+
+    __repr__ = __str__
+
+
+def _xml_to_str(node: ET.Element) -> str:
+    return ET.tostring(node).decode().rstrip()
+
+
+def _unparse_to_str(syntax) -> str:
+    if isinstance(syntax, collections.abc.Sequence):
+        return str([horast.unparse(_).strip() for _ in syntax])
+    return horast.unparse(syntax).strip()
+
+
+def lazy_xml(node: ET.Element) -> LazyFormat:
+    """Lazily serialize an XML node."""
+    return LazyFormat(_xml_to_str, node)
+
+
+def lazy_unparse(syntax: t.Union[typed_ast3.AST, t.Sequence[typed_ast3.AST]]) -> LazyFormat:
+    """Lazily unparse a Python AST, or a list of them."""
+    return LazyFormat(_unparse_to_str, syntax)
+
+
+def lazy_dump(syntax: typed_ast3.AST) -> LazyFormat:
+    """Lazily dump a Python AST."""
+    return LazyFormat(typed_astunparse.dump, syntax)
@@ -15,15 +15,30 @@ class Translator(Registry):
 
     """Translate from one programming language to another."""
 
-    def __init__(self, parser: Parser, ast_generalizer: AstGeneralizer, unparser: Unparser):
+    def __init__(self, parser: Parser, ast_generalizer: AstGeneralizer, unparser: Unparser,
+                 transformations: t.Sequence[t.Union[str, t.Callable[[t.Any], t.Any]]] = ()):
+        """Create translator, optionally with transformations of generalized AST.
+
+        Each transformation is either a callable that takes the generalized AST and returns
+        the transformed AST, or a pass of transpyle.pair.pass_manager (or its name).
+        They are applied by a pass manager in the given order before unparsing.
+        """
+        from ..pair.pass_manager import PassManager  # pair depends on general
+
         self.parser = parser
         self.ast_generalizer = ast_generalizer
         self.unparser = unparser
+        self.transformations = list(transformations)
+        self.pass_manager = PassManager(self.transformations)
+        self.general_ast = None
+        """Generalized AST from which code was unparsed in the most recent translation."""
 
     def translate(self, code: str, path: t.Optional[pathlib.Path] = None, parser_kwargs: dict = {},
                   ast_generalizer_kwargs: dict = {}, unparser_kwargs: dict = {}) -> str:
         specific_ast = self.parser.parse(code, path, **parser_kwargs)
         general_ast = self.ast_generalizer.generalize(specific_ast, **ast_generalizer_kwargs)
+        general_ast = self.pass_manager.run(general_ast)
+        self.general_ast = general_ast
         to_code = self.unparser.unparse(general_ast, **unparser_kwargs)
         return to_code
 
@@ -39,9 +54,10 @@ class AutoTranslator(Translator):
     """Automatically find parser/unparser pair and translate between programming languages."""
 
     def __init__(self, from_language: Language, to_language: Language, parser_kwargs: dict = {},
-                 ast_generalizer_kwargs: dict = {}, unparser_kwargs: dict = {}):
+                 ast_generalizer_kwargs: dict = {}, unparser_kwargs: dict = {},
+                 transformations: t.Sequence[t.Union[str, t.Callable[[t.Any], t.Any]]] = ()):
         super().__init__(Parser.find(from_language)(**parser_kwargs),
                          AstGeneralizer.find(from_language)(**ast_generalizer_kwargs),
-                         Unparser.find(to_language)(**unparser_kwargs))
+                         Unparser.find(to_language)(**unparser_kwargs), transformations)
         self.from_language = from_language
         self.to_language = to_language
@@ -32,7 +32,8 @@ class Transpiler(Registry):
         translated_code = self.translator.translate(code, path)
         code_writer = CodeWriter(translated_path.suffix)
         code_writer.write_file(translated_code, translated_path)
-        compiled_path = self.compiler.compile(translated_code, translated_path, compile_folder)
+        compiled_path = self.compiler.compile(translated_code, translated_path, compile_folder,
+                                              general_ast=self.translator.general_ast)
         return compiled_path
 
     def transpile_file(self, path: pathlib.Path):
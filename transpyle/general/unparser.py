@@ -1,15 +1,23 @@
 """Unparsing of general AST into code in given language."""
 
+import ast
 import logging
-# import typing as t
+import multiprocessing
+import typing as t
 
 import horast
+import typed_ast.ast3 as typed_ast3
 
 from .registry import Registry
 from .language import Language
 
 _LOG = logging.getLogger(__name__)
 
+UNIT_TYPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef,
+              typed_ast3.FunctionDef, typed_ast3.AsyncFunctionDef, typed_ast3.ClassDef)
+
+_UNPARSING_JOB = None  # type: t.Optional[t.Tuple[Unparser, t.List[typed_ast3.Module], dict]]
+
 
 def unparsing_unsupported(language_name: str, syntax, comment: str = None, error: bool = True):
     unparsed = 'invalid'
@@ -27,12 +35,75 @@ def unparsing_unsupported(language_name: str, syntax, comment: str = None, error
                 syntax.__class__.__name__, comment, horast.dump(syntax), unparsed, language_name))
 
 
+def split_into_units(tree: typed_ast3.Module) -> t.List[typed_ast3.Module]:
+    """Split a module into modules each with one top-level function or class.
+
+    Other statements, like imports, declarations and comments, stay together with
+    the preceding function or class. Each resulting module is of the same type as the original.
+    """
+    units = []  # type: t.List[t.List[typed_ast3.AST]]
+    for stmt in tree.body:
+        if not units or isinstance(stmt, UNIT_TYPES):
+            units.append([])
+        units[-1].append(stmt)
+    fields = {field: getattr(tree, field) for field in tree._fields if field != 'body'}
+    return [type(tree)(body=body, **fields) for body in units]
+
+
+def _set_unparsing_job(unparser: 'Unparser', units: t.List[typed_ast3.Module], kwargs: dict):
+    global _UNPARSING_JOB
+    _UNPARSING_JOB = unparser, units, kwargs
+
+
+def _unparse_unit_of_job(index: int) -> t.Any:
+    unparser, units, kwargs = _UNPARSING_JOB
+    return unparser._unparse_unit(units[index], **kwargs)
+
+
 class Unparser(Registry):
 
     """Output code in a given language."""
 
+    parallel_unparsing = False
+    """True if unparsing a module is equivalent to unparsing each of its units separately."""
+
     def __init__(self, language: Language):
         self.language = language
 
     def unparse(self, tree) -> str:
         raise NotImplementedError()
+
+    def unparse_in_parallel(self, tree, workers: t.Optional[int] = None, **kwargs) -> str:
+        """Unparse a module, handling its top-level functions and classes in a process pool.
+
+        Result is the same as of unparse(), including order of units and comments. If the
+        unparser does not support parallel unparsing, or if the platform cannot fork processes,
+        the module is unparsed sequentially.
+
+        By default, as many processes as there are CPUs are used.
+        """
+        if not self.parallel_unparsing or not isinstance(tree, (ast.Module, typed_ast3.Module)) \
+                or 'fork' not in multiprocessing.get_all_start_methods():
+            return self.unparse(tree, **kwargs)
+        units = split_into_units(tree)
+        if len(units) < 2 or workers == 1:
+            return self.unparse(tree, **kwargs)
+        # forked workers inherit the tree and its annotations, therefore nothing is pickled
+        # except unit indices and results
+        with multiprocessing.get_context('fork').Pool(
+                workers, initializer=_set_unparsing_job, initargs=(self, units, kwargs)) as pool:
+            unparsed_units = pool.map(_unparse_unit_of_job, range(len(units)))
+        return self._join_units(unparsed_units)
+
+    def _unparse_unit(self, tree, **kwargs) -> t.Any:
+        """Unparse one unit of a module in a worker process -- the result must be picklable."""
+        return self.unparse(tree, **kwargs)
+
+    def _join_units(self, unparsed_units: t.List[t.Any]) -> str:
+        """Merge results of _unparse_unit() in order.
+
+        By default, each unit is assumed to end with a newline that unparse() adds once,
+        after the whole module.
+        """
+        return ''.join(_[:-1] if _.endswith('\n') else _ for _ in unparsed_units[:-1]) \
+            + unparsed_units[-1]
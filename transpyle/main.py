@@ -9,6 +9,7 @@ import pandas as pd
 
 from .general import Language, CodeReader, CodeWriter, AutoTranslator
 from .general import Parser, AstGeneralizer, Unparser, Compiler, Binder
+from .pair.pass_manager import PASSES
 
 PROG_NAME = 'transpyle'
 COPYRIGHT_NOTICE = 'Copyright 2017-2019 Mateusz Bysiek https://mbdevpl.github.io/,' \
@@ -77,7 +78,8 @@ def parse_args(args=None):
     parser.add_argument('--keep', action='store_true',
                         help='do not discard not-transpiled scopes of the code')
     parser.add_argument('--transformations', metavar='name', type=str, nargs='*',
-                        help='specify Python script that defines performed AST transformations')
+                        help='names of transformations of generalized AST to perform, in order'
+                        ' (available: {})'.format(', '.join(PASSES)))
 
     parsed_args = parser.parse_args(args)
 
@@ -119,14 +121,12 @@ def main(args=None):
     if parsed_args.keep:
         raise NotImplementedError('--keep option not suppored yet')
 
-    if parsed_args.transformations is not None:
-        raise NotImplementedError('--trasformations option not suppored yet')
-
     from_language = Language.find(parsed_args.from_language)
     to_language = Language.find(parsed_args.to_language)
 
     reader = CodeReader(from_language.file_extensions)
-    translator = AutoTranslator(from_language, to_language)
+    translator = AutoTranslator(from_language, to_language,
+                                transformations=parsed_args.transformations or ())
     writer = CodeWriter(to_language.default_file_extension)
 
     from_path = pathlib.Path(parsed_args.source)
@@ -135,3 +135,6 @@ def main(args=None):
     from_code = reader.read_file(from_path)
     to_code = translator.translate(from_code, from_path)
     writer.write_file(to_code, to_path)
+
+    if parsed_args.transformations:
+        print(translator.pass_manager.report())
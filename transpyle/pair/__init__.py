@@ -2,27 +2,41 @@
 
 import typed_ast.ast3 as typed_ast3
 
-from .ast_annotations import annotate_ast, has_annotation, has_annotations, get_annotation
+from .ast_annotations import \
+    AnnotationStore, annotate_ast, has_annotation, has_annotations, get_annotation, \
+    deepcopy_ast, preserving_annotations
 from .assertions import function_returns, returns_array, is_ast_none, syntax_matches
-from .ast_query import SyntaxFinder, ReturnFinder
+from .ast_query import SyntaxFinder, SyntaxIndex, ReturnFinder
 from .manipulate import fix_stmts_in_body, separate_args_and_keywords, convert_return_to_assign
 from .code_manipulation import replace_line, replace_scope
 from .synthetic_ast import \
     make_range_call, make_call_from_slice, make_expression_from_slice, make_slice_from_call, \
     make_numpy_constructor, make_st_ndarray
-from .inlining import CallInliner, inline_syntax, inline
+from .call_graph import CallGraph
+from .constant_folding import ConstantFolder, fold_constants
+from .dead_code import DeadCodeEliminator, eliminate_dead_code
+from .inlining import CallInliner, inline_syntax, inline, InliningCostModel, inline_hot_calls
 from .loop_annotations import annotate_loop_syntax
+from .pass_manager import AnalysisCache, Pass, PassManager
+from .simplification import StrengthReducer, reduce_strength, simplify
+from .structural_hash import structural_hash, clear_structural_hashes, find_identical_subtrees
+from .vectorization import LoopVectorizer, vectorize_loops
 
 __all__ = [
-    'annotate_ast', 'has_annotation', 'has_annotations', 'get_annotation',
+    'AnnotationStore', 'annotate_ast', 'has_annotation', 'has_annotations', 'get_annotation',
+    'deepcopy_ast', 'preserving_annotations',
     'function_returns', 'returns_array', 'is_ast_none', 'syntax_matches',
-    'SyntaxFinder', 'ReturnFinder',
+    'SyntaxFinder', 'SyntaxIndex', 'ReturnFinder',
     'fix_stmts_in_body', 'separate_args_and_keywords', 'convert_return_to_assign',
     'replace_line', 'replace_scope',
     'make_range_call', 'make_call_from_slice', 'make_expression_from_slice', 'make_slice_from_call',
     'make_numpy_constructor', 'make_st_ndarray',
-    'CallInliner', 'inline_syntax', 'inline',
-    'annotate_loop_syntax']
+    'CallGraph', 'ConstantFolder', 'fold_constants', 'DeadCodeEliminator', 'eliminate_dead_code',
+    'CallInliner', 'inline_syntax', 'inline', 'InliningCostModel', 'inline_hot_calls',
+    'annotate_loop_syntax', 'AnalysisCache', 'Pass', 'PassManager',
+    'StrengthReducer', 'reduce_strength', 'simplify',
+    'structural_hash', 'clear_structural_hashes', 'find_identical_subtrees',
+    'LoopVectorizer', 'vectorize_loops']
 
 
 def _match_subscripted_attributed_name(tree, name: str, attr: str) -> bool:
@@ -1,33 +1,179 @@
-
+import copy
 import logging
 import typing as t
+import weakref
 
 import typed_ast.ast3 as typed_ast3
 
 _LOG = logging.getLogger(__name__)
 
-AST_ANNOTATION_FIELD = 'annotations'
+ANNOTATION_TYPES = {
+    'is_default_case': bool,
+    'is_interface': bool,
+    'is_mpi_call': bool,
+    'is_nullification': bool,
+    'is_statement': bool,
+    'fortran_metadata': dict,
+    'nature': str}  # type: t.Dict[str, type]
+"""Types of values of known annotations. Values of other annotations are not checked."""
+
+
+class _NodeRecord(weakref.ref):
+
+    """Weak reference to an annotated node, with names of its annotations."""
+
+    __slots__ = ('node_id', 'keys')
+
+    def __init__(self, node, callback):
+        super().__init__(node, callback)
+        self.node_id = id(node)
+        self.keys = ()  # type: t.Tuple[str, ...]
+
+
+class AnnotationStore:
+
+    """Annotations of AST nodes, kept in a side table keyed by node identity.
+
+    Nodes themselves are not modified. Values are kept in one column per annotation name,
+    and an entry is dropped automatically when its node is garbage-collected.
+
+    Because the store relies on node identity, annotations are not carried over by
+    copy.deepcopy() or when nodes are re-created. Use deepcopy() to copy a tree together
+    with its annotations. Use export() and restore(), or preserving_annotations(), to transfer
+    them between structurally identical trees -- which also is the way to serialize
+    annotations alongside a pickled tree.
+    """
+
+    def __init__(self, types: t.Optional[t.Mapping[str, type]] = None):
+        self.types = dict(ANNOTATION_TYPES if types is None else types)
+        self._records = {}  # type: t.Dict[int, _NodeRecord]
+        self._columns = {}  # type: t.Dict[str, t.Dict[int, t.Any]]
+
+    def __len__(self):
+        return len(self._records)
+
+    def _forget(self, record: _NodeRecord) -> None:
+        if self._records.get(record.node_id) is not record:
+            return
+        del self._records[record.node_id]
+        for key in record.keys:
+            del self._columns[key][record.node_id]
+
+    def annotate(self, node: typed_ast3.AST, key: str, value: t.Any) -> None:
+        assert isinstance(node, typed_ast3.AST), type(node)
+        if key in self.types:
+            assert isinstance(value, self.types[key]), (key, type(value))
+        record = self._records.get(id(node))
+        if record is None or record() is not node:
+            record = _NodeRecord(node, self._forget)
+            self._records[id(node)] = record
+        if key in record.keys:
+            _LOG.warning('node %s already has an annotation %s', type(node).__name__, key)
+        else:
+            record.keys += (key,)
+        self._columns.setdefault(key, {})[id(node)] = value
+
+    def keys(self, node: typed_ast3.AST) -> t.Tuple[str, ...]:
+        record = self._records.get(id(node))
+        if record is None or record() is not node:
+            return ()
+        return record.keys
+
+    def has(self, node: typed_ast3.AST, key: str) -> bool:
+        return key in self.keys(node)
+
+    def get(self, node: typed_ast3.AST, key: str, default: t.Any = None) -> t.Any:
+        if not self.has(node, key):
+            return default
+        return self._columns[key][id(node)]
+
+    def annotations(self, node: typed_ast3.AST) -> t.Dict[str, t.Any]:
+        return {key: self._columns[key][id(node)] for key in self.keys(node)}
+
+    def discard(self, node: typed_ast3.AST) -> None:
+        """Remove all annotations of a node."""
+        record = self._records.get(id(node))
+        if record is not None and record() is node:
+            self._forget(record)
+
+    def copy(self, source: typed_ast3.AST, target: typed_ast3.AST) -> None:
+        """Annotate target node with all annotations of the source node."""
+        for key, value in self.annotations(source).items():
+            self.annotate(target, key, value)
+
+    def deepcopy(self, tree: t.Any, memo: t.Optional[dict] = None) -> t.Any:
+        """Deep-copy a tree, or any object containing nodes, and annotate each copied node
+        with copies of annotations of its original.
+
+        The memo works as in copy.deepcopy(), which keeps the originals alive, so after
+        the copy it maps ids of all original nodes to their copies.
+        """
+        if memo is None:
+            memo = {}
+        copied = copy.deepcopy(tree, memo)
+        for node_id, node_copy in list(memo.items()):
+            record = self._records.get(node_id)
+            if record is None or not isinstance(node_copy, typed_ast3.AST):
+                continue
+            node = record()
+            if node is None or node is node_copy:
+                continue
+            for key, value in self.annotations(node).items():
+                if not self.has(node_copy, key):
+                    self.annotate(node_copy, key, copy.deepcopy(value, memo))
+        return copied
+
+    def export(self, tree: typed_ast3.AST) -> t.Dict[str, t.List[t.Tuple[int, t.Any]]]:
+        """Get annotations of all nodes in a tree, with nodes identified by their position
+        in typed_ast3.walk() order."""
+        exported = {}  # type: t.Dict[str, t.List[t.Tuple[int, t.Any]]]
+        for position, node in enumerate(typed_ast3.walk(tree)):
+            for key in self.keys(node):
+                exported.setdefault(key, []).append((position, self._columns[key][id(node)]))
+        return exported
+
+    def restore(self, tree: typed_ast3.AST,
+                exported: t.Mapping[str, t.Sequence[t.Tuple[int, t.Any]]]) -> None:
+        """Annotate nodes of a tree using result of export() on a structurally identical tree."""
+        if not exported:
+            return
+        nodes = list(typed_ast3.walk(tree))
+        for key, values in exported.items():
+            for position, value in values:
+                if not self.has(nodes[position], key):
+                    self.annotate(nodes[position], key, value)
+
+
+AST_ANNOTATIONS = AnnotationStore()
+"""Store used by annotate_ast(), has_annotation() and get_annotation()."""
 
 
 def annotate_ast(node: typed_ast3.AST, key: str, value: t.Any):
-    annotations = getattr(node, AST_ANNOTATION_FIELD, None)
-    if annotations is None:
-        annotations = {}
-        setattr(node, AST_ANNOTATION_FIELD, annotations)
-    if key in annotations:
-        _LOG.warning('node %s already has an annotation %s', type(node).__name__, key)
-    annotations[key] = value
+    AST_ANNOTATIONS.annotate(node, key, value)
 
 
 def has_annotations(node: typed_ast3.AST):
-    return len(getattr(node, AST_ANNOTATION_FIELD, {})) > 0
+    return len(AST_ANNOTATIONS.keys(node)) > 0
 
 
 def has_annotation(node: typed_ast3.AST, key: str):
-    return has_annotations(node) and key in getattr(node, AST_ANNOTATION_FIELD)
+    return AST_ANNOTATIONS.has(node, key)
+
+
+def get_annotation(node: typed_ast3.AST, key: str, default: t.Any = None) -> t.Any:
+    return AST_ANNOTATIONS.get(node, key, default)
+
+
+def deepcopy_ast(tree: t.Any, memo: t.Optional[dict] = None) -> t.Any:
+    """Use instead of copy.deepcopy() for trees, so that annotations are copied too."""
+    return AST_ANNOTATIONS.deepcopy(tree, memo)
 
 
-def get_annotation(node: typed_ast3.AST, key: str) -> t.Any:
-    if not has_annotation(node, key):
-        return None
-    return getattr(node, AST_ANNOTATION_FIELD)[key]
+def preserving_annotations(function: t.Callable[..., typed_ast3.AST], tree: typed_ast3.AST,
+                           *args, **kwargs) -> typed_ast3.AST:
+    """Apply a function that re-creates nodes of a tree without changing its structure,
+    like copy.deepcopy() or st.augment(), and annotate the new tree like the original one."""
+    exported = AST_ANNOTATIONS.export(tree)
+    result = function(tree, *args, **kwargs)
+    AST_ANNOTATIONS.restore(result, exported)
+    return result
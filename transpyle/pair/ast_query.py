@@ -5,6 +5,8 @@ import typing as t
 import static_typing as st
 import typed_ast.ast3 as typed_ast3
 
+from .structural_hash import clear_structural_hashes
+
 
 def syntax_name(syntax: typed_ast3.AST) -> str:
     """Return name of the syntax element, or raise TypeError if given syntax does not have any."""
@@ -21,6 +23,10 @@ def syntax_name(syntax: typed_ast3.AST) -> str:
     raise TypeError('the AST type {} does not have a name'.format(type(syntax)))
 
 
+_SHARED_TYPES = (typed_ast3.expr_context, typed_ast3.boolop, typed_ast3.operator,
+                 typed_ast3.unaryop, typed_ast3.cmpop)
+
+
 class SyntaxFinder(st.ast_manipulation.RecursiveAstVisitor[typed_ast3]):
 
     """Find all AST nodes that match given criteria."""
@@ -62,6 +68,190 @@ class SyntaxFinder(st.ast_manipulation.RecursiveAstVisitor[typed_ast3]):
         if self.satisfies_criteria(node):
             self._found.append(node)
 
+    def visit_index(self, index: 'SyntaxIndex', node: t.Optional[typed_ast3.AST] = None):
+        """Like visit(), but query a prebuilt index instead of traversing the tree."""
+        self._found += index.find(self._types, self._names, self._predicate, within=node)
+
+
+class SyntaxIndex:
+
+    """Index of all nodes of a tree by type and by name, with links to their parents.
+
+    The index is built once, in a single traversal, and then queries like those answered
+    by SyntaxFinder take time proportional to the number of matches instead of tree size.
+    Nodes are returned in the order in which they were indexed, which is pre-order
+    for a freshly built index, and re-indexed subtrees come after all other nodes.
+
+    When the tree is modified, the index has to be told which subtree changed: either via
+    replace() or transform(), or via update() after modifying a node in place.
+
+    Operators and expression contexts are not indexed, as they are shared between many nodes.
+    Any other node that appears in several places of the tree is indexed at the first one.
+    """
+
+    def __init__(self, tree: typed_ast3.AST):
+        self.tree = tree
+        self._by_type = {}  # type: t.Dict[type, t.Dict[int, typed_ast3.AST]]
+        self._by_name = {}  # type: t.Dict[str, t.Dict[int, typed_ast3.AST]]
+        self._names = {}  # type: t.Dict[int, str]
+        self._locations = {}  # type: t.Dict[int, t.Tuple[t.Optional[typed_ast3.AST], str, int]]
+        self._children = {}  # type: t.Dict[int, t.List[typed_ast3.AST]]
+        self._order = {}  # type: t.Dict[int, int]
+        self._indexed = 0
+        self._add(tree, None, '', -1)
+
+    def __len__(self):
+        return len(self._locations)
+
+    def __contains__(self, node):
+        return id(node) in self._locations
+
+    def _add(self, root: typed_ast3.AST, parent, field: str, index: int) -> None:
+        stack = [(root, parent, field, index)]
+        while stack:
+            node, parent, field, index = stack.pop()
+            if id(node) in self._locations:
+                continue
+            self._locations[id(node)] = (parent, field, index)
+            self._order[id(node)] = self._indexed
+            self._indexed += 1
+            self._by_type.setdefault(type(node), {})[id(node)] = node
+            self._add_name(node)
+            children = []
+            for name, value in typed_ast3.iter_fields(node):
+                if isinstance(value, list):
+                    children += [(child, node, name, i) for i, child in enumerate(value)
+                                 if isinstance(child, typed_ast3.AST)
+                                 and not isinstance(child, _SHARED_TYPES)]
+                elif isinstance(value, typed_ast3.AST) and not isinstance(value, _SHARED_TYPES):
+                    children.append((value, node, name, -1))
+            self._children[id(node)] = [_[0] for _ in children]
+            stack += reversed(children)
+
+    def _add_name(self, node: typed_ast3.AST) -> None:
+        try:
+            name = syntax_name(node)
+        except TypeError:
+            return
+        self._names[id(node)] = name
+        self._by_name.setdefault(name, {})[id(node)] = node
+
+    def _remove_name(self, node: typed_ast3.AST) -> None:
+        name = self._names.pop(id(node), None)
+        if name is not None:
+            del self._by_name[name][id(node)]
+
+    def _remove(self, root: typed_ast3.AST) -> None:
+        stack = [(root, self._locations[id(root)][0])]
+        while stack:
+            node, parent = stack.pop()
+            if id(node) not in self._locations or self._locations[id(node)][0] is not parent:
+                continue  # indexed elsewhere
+            del self._locations[id(node)]
+            del self._order[id(node)]
+            del self._by_type[type(node)][id(node)]
+            self._remove_name(node)
+            stack += [(_, node) for _ in self._children.pop(id(node))]
+
+    def _update_attribute_names(self, node) -> None:
+        """Names of attributes depend on their values, e.g. "np.sqrt" on "np"."""
+        while isinstance(node, typed_ast3.Attribute):
+            self._remove_name(node)
+            self._add_name(node)
+            node = self._locations[id(node)][0]
+
+    def parent(self, node: typed_ast3.AST) -> t.Optional[typed_ast3.AST]:
+        """Get parent of an indexed node, or None for the root of the tree."""
+        return self._locations[id(node)][0]
+
+    def location(self, node: typed_ast3.AST) \
+            -> t.Tuple[t.Optional[typed_ast3.AST], str, t.Optional[int]]:
+        """Get parent of an indexed node, name of the parent's field that holds it,
+        and its index in that field if the field is a list."""
+        parent, field, index = self._locations[id(node)]
+        return parent, field, None if index < 0 else index
+
+    def ancestors(self, node: typed_ast3.AST) -> t.Iterator[typed_ast3.AST]:
+        """Iterate over parent, grandparent and so on of an indexed node."""
+        node = self.parent(node)
+        while node is not None:
+            yield node
+            node = self.parent(node)
+
+    def find(self, types: t.Optional[tuple] = None, names: t.Optional[set] = None,
+             predicate: t.Optional[collections.abc.Callable] = None,
+             within: t.Optional[typed_ast3.AST] = None) -> t.List[typed_ast3.AST]:
+        """Find all nodes that match given criteria, like SyntaxFinder.
+
+        Optionally, only nodes within a given subtree (including its root) are returned.
+        """
+        assert types is None or isinstance(types, tuple), type(types)
+        assert names is None or isinstance(names, set), type(names)
+        if names is not None:
+            buckets = [self._by_name[_] for _ in names if _ in self._by_name]
+        elif types is not None:
+            buckets = [nodes for type_, nodes in self._by_type.items() if issubclass(type_, types)]
+        else:
+            buckets = list(self._by_type.values())
+        candidates = [node for nodes in buckets for node in nodes.values()]
+        if names is not None and types is not None:
+            candidates = [_ for _ in candidates if isinstance(_, types)]
+        if len(buckets) > 1:
+            candidates.sort(key=lambda _: self._order[id(_)])
+        if within is not None and within is not self.tree:
+            candidates = [_ for _ in candidates
+                          if _ is within or any(a is within for a in self.ancestors(_))]
+        if predicate is not None:
+            candidates = [_ for _ in candidates if predicate(_)]
+        return candidates
+
+    def update(self, node: typed_ast3.AST) -> None:
+        """Re-index subtree of a given node after it was modified in place.
+
+        Cached structural hashes of the whole subtree and of its ancestors are cleared as well.
+        """
+        location = self._locations[id(node)]
+        self._remove(node)
+        self._add(node, *location)
+        self._update_attribute_names(location[0])
+        clear_structural_hashes(node, recursive=True)
+        clear_structural_hashes(*self.ancestors(node))
+
+    def replace(self, node: typed_ast3.AST, new_node: typed_ast3.AST) -> None:
+        """Put new node in the tree in place of a given indexed node, and update the index."""
+        parent, field, index = self._locations[id(node)]
+        if parent is None:
+            self.tree = new_node
+        elif index < 0:
+            setattr(parent, field, new_node)
+        else:
+            getattr(parent, field)[index] = new_node
+        self._remove(node)
+        self._add(new_node, parent, field, index)
+        if parent is not None:
+            self._children[id(parent)] = [
+                new_node if _ is node else _ for _ in self._children[id(parent)]]
+        self._update_attribute_names(parent)
+        clear_structural_hashes(new_node, recursive=True)
+        clear_structural_hashes(*self.ancestors(new_node))
+
+    def transform(self, transformer, node: t.Optional[typed_ast3.AST] = None) \
+            -> typed_ast3.AST:
+        """Apply a transformer (like RecursiveAstTransformer) to a subtree and update the index.
+
+        Only the transformed subtree is re-indexed. The transformer should not replace
+        the root of the subtree with a list of nodes.
+        """
+        if node is None:
+            node = self.tree
+        new_node = transformer.visit(node)
+        assert isinstance(new_node, typed_ast3.AST), type(new_node)
+        if new_node is node:
+            self.update(node)
+        else:
+            self.replace(node, new_node)
+        return new_node
+
 
 class ReturnFinder(SyntaxFinder):
 
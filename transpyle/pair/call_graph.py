@@ -0,0 +1,275 @@
+"""Call graph of functions defined in a module or in a whole project."""
+
+import builtins
+import logging
+import typing as t
+
+import horast.nodes as horast_nodes
+import typed_ast.ast3 as typed_ast3
+
+_LOG = logging.getLogger(__name__)
+
+LOOP_TYPES = (typed_ast3.For, typed_ast3.AsyncFor, typed_ast3.While)
+
+SCOPE_TYPES = (typed_ast3.FunctionDef, typed_ast3.AsyncFunctionDef, typed_ast3.Lambda,
+               typed_ast3.ClassDef)
+
+BUILTIN_NAMES = set(dir(builtins))
+
+
+def estimated_trip_count(loop: typed_ast3.AST, default: int) -> int:
+    """Estimate how many times the body of a given loop is executed.
+
+    Trip count of loops over range() with constant arguments is exact,
+    while for all other loops the default estimate is used.
+    """
+    if isinstance(loop, typed_ast3.For) and isinstance(loop.iter, typed_ast3.Call) \
+            and isinstance(loop.iter.func, typed_ast3.Name) and loop.iter.func.id == 'range' \
+            and 1 <= len(loop.iter.args) <= 3 and not loop.iter.keywords \
+            and all(isinstance(_, typed_ast3.Num) and isinstance(_.n, int)
+                    for _ in loop.iter.args):
+        try:
+            return len(range(*[_.n for _ in loop.iter.args]))
+        except ValueError:
+            pass
+    return default
+
+
+def stored_names(node: typed_ast3.AST) -> t.Set[str]:
+    """Find all names that are assigned or declared within a given scope."""
+    names = set()
+
+    def add_target(target):
+        if isinstance(target, typed_ast3.Name):
+            names.add(target.id)
+        elif isinstance(target, (typed_ast3.Tuple, typed_ast3.List)):
+            for elt in target.elts:
+                add_target(elt)
+        elif isinstance(target, typed_ast3.Starred):
+            add_target(target.value)
+
+    for child in walk_scope(node):
+        if isinstance(child, typed_ast3.Assign):
+            for target in child.targets:
+                add_target(target)
+        elif isinstance(child, (typed_ast3.AugAssign, typed_ast3.AnnAssign, typed_ast3.For,
+                                typed_ast3.AsyncFor, typed_ast3.comprehension)):
+            add_target(child.target)
+        elif isinstance(child, typed_ast3.withitem) and child.optional_vars is not None:
+            add_target(child.optional_vars)
+    return names
+
+
+def _target_names(target: typed_ast3.AST) -> t.List[typed_ast3.Name]:
+    if isinstance(target, typed_ast3.Name):
+        return [target]
+    if isinstance(target, (typed_ast3.Tuple, typed_ast3.List)):
+        return [name for elt in target.elts for name in _target_names(elt)]
+    if isinstance(target, typed_ast3.Starred):
+        return _target_names(target.value)
+    return []
+
+
+def definitions_and_uses(node: typed_ast3.AST) -> t.Dict[str, t.Tuple[list, list]]:
+    """Map names in a given scope to nodes that assign them and to nodes that load them.
+
+    Targets of augmented assignments are both definitions and uses, while declarations
+    without values are neither.
+    """
+    chains = {}  # type: t.Dict[str, t.Tuple[list, list]]
+    stores = set()
+    for child in walk_scope(node):
+        if isinstance(child, typed_ast3.Name):
+            if id(child) not in stores:
+                chains.setdefault(child.id, ([], []))[1].append(child)
+            continue
+        if isinstance(child, typed_ast3.Assign):
+            targets = child.targets
+        elif isinstance(child, (typed_ast3.AugAssign, typed_ast3.AnnAssign, typed_ast3.For,
+                                typed_ast3.AsyncFor, typed_ast3.comprehension)):
+            targets = [child.target]
+        elif isinstance(child, typed_ast3.withitem) and child.optional_vars is not None:
+            targets = [child.optional_vars]
+        else:
+            continue
+        for name in [_ for target in targets for _ in _target_names(target)]:
+            if not isinstance(child, typed_ast3.AugAssign):
+                stores.add(id(name))
+            if not isinstance(child, typed_ast3.AnnAssign) or child.value is not None:
+                chains.setdefault(name.id, ([], []))[0].append(child)
+    return chains
+
+
+def walk_scope(node: typed_ast3.AST) -> t.Iterator[typed_ast3.AST]:
+    """Like ast.walk(), but don't descend into nested functions, lambdas and classes."""
+    yield node
+    for child in typed_ast3.iter_child_nodes(node):
+        if not isinstance(child, SCOPE_TYPES):
+            yield from walk_scope(child)
+
+
+def body_size(function: typed_ast3.FunctionDef) -> int:
+    """Estimate size of a function as number of statements and expressions in its body.
+
+    Comments, docstrings, declarations without values and bare returns are not counted.
+    """
+    size = 0
+    for i, stmt in enumerate(function.body):
+        if isinstance(stmt, (horast_nodes.Comment, typed_ast3.Pass)) \
+                or isinstance(stmt, typed_ast3.AnnAssign) and stmt.value is None \
+                or isinstance(stmt, typed_ast3.Return) and stmt.value is None \
+                or i == 0 and isinstance(stmt, typed_ast3.Expr) \
+                and isinstance(stmt.value, typed_ast3.Str):
+            continue
+        size += sum(1 for _ in typed_ast3.walk(stmt)
+                    if isinstance(_, (typed_ast3.stmt, typed_ast3.expr))
+                    and not isinstance(_, horast_nodes.Comment))
+    return size
+
+
+class CallSite:
+
+    """Call of a function defined in the analyzed code, with its loop nesting context."""
+
+    def __init__(self, caller: typed_ast3.FunctionDef, callee: str, call: typed_ast3.Call,
+                 loops: t.Sequence[typed_ast3.AST]):
+        self.caller = caller
+        self.callee = callee
+        self.call = call
+        self.loops = list(loops)
+
+    @property
+    def loop_depth(self) -> int:
+        return len(self.loops)
+
+    def __repr__(self):
+        return 'CallSite({} -> {}, loop depth {})'.format(
+            self.caller.name, self.callee, self.loop_depth)
+
+
+class CallGraph:
+
+    """Call graph of all functions defined in one or more modules.
+
+    Functions are identified by their names, and only calls by a simple name are considered.
+    Functions defined more than once are ambiguous: calls to them are recorded,
+    but their definitions are not available.
+    """
+
+    def __init__(self, *modules: typed_ast3.AST, loop_trip_count: int = 10):
+        assert modules
+        self.loop_trip_count = loop_trip_count
+        self.functions = {}  # type: t.Dict[str, typed_ast3.FunctionDef]
+        self.ambiguous = set()  # type: t.Set[str]
+        self.modules = {}  # type: t.Dict[str, typed_ast3.AST]
+        self.call_sites = {}  # type: t.Dict[str, t.List[CallSite]]
+        self._frequencies = {}  # type: t.Dict[str, int]
+        for module in modules:
+            for node in typed_ast3.walk(module):
+                if not isinstance(node, typed_ast3.FunctionDef):
+                    continue
+                if node.name in self.functions or node.name in self.ambiguous:
+                    self.functions.pop(node.name, None)
+                    self.ambiguous.add(node.name)
+                    continue
+                self.functions[node.name] = node
+                self.modules[node.name] = module
+        _LOG.debug('found %i functions, %i are ambiguous: %s',
+                   len(self.functions), len(self.ambiguous), self.ambiguous)
+        for function in self.functions.values():
+            self.update(function)
+
+    def update(self, function: typed_ast3.FunctionDef) -> None:
+        """Collect again all calls in a given function, e.g. after it was modified."""
+        assert function.name in self.functions, function.name
+        sites = []
+
+        def collect(node, loops):
+            if isinstance(node, SCOPE_TYPES) and node is not function:
+                return
+            if isinstance(node, typed_ast3.Call) and isinstance(node.func, typed_ast3.Name) \
+                    and (node.func.id in self.functions or node.func.id in self.ambiguous):
+                sites.append(CallSite(function, node.func.id, node, loops))
+            inner_loops = loops + [node] if isinstance(node, LOOP_TYPES) else loops
+            for name, value in typed_ast3.iter_fields(node):
+                loops_ = loops if name in {'iter', 'target'} else inner_loops
+                for child in value if isinstance(value, list) else [value]:
+                    if isinstance(child, typed_ast3.AST):
+                        collect(child, loops_)
+
+        collect(function, [])
+        self.call_sites[function.name] = sites
+        self._frequencies.clear()
+
+    def callees(self, name: str) -> t.Set[str]:
+        return {site.callee for site in self.call_sites.get(name, [])}
+
+    def callers(self, name: str) -> t.List[CallSite]:
+        return [site for sites in self.call_sites.values() for site in sites
+                if site.callee == name]
+
+    def is_leaf(self, name: str) -> bool:
+        """Check if function doesn't call any other function defined in the analyzed code."""
+        return name in self.functions and not self.call_sites[name]
+
+    def bottom_up_order(self) -> t.List[str]:
+        """List functions so that callees come before their callers, as far as possible."""
+        order = []
+        visited = set()
+
+        def visit(name):
+            if name in visited or name not in self.functions:
+                return
+            visited.add(name)
+            for callee in sorted(self.callees(name)):
+                visit(callee)
+            order.append(name)
+
+        for name in self.functions:
+            visit(name)
+        return order
+
+    def local_frequency(self, site: CallSite) -> int:
+        """Estimate how many times the call is executed per one execution of the caller."""
+        frequency = 1
+        for loop in site.loops:
+            frequency *= estimated_trip_count(loop, self.loop_trip_count)
+        return frequency
+
+    def frequency(self, name: str, _active: t.Optional[t.Set[str]] = None) -> int:
+        """Estimate how many times a function is executed per one execution of the program.
+
+        Functions that are not called anywhere are assumed to be executed once.
+        Recursive calls are ignored.
+        """
+        if name in self._frequencies:
+            return self._frequencies[name]
+        active = set() if _active is None else _active
+        callers = [_ for _ in self.callers(name) if _.caller.name not in active]
+        if not callers:
+            return 1
+        active.add(name)
+        frequency = sum(self.frequency(site.caller.name, active) * self.local_frequency(site)
+                        for site in callers)
+        active.remove(name)
+        self._frequencies[name] = frequency
+        return frequency
+
+    def call_frequency(self, site: CallSite) -> int:
+        """Estimate how many times the call is executed per one execution of the program."""
+        return self.frequency(site.caller.name) * self.local_frequency(site)
+
+    def free_names(self, name: str) -> t.Set[str]:
+        """Find names used by a function that are neither its parameters nor its locals."""
+        function = self.functions[name]
+        local_names = {_.arg for _ in function.args.args} | stored_names(function)
+        return {_.id for _ in walk_scope(function) if isinstance(_, typed_ast3.Name)} \
+            - local_names - BUILTIN_NAMES
+
+    def module_names(self, module: typed_ast3.AST) -> t.Set[str]:
+        """Find all names defined at the top level of a module."""
+        names = stored_names(module)
+        for node in walk_scope(module):
+            if isinstance(node, (typed_ast3.Import, typed_ast3.ImportFrom)):
+                names |= {_.asname or _.name.partition('.')[0] for _ in node.names}
+        return names | {name for name, module_ in self.modules.items() if module_ is module}
@@ -0,0 +1,424 @@
+"""Propagation of constants and folding of constant expressions."""
+
+import logging
+import math
+import operator
+import typing as t
+import warnings
+
+import horast
+import numpy as np
+import typed_ast.ast3 as typed_ast3
+
+from ..general.misc import lazy_unparse
+from .ast_annotations import get_annotation
+from .call_graph import SCOPE_TYPES
+from .loop_analysis import PURE_FUNCTIONS, call_name
+
+_LOG = logging.getLogger(__name__)
+
+NUMPY_SCALAR_TYPES = (
+    'bool_', 'int8', 'int16', 'int32', 'int64', 'uint8', 'uint16', 'uint32', 'uint64',
+    'float16', 'float32', 'float64', 'intc', 'intp', 'int_', 'single', 'double')
+"""Names of NumPy scalar types understood by constant folding, canonical names first."""
+
+_NUMPY_TYPE_NAMES = {}  # type: t.Dict[type, str]
+for _name in NUMPY_SCALAR_TYPES:
+    _NUMPY_TYPE_NAMES.setdefault(getattr(np, _name), _name)
+
+BINARY_OPERATORS = {
+    typed_ast3.Add: operator.add, typed_ast3.Sub: operator.sub, typed_ast3.Mult: operator.mul,
+    typed_ast3.Div: operator.truediv, typed_ast3.FloorDiv: operator.floordiv,
+    typed_ast3.Mod: operator.mod, typed_ast3.Pow: operator.pow,
+    typed_ast3.LShift: operator.lshift, typed_ast3.RShift: operator.rshift,
+    typed_ast3.BitOr: operator.or_, typed_ast3.BitXor: operator.xor,
+    typed_ast3.BitAnd: operator.and_}
+
+COMPARISON_OPERATORS = {
+    typed_ast3.Eq: operator.eq, typed_ast3.NotEq: operator.ne, typed_ast3.Lt: operator.lt,
+    typed_ast3.LtE: operator.le, typed_ast3.Gt: operator.gt, typed_ast3.GtE: operator.ge}
+
+FOLDED_FUNCTIONS = {'abs': abs, 'int': int, 'float': float, 'max': max, 'min': min}
+
+SAFE_FUNCTIONS = PURE_FUNCTIONS | {'print'}
+"""Functions that never modify variables passed to them, even if passed by reference."""
+
+MAX_INTEGER_BITS = 63
+
+_COMPREHENSION_TYPES = (typed_ast3.ListComp, typed_ast3.SetComp, typed_ast3.DictComp,
+                        typed_ast3.GeneratorExp)
+
+
+def _is_integral(value) -> bool:
+    return isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_))
+
+
+def _is_numpy_call(node: typed_ast3.AST) -> bool:
+    return isinstance(node, typed_ast3.Call) and len(node.args) == 1 and not node.keywords \
+        and isinstance(node.func, typed_ast3.Attribute) \
+        and isinstance(node.func.value, typed_ast3.Name) and node.func.value.id == 'np' \
+        and node.func.attr in NUMPY_SCALAR_TYPES
+
+
+def constant_value(node: typed_ast3.AST):
+    """Get value of a literal constant, or None if the node is not a numeric or boolean literal.
+
+    Literals are numbers, True and False, negated numbers and NumPy scalars like np.float32(1.5).
+    """
+    if isinstance(node, typed_ast3.Num) and isinstance(node.n, (int, float)):
+        return node.n
+    if isinstance(node, typed_ast3.NameConstant) and isinstance(node.value, bool):
+        return node.value
+    if isinstance(node, typed_ast3.UnaryOp) and isinstance(node.op, typed_ast3.USub) \
+            and isinstance(node.operand, typed_ast3.Num) \
+            and isinstance(node.operand.n, (int, float)):
+        return -node.operand.n
+    if _is_numpy_call(node):
+        value = constant_value(node.args[0])
+        if value is not None and not isinstance(value, np.generic):
+            return getattr(np, node.func.attr)(value)
+    return None
+
+
+def make_constant(value) -> typed_ast3.AST:
+    """Create a literal with a given value, i.e. inverse of constant_value()."""
+    if isinstance(value, np.generic):
+        return typed_ast3.Call(
+            func=typed_ast3.Attribute(value=typed_ast3.Name(id='np', ctx=typed_ast3.Load()),
+                                      attr=_NUMPY_TYPE_NAMES[type(value)], ctx=typed_ast3.Load()),
+            args=[make_constant(value.item())], keywords=[])
+    if isinstance(value, bool):
+        return typed_ast3.NameConstant(value=value)
+    assert isinstance(value, (int, float)), type(value)
+    if value < 0 or value == 0 and math.copysign(1, value) < 0:
+        # negative literal in an operand position, like (-2) ** 2, needs explicit negation
+        return typed_ast3.UnaryOp(op=typed_ast3.USub(), operand=typed_ast3.Num(n=-value))
+    return typed_ast3.Num(n=value)
+
+
+def _is_representable(value) -> bool:
+    if isinstance(value, np.generic):
+        if type(value) not in _NUMPY_TYPE_NAMES:
+            return False
+        value = value.item()
+    if isinstance(value, bool):
+        return True
+    if isinstance(value, int):
+        return value.bit_length() <= MAX_INTEGER_BITS
+    return isinstance(value, float) and math.isfinite(value)
+
+
+def _evaluate(function: t.Callable, *args):
+    """Evaluate function on constants, returning None if the result cannot become a literal."""
+    try:
+        with warnings.catch_warnings(), np.errstate(all='raise'):
+            warnings.simplefilter('error')
+            result = function(*args)
+    except (ArithmeticError, ValueError, TypeError, RuntimeWarning) as err:
+        _LOG.debug('not folding %s%s: %s', getattr(function, '__name__', function), args, err)
+        return None
+    return result if _is_representable(result) else None
+
+
+def _binary_operation_is_portable(op: typed_ast3.operator, left, right) -> bool:
+    """Check if result of the operation doesn't depend on the semantics of the target language.
+
+    Integer division is true division in Python but truncating division in Fortran or C,
+    and the latter languages also disagree with Python on the sign of the remainder.
+    """
+    if isinstance(left, (bool, np.bool_)) or isinstance(right, (bool, np.bool_)):
+        return False
+    both_integral = _is_integral(left) and _is_integral(right)
+    if isinstance(op, typed_ast3.Div):
+        return not both_integral
+    if isinstance(op, (typed_ast3.FloorDiv, typed_ast3.Mod)):
+        return both_integral and left >= 0 and right > 0
+    if isinstance(op, typed_ast3.Pow):
+        return not (both_integral and right < 0)
+    if isinstance(op, (typed_ast3.LShift, typed_ast3.RShift, typed_ast3.BitOr,
+                       typed_ast3.BitXor, typed_ast3.BitAnd)):
+        return both_integral and left >= 0 and right >= 0
+    return True
+
+
+def fold_expression(node: typed_ast3.AST) -> typed_ast3.AST:
+    """Fold a single expression whose operands are already folded.
+
+    Return a new literal if the expression can be evaluated at translation time,
+    and the unchanged node otherwise.
+    """
+    result = None
+    if isinstance(node, typed_ast3.BinOp) and type(node.op) in BINARY_OPERATORS:
+        left, right = constant_value(node.left), constant_value(node.right)
+        if left is not None and right is not None \
+                and _binary_operation_is_portable(node.op, left, right):
+            result = _evaluate(BINARY_OPERATORS[type(node.op)], left, right)
+    elif isinstance(node, typed_ast3.UnaryOp):
+        operand = constant_value(node.operand)
+        if operand is None:
+            pass
+        elif isinstance(node.op, (typed_ast3.USub, typed_ast3.UAdd)):
+            if isinstance(node.operand, typed_ast3.Num) and isinstance(node.op, typed_ast3.USub):
+                return node  # already a negative literal
+            if not isinstance(operand, (bool, np.bool_)):
+                result = _evaluate(
+                    operator.neg if isinstance(node.op, typed_ast3.USub) else operator.pos,
+                    operand)
+        elif isinstance(node.op, typed_ast3.Not):
+            if isinstance(operand, (bool, np.bool_)):
+                result = not operand
+        elif isinstance(node.op, typed_ast3.Invert):
+            if _is_integral(operand):
+                result = _evaluate(operator.invert, operand)
+    elif isinstance(node, typed_ast3.BoolOp):
+        values = [constant_value(_) for _ in node.values]
+        if all(isinstance(_, bool) for _ in values):
+            result = all(values) if isinstance(node.op, typed_ast3.And) else any(values)
+    elif isinstance(node, typed_ast3.Compare) \
+            and all(type(_) in COMPARISON_OPERATORS for _ in node.ops):
+        values = [constant_value(_) for _ in [node.left] + node.comparators]
+        if all(_ is not None for _ in values):
+            result = _evaluate(lambda *args: all(
+                bool(COMPARISON_OPERATORS[type(op)](left, right))
+                for op, left, right in zip(node.ops, args, args[1:])), *values)
+    elif isinstance(node, typed_ast3.IfExp):
+        test = constant_value(node.test)
+        if isinstance(test, bool):
+            return node.body if test else node.orelse
+    elif isinstance(node, typed_ast3.Call) and not node.keywords and node.args \
+            and not _is_numpy_call(node) and call_name(node) in FOLDED_FUNCTIONS:
+        args = [constant_value(_) for _ in node.args]
+        if all(_ is not None and not isinstance(_, np.generic) for _ in args) \
+                and (len(args) == 1 or len({type(_) for _ in args}) == 1):
+            result = _evaluate(FOLDED_FUNCTIONS[call_name(node)], *args)
+    if result is None:
+        return node
+    _LOG.debug('folded %s into %s', lazy_unparse(node), result)
+    return make_constant(result)
+
+
+def _target_names(target: typed_ast3.AST) -> t.List[str]:
+    if isinstance(target, typed_ast3.Name):
+        return [target.id]
+    if isinstance(target, (typed_ast3.Tuple, typed_ast3.List)):
+        return [name for elt in target.elts for name in _target_names(elt)]
+    if isinstance(target, typed_ast3.Starred):
+        return _target_names(target.value)
+    return []
+
+
+def _walk_scope(node: typed_ast3.AST) -> t.Iterator[typed_ast3.AST]:
+    for child in typed_ast3.iter_child_nodes(node):
+        yield child
+        if not isinstance(child, SCOPE_TYPES):
+            yield from _walk_scope(child)
+
+
+class _ScopeAnalysis:
+
+    """Find which names in a scope can be treated as constants after their definition.
+
+    Names are compared case-insensitively, because Fortran identifiers are case-insensitive,
+    which makes the analysis only more conservative for case-sensitive languages.
+    """
+
+    def __init__(self, scope: typed_ast3.AST):
+        self.store_counts = {}  # type: t.Dict[str, int]
+        self.annotations = {}  # type: t.Dict[str, str]
+        self.passed_by_reference = set()  # type: t.Set[str]
+        self.rebound = set()  # type: t.Set[str]
+        if isinstance(scope, (typed_ast3.FunctionDef, typed_ast3.AsyncFunctionDef)):
+            args = scope.args
+            for arg in args.args + args.kwonlyargs + [args.vararg, args.kwarg]:
+                if arg is not None:
+                    self.rebound.add(arg.arg.lower())
+        for node in typed_ast3.walk(scope):
+            if isinstance(node, (typed_ast3.Global, typed_ast3.Nonlocal)):
+                # also in nested scopes, which could rebind the name
+                self.rebound |= {_.lower() for _ in node.names}
+        for node in _walk_scope(scope):
+            if isinstance(node, typed_ast3.Assign):
+                for target in node.targets:
+                    self._store(target)
+                if node.type_comment and len(node.targets) == 1 \
+                        and isinstance(node.targets[0], typed_ast3.Name):
+                    self.annotations[node.targets[0].id.lower()] = node.type_comment.strip()
+            elif isinstance(node, typed_ast3.AnnAssign):
+                if node.value is not None:
+                    self._store(node.target)
+                if isinstance(node.target, typed_ast3.Name):
+                    self.annotations[node.target.id.lower()] = \
+                        horast.unparse(node.annotation).strip()
+            elif isinstance(node, (typed_ast3.AugAssign, typed_ast3.For, typed_ast3.AsyncFor,
+                                   typed_ast3.comprehension)):
+                self._store(node.target)
+            elif isinstance(node, typed_ast3.withitem) and node.optional_vars is not None:
+                self._store(node.optional_vars)
+            elif isinstance(node, typed_ast3.Delete):
+                for target in node.targets:
+                    self._store(target)
+            elif isinstance(node, typed_ast3.ExceptHandler) and node.name:
+                self.rebound.add(node.name.lower())
+            elif isinstance(node, (typed_ast3.Import, typed_ast3.ImportFrom)):
+                self.rebound |= {(_.asname or _.name.partition('.')[0]).lower()
+                                 for _ in node.names}
+            elif isinstance(node, SCOPE_TYPES) and not isinstance(node, typed_ast3.Lambda):
+                self.rebound.add(node.name.lower())
+            elif isinstance(node, typed_ast3.Call) and call_name(node) not in SAFE_FUNCTIONS:
+                self.passed_by_reference |= {
+                    _.id.lower() for _ in node.args + [_.value for _ in node.keywords]
+                    if isinstance(_, typed_ast3.Name)}
+
+    def _store(self, target: typed_ast3.AST) -> None:
+        for name in _target_names(target):
+            self.store_counts[name.lower()] = self.store_counts.get(name.lower(), 0) + 1
+
+    def shadows(self, name: str) -> bool:
+        """Check if a name is (re)defined in this scope."""
+        return name.lower() in self.store_counts or name.lower() in self.rebound
+
+    def is_constant(self, name: str, value) -> bool:
+        """Check if the only definition of a name can be propagated to all its later uses."""
+        name = name.lower()
+        if self.store_counts.get(name, 0) != 1 or name in self.rebound \
+                or name in self.passed_by_reference:
+            return False
+        return _value_matches_annotation(value, self.annotations.get(name, None))
+
+
+def _value_matches_annotation(value, annotation: t.Optional[str]) -> bool:
+    """Check if literal has the declared type, so that substituting it doesn't change types."""
+    if annotation is None:
+        return True
+    if isinstance(value, np.generic):
+        prefix, _, type_name = annotation.partition('.')
+        return prefix in {'np', 'numpy'} and type_name in NUMPY_SCALAR_TYPES \
+            and getattr(np, type_name) is type(value)
+    return annotation == type(value).__name__
+
+
+def _is_parameter(statement: typed_ast3.AST) -> bool:
+    metadata = get_annotation(statement, 'fortran_metadata', {})
+    return metadata.get('is_constant', False) or metadata.get('is_parameter', False)
+
+
+class ConstantFolder:
+
+    """Propagate constants and fold constant expressions.
+
+    A name is propagated when it is assigned a literal exactly once, at the top level of a scope,
+    when it is not passed by reference to a function which might modify it, and when the literal
+    has the same type as the declared type of the name. Only uses after the assignment are
+    replaced, and only within the same scope -- except for Fortran parameters, which are also
+    propagated to the nested scopes, like procedures contained in a module.
+
+    Expressions with only literal operands are evaluated, including NumPy scalars
+    like np.float32(1.5), whose type is preserved according to NumPy rules. Operations
+    whose result would differ between Python and a compiled target language, like division
+    of integers, are not folded.
+    """
+
+    def __init__(self):
+        self.propagated = 0
+        self.folded = 0
+
+    def visit(self, syntax: typed_ast3.AST) -> typed_ast3.AST:
+        if isinstance(syntax, (typed_ast3.Module, typed_ast3.Interactive, typed_ast3.FunctionDef,
+                               typed_ast3.AsyncFunctionDef, typed_ast3.ClassDef)):
+            self._visit_scope(syntax, {})
+            return syntax
+        return self._rewrite(syntax, {}, {})
+
+    def _visit_scope(self, scope: typed_ast3.AST, parameters: t.Dict[str, t.Any]) -> None:
+        analysis = _ScopeAnalysis(scope)
+        parameters = {name: value for name, value in parameters.items()
+                      if not analysis.shadows(name)}
+        constants = dict(parameters)
+        body = []
+        for statement in scope.body:
+            statement = self._rewrite(statement, constants, parameters)
+            body.append(statement)
+            if isinstance(statement, typed_ast3.Assign) and len(statement.targets) == 1:
+                target = statement.targets[0]
+            elif isinstance(statement, typed_ast3.AnnAssign) and statement.value is not None:
+                target = statement.target
+            else:
+                continue
+            value = constant_value(statement.value)
+            if not isinstance(target, typed_ast3.Name) or value is None \
+                    or not analysis.is_constant(target.id, value):
+                continue
+            _LOG.debug('propagating constant %s = %s', target.id, value)
+            constants[target.id] = value
+            if _is_parameter(statement):
+                parameters[target.id] = value
+        scope.body = body
+
+    def _rewrite_target(self, target: typed_ast3.AST, constants: dict, parameters: dict):
+        if isinstance(target, (typed_ast3.Tuple, typed_ast3.List)):
+            target.elts = [self._rewrite_target(_, constants, parameters) for _ in target.elts]
+        elif isinstance(target, typed_ast3.Starred):
+            target.value = self._rewrite_target(target.value, constants, parameters)
+        elif isinstance(target, typed_ast3.Subscript):
+            target.slice = self._rewrite(target.slice, constants, parameters)
+        return target
+
+    def _rewrite(self, node: typed_ast3.AST, constants: dict, parameters: dict):
+        """Substitute constants in all places where a given node reads values, and fold them."""
+        if isinstance(node, SCOPE_TYPES):
+            if not isinstance(node, typed_ast3.Lambda):
+                self._visit_scope(node, parameters)
+            return node
+        if isinstance(node, typed_ast3.Name):
+            if node.id in constants:
+                self.propagated += 1
+                return make_constant(constants[node.id])
+            return node
+        if isinstance(node, _COMPREHENSION_TYPES):
+            local_names = {name for generator in node.generators
+                           for name in _target_names(generator.target)}
+            constants = {k: v for k, v in constants.items() if k not in local_names}
+        for field, value in typed_ast3.iter_fields(node):
+            if isinstance(node, (typed_ast3.Assign, typed_ast3.Delete)) and field == 'targets':
+                setattr(node, field, [self._rewrite_target(_, constants, parameters)
+                                      for _ in value])
+            elif field in {'target', 'optional_vars'} and value is not None:
+                setattr(node, field, self._rewrite_target(value, constants, parameters))
+            elif isinstance(node, typed_ast3.AnnAssign) and field == 'annotation' \
+                    or isinstance(node, typed_ast3.Attribute) and field == 'value' \
+                    or isinstance(node, typed_ast3.Call) and field == 'func':
+                continue
+            elif isinstance(node, typed_ast3.Call) and field in {'args', 'keywords'} \
+                    and call_name(node) not in SAFE_FUNCTIONS:
+                # variables might be passed by reference, and literals might have another kind
+                setattr(node, field, [self._rewrite_argument(_, constants, parameters)
+                                      for _ in value])
+            elif isinstance(value, list):
+                setattr(node, field, [self._rewrite(_, constants, parameters)
+                                      if isinstance(_, typed_ast3.AST) else _ for _ in value])
+            elif isinstance(value, typed_ast3.AST):
+                setattr(node, field, self._rewrite(value, constants, parameters))
+        if not isinstance(node, typed_ast3.expr):
+            return node
+        folded = fold_expression(node)
+        if folded is not node:
+            self.folded += 1
+        return folded
+
+    def _rewrite_argument(self, arg: typed_ast3.AST, constants: dict, parameters: dict):
+        if isinstance(arg, typed_ast3.keyword):
+            if not isinstance(arg.value, typed_ast3.Name):
+                arg.value = self._rewrite(arg.value, constants, parameters)
+            return arg
+        if isinstance(arg, typed_ast3.Name):
+            return arg
+        return self._rewrite(arg, constants, parameters)
+
+
+def fold_constants(syntax: typed_ast3.AST) -> typed_ast3.AST:
+    """Propagate constants and fold constant expressions in the given syntax."""
+    folder = ConstantFolder()
+    syntax = folder.visit(syntax)
+    _LOG.debug('propagated %i constants and folded %i expressions',
+               folder.propagated, folder.folded)
+    return syntax
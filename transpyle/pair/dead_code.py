@@ -0,0 +1,351 @@
+"""Elimination of unreachable statements, dead assignments and unused declarations."""
+
+import logging
+import typing as t
+
+import horast.nodes as horast_nodes
+import typed_ast.ast3 as typed_ast3
+
+from .ast_annotations import get_annotation
+from .call_graph import SCOPE_TYPES, stored_names, walk_scope
+from .constant_folding import SAFE_FUNCTIONS, constant_value
+from .loop_analysis import call_name
+from .vectorization import ARRAY_CONSTRUCTORS
+
+_LOG = logging.getLogger(__name__)
+
+TERMINATING_FUNCTIONS = {'exit', 'quit', 'sys.exit'}
+
+SIDE_EFFECT_FREE_FUNCTIONS = SAFE_FUNCTIONS - {'print'} \
+    | {'np.{}'.format(_) for _ in ARRAY_CONSTRUCTORS}
+
+REMOVABLE_METADATA = {'is_declaration', 'is_constant', 'is_parameter'}
+"""Fortran metadata of assignments and declarations that doesn't prevent their removal.
+
+Other attributes, like save, target or pointer, make the variable observable
+outside of the normal data flow, and so such variables are never eliminated.
+"""
+
+_BODY_FIELDS = ('body', 'orelse', 'finalbody')
+
+_SUPPORTED_STATEMENTS = (
+    typed_ast3.Assign, typed_ast3.AnnAssign, typed_ast3.AugAssign, typed_ast3.Expr,
+    typed_ast3.If, typed_ast3.For, typed_ast3.While, typed_ast3.Break, typed_ast3.Continue,
+    typed_ast3.Return, typed_ast3.Raise, typed_ast3.Pass, typed_ast3.Delete, typed_ast3.Assert,
+    typed_ast3.Import, typed_ast3.ImportFrom, typed_ast3.Global, typed_ast3.Nonlocal,
+    horast_nodes.Comment, horast_nodes.Directive)
+
+
+def is_terminating(statement: typed_ast3.AST) -> bool:
+    """Check if statement always transfers control, so that statements after it never run."""
+    if isinstance(statement, (typed_ast3.Return, typed_ast3.Raise, typed_ast3.Break,
+                              typed_ast3.Continue)):
+        return True
+    return isinstance(statement, typed_ast3.Expr) and isinstance(statement.value, typed_ast3.Call) \
+        and call_name(statement.value) in TERMINATING_FUNCTIONS
+
+
+def _is_goto(node: typed_ast3.AST) -> bool:
+    """Check if node is a placeholder of Fortran goto statement."""
+    return isinstance(node, typed_ast3.Call) and call_name(node) == 'print' \
+        and node.args and isinstance(node.args[0], typed_ast3.Str) and node.args[0].s == 'goto'
+
+
+def _is_comment(statement: typed_ast3.AST) -> bool:
+    return isinstance(statement, (horast_nodes.Comment, horast_nodes.Directive))
+
+
+def _is_metadata_comment(statement: typed_ast3.AST) -> bool:
+    return isinstance(statement, horast_nodes.Comment) \
+        and statement.comment.startswith(' Fortran metadata:')
+
+
+def _metadata(statement: typed_ast3.AST) -> t.Dict[str, t.Any]:
+    return get_annotation(statement, 'fortran_metadata', {})
+
+
+def remove_unreachable(body: t.List[typed_ast3.AST]) -> t.List[typed_ast3.AST]:
+    """Remove statements that follow a terminating statement, and branches never taken.
+
+    Comments and directives are preserved, even after terminating statements.
+    """
+    new_body = []
+    reachable = True
+    for statement in body:
+        if not reachable:
+            if _is_comment(statement):
+                new_body.append(statement)
+            else:
+                _LOG.debug('removing unreachable statement %s', type(statement).__name__)
+            continue
+        if isinstance(statement, (typed_ast3.If, typed_ast3.While)) \
+                and not _metadata(statement).get('is_select', False):
+            test = constant_value(statement.test)
+            if isinstance(test, bool) and (isinstance(statement, typed_ast3.If) or not test):
+                branch = statement.body if test else statement.orelse
+                new_body += remove_unreachable(branch)
+                reachable = not any(is_terminating(_) for _ in branch)
+                continue
+        if not isinstance(statement, SCOPE_TYPES):
+            for field in _BODY_FIELDS:
+                if isinstance(getattr(statement, field, None), list):
+                    setattr(statement, field, remove_unreachable(getattr(statement, field)))
+            for handler in getattr(statement, 'handlers', []):
+                handler.body = remove_unreachable(handler.body)
+        new_body.append(statement)
+        if is_terminating(statement):
+            reachable = False
+    if body and not new_body:
+        new_body.append(typed_ast3.Pass())
+    return new_body
+
+
+def _nested_scopes(node: typed_ast3.AST) -> t.Iterator[typed_ast3.AST]:
+    """Find functions, lambdas and classes defined directly in the given scope."""
+    for child in typed_ast3.iter_child_nodes(node):
+        if isinstance(child, SCOPE_TYPES):
+            yield child
+        else:
+            yield from _nested_scopes(child)
+
+
+def _loaded_names(node: typed_ast3.AST) -> t.Set[str]:
+    return {_.id for _ in walk_scope(node) if isinstance(_, typed_ast3.Name)}
+
+
+def _is_side_effect_free(node: typed_ast3.AST) -> bool:
+    for child in walk_scope(node):
+        if isinstance(child, typed_ast3.Call) \
+                and call_name(child) not in SIDE_EFFECT_FREE_FUNCTIONS:
+            return False
+        if isinstance(child, (typed_ast3.Yield, typed_ast3.YieldFrom, typed_ast3.Await,
+                              typed_ast3.Lambda)):
+            return False
+    return True
+
+
+def _argument_names(node: typed_ast3.AST) -> t.Set[str]:
+    """Find variables that are passed to a call which might modify them, e.g. by reference."""
+    names = set()
+
+    def add(arg):
+        if isinstance(arg, typed_ast3.Name):
+            names.add(arg.id.lower())
+        elif isinstance(arg, (typed_ast3.Tuple, typed_ast3.List)):
+            for elt in arg.elts:
+                add(elt)
+        elif isinstance(arg, typed_ast3.Starred):
+            add(arg.value)
+
+    for child in walk_scope(node):
+        if isinstance(child, typed_ast3.Call) and call_name(child) not in SAFE_FUNCTIONS:
+            for arg in child.args + [_.value for _ in child.keywords]:
+                add(arg)
+    return names
+
+
+class _Liveness:
+
+    """Backward liveness analysis of variables in a function with structured control flow.
+
+    Assignments to local variables that are not live after the assignment are recorded as dead.
+    Names are compared case-insensitively when deciding if a variable is live, because Fortran
+    identifiers are case-insensitive.
+    """
+
+    def __init__(self, removable: t.Set[str], live_at_exit: t.Set[str]):
+        self.removable = removable
+        self.live_at_exit = live_at_exit
+        self.dead = {}  # type: t.Dict[int, bool]
+        self._loops = []  # type: t.List[t.Tuple[t.Set[str], t.Set[str]]]
+
+    @staticmethod
+    def _is_live(name: str, live: t.Set[str]) -> bool:
+        name = name.lower()
+        return any(_.lower() == name for _ in live)
+
+    def _assignment(self, statement, target, value, live: t.Set[str]) -> t.Set[str]:
+        if not isinstance(target, typed_ast3.Name):
+            return live | _loaded_names(statement)
+        is_augmented = isinstance(statement, typed_ast3.AugAssign)
+        dead = target.id.lower() in self.removable and not self._is_live(target.id, live) \
+            and _is_side_effect_free(value) \
+            and set(_metadata(statement)) <= REMOVABLE_METADATA
+        self.dead[id(statement)] = dead
+        if dead:
+            return live
+        live = set(live) if is_augmented else live - {target.id}
+        live |= _loaded_names(value)
+        if isinstance(statement, typed_ast3.AnnAssign):
+            live |= _loaded_names(statement.annotation)
+        return live
+
+    def block(self, body: t.List[typed_ast3.AST], live: t.Set[str]) -> t.Set[str]:
+        for statement in reversed(body):
+            live = self.statement(statement, live)
+        return live
+
+    def statement(self, statement: typed_ast3.AST, live: t.Set[str]) -> t.Set[str]:
+        if isinstance(statement, (typed_ast3.Assign, typed_ast3.AnnAssign, typed_ast3.AugAssign)):
+            targets = getattr(statement, 'targets', [getattr(statement, 'target', None)])
+            if statement.value is None:
+                return live | _loaded_names(statement.annotation)
+            if len(targets) == 1:
+                return self._assignment(statement, targets[0], statement.value, live)
+            return live - set(stored_names(statement)) | _loaded_names(statement.value)
+        if isinstance(statement, typed_ast3.If):
+            return _loaded_names(statement.test) | self.block(statement.body, live) \
+                | self.block(statement.orelse, live)
+        if isinstance(statement, (typed_ast3.For, typed_ast3.While)):
+            return self._loop(statement, live)
+        if isinstance(statement, typed_ast3.Break):
+            return set(self._loops[-1][0])
+        if isinstance(statement, typed_ast3.Continue):
+            return set(self._loops[-1][1])
+        if isinstance(statement, (typed_ast3.Return, typed_ast3.Raise)):
+            return self.live_at_exit | _loaded_names(statement)
+        if is_terminating(statement):
+            return self.live_at_exit | _loaded_names(statement)
+        return live | _loaded_names(statement)
+
+    def _loop(self, loop: typed_ast3.AST, live: t.Set[str]) -> t.Set[str]:
+        after_loop = self.block(loop.orelse, live)
+        header = set(after_loop)
+        while True:
+            self._loops.append((live, header))
+            body_in = self.block(loop.body, header)
+            self._loops.pop()
+            if isinstance(loop, typed_ast3.For):
+                if isinstance(loop.target, typed_ast3.Name):
+                    body_in = body_in - {loop.target.id}
+                else:
+                    body_in = body_in | _loaded_names(loop.target)
+            new_header = after_loop | body_in
+            if isinstance(loop, typed_ast3.While):
+                new_header |= _loaded_names(loop.test)
+            if new_header == header:
+                break
+            header = new_header
+        if isinstance(loop, typed_ast3.For):
+            return header | _loaded_names(loop.iter)
+        return header
+
+
+def _remove_statements(body: t.List[typed_ast3.AST], dead: t.Set[int]) -> t.List[typed_ast3.AST]:
+    new_body = []
+    removed_previous = False
+    for statement in body:
+        if id(statement) in dead or removed_previous and _is_metadata_comment(statement):
+            removed_previous = True
+            continue
+        removed_previous = False
+        for field in _BODY_FIELDS:
+            if isinstance(getattr(statement, field, None), list):
+                setattr(statement, field, _remove_statements(getattr(statement, field), dead))
+                if not getattr(statement, field) and field == 'body':
+                    statement.body.append(typed_ast3.Pass())
+        new_body.append(statement)
+    return new_body
+
+
+class DeadCodeEliminator:
+
+    """Remove unreachable statements, dead assignments and unused declarations.
+
+    Unreachable statements are removed everywhere. Dead assignments and unused declarations
+    are removed only from functions, and only for local variables. A variable is not local
+    when it is an argument (which might have intent(out) or intent(inout) in Fortran),
+    the Fortran function result, a module variable not redeclared in the function,
+    a variable declared global or nonlocal, a variable with attributes like save, pointer
+    or target, a variable initialized in its Fortran declaration (which implies save),
+    or a variable passed to a function which might modify it, like a member of a common block.
+
+    Functions that contain control flow the analysis doesn't handle, like exception handling,
+    goto statements or nested functions, are left unchanged, except for unreachable statements.
+    """
+
+    def __init__(self):
+        self.removed = 0
+
+    def visit(self, syntax: typed_ast3.AST, outer_names: t.FrozenSet[str] = frozenset()):
+        if isinstance(syntax, (typed_ast3.FunctionDef, typed_ast3.AsyncFunctionDef)):
+            syntax.body = remove_unreachable(syntax.body)
+            self._eliminate(syntax, outer_names)
+            return syntax
+        if not hasattr(syntax, 'body') or not isinstance(syntax.body, list):
+            return syntax
+        syntax.body = remove_unreachable(syntax.body)
+        names = outer_names | {_.lower() for _ in stored_names(syntax)} \
+            | {_.name.lower() for _ in syntax.body
+               if isinstance(_, (typed_ast3.FunctionDef, typed_ast3.ClassDef))}
+        for node in _nested_scopes(syntax):
+            self.visit(node, frozenset(names))
+        return syntax
+
+    def _eliminate(self, function: typed_ast3.FunctionDef, outer_names: t.FrozenSet[str]):
+        if any(True for _ in _nested_scopes(function)):
+            _LOG.debug('not eliminating dead code in "%s": it has nested scopes', function.name)
+            return
+        for node in walk_scope(function):
+            if _is_goto(node) or isinstance(node, typed_ast3.stmt) \
+                    and not isinstance(node, _SUPPORTED_STATEMENTS + SCOPE_TYPES):
+                _LOG.debug('not eliminating dead code in "%s": unsupported %s',
+                           function.name, type(node).__name__)
+                return
+        args = function.args
+        arguments = {_.arg.lower() for _ in args.args + args.kwonlyargs
+                     + [args.vararg, args.kwarg] if _ is not None}
+        declared = {}  # type: t.Dict[str, typed_ast3.AnnAssign]
+        pinned = set(arguments) | {function.name.lower()} | _argument_names(function)
+        for node in walk_scope(function):
+            if isinstance(node, (typed_ast3.Global, typed_ast3.Nonlocal)):
+                pinned |= {_.lower() for _ in node.names}
+            elif isinstance(node, typed_ast3.AnnAssign) \
+                    and isinstance(node.target, typed_ast3.Name):
+                metadata = _metadata(node)
+                if not set(metadata) <= REMOVABLE_METADATA - {'is_constant'} \
+                        or metadata and node.value is not None \
+                        and not metadata.get('is_parameter', False):
+                    pinned.add(node.target.id.lower())
+                declared[node.target.id.lower()] = node
+        local_names = {_.lower() for _ in stored_names(function)}
+        local_names = {_ for _ in local_names if _ in declared or _ not in outer_names}
+        removable = local_names - pinned
+        live_at_exit = {_ for _ in local_names | _loaded_names(function) | set(outer_names)
+                        if _.lower() not in removable}
+        liveness = _Liveness(removable, live_at_exit)
+        liveness.block(function.body, set(live_at_exit))
+        dead = {statement for statement, is_dead in liveness.dead.items() if is_dead}
+
+        for name, declaration in declared.items():
+            if name in removable and declaration.value is None \
+                    and not self._is_referenced(function, declaration, name, dead):
+                dead.add(id(declaration))
+        if not dead:
+            return
+        _LOG.debug('removing %i dead statements from "%s"', len(dead), function.name)
+        self.removed += len(dead)
+        function.body = _remove_statements(function.body, dead)
+
+    @staticmethod
+    def _is_referenced(function, declaration, name: str, dead: t.Set[int]) -> bool:
+        """Check if a name is used anywhere in the function, except in its declaration."""
+        for statement in walk_scope(function):
+            if statement is declaration or id(statement) in dead \
+                    or not isinstance(statement, typed_ast3.stmt):
+                continue
+            for node in typed_ast3.iter_child_nodes(statement):
+                if isinstance(node, typed_ast3.stmt):
+                    continue
+                if any(isinstance(_, typed_ast3.Name) and _.id.lower() == name
+                       for _ in walk_scope(node)):
+                    return True
+        return False
+
+
+def eliminate_dead_code(syntax: typed_ast3.AST) -> typed_ast3.AST:
+    """Remove unreachable statements, dead assignments and unused declarations."""
+    eliminator = DeadCodeEliminator()
+    syntax = eliminator.visit(syntax)
+    _LOG.debug('removed %i dead statements and declarations', eliminator.removed)
+    return syntax
@@ -1,7 +1,9 @@
 """Preliminary implementation of inlining."""
 
-import copy
+import collections.abc
 import functools
+import hashlib
+import linecache
 import logging
 import pathlib
 import tempfile
@@ -17,7 +19,10 @@ import typed_astunparse
 from ..general import Language, CodeReader, Parser, CodeWriter
 from ..general.misc import flatten_syntax
 from .assertions import names_equivalent
-from .ast_query import ReturnFinder
+from .ast_annotations import deepcopy_ast, get_annotation, preserving_annotations
+from .ast_query import ReturnFinder, SyntaxIndex
+from .call_graph import CallSite, CallGraph, body_size, stored_names, walk_scope
+from .loop_analysis import PURE_FUNCTIONS, call_name
 from .manipulate import convert_return_to_assign
 
 _LOG = logging.getLogger(__name__)
@@ -57,13 +62,13 @@ class DeclarationReplacer(st.ast_manipulation.RecursiveAstTransformer[typed_ast3
             return _
         if not isinstance(declaration, (typed_ast3.Assign, typed_ast3.AnnAssign)):
             return declaration
-        intent = getattr(declaration, 'fortran_metadata', {}).get('intent', None)
+        intent = get_annotation(declaration, 'fortran_metadata', {}).get('intent', None)
         if intent in {'in', 'out', 'inout'}:
             _ = horast_nodes.Comment(
                 ' skipping intent({}) declaration when inlining'.format(intent), eol=False)
             self.replaced.append((declaration, _))
             return _
-        if getattr(declaration, 'fortran_metadata', {}).get('is_declaration', False):
+        if get_annotation(declaration, 'fortran_metadata', {}).get('is_declaration', False):
             # TODO: it's a hack
             _ = horast_nodes.Comment(' skipping a declaration when inlining', eol=False)
             self.replaced.append((declaration, _))
@@ -79,7 +84,7 @@ class DeclarationReplacer(st.ast_manipulation.RecursiveAstTransformer[typed_ast3
 
 def replace_name(arg, value, name):
     if isinstance(name, typed_ast3.Name) and name.id == arg:
-        return value
+        return deepcopy_ast(value)
     return name
 
 
@@ -112,6 +117,7 @@ class CallInliner(st.ast_manipulation.RecursiveAstTransformer[typed_ast3]):
             _LOG.warning('default values for inlined function parameters will be ignored!')
 
         self._body = None
+        self._paths_to_calls = None  # type: t.Optional[t.Set[int]]
         self._omitted_declarations = []
         self._inlined_function = inlined_function
         self._inlined_args = [arg.arg for arg in inlined_function.args.args]
@@ -121,7 +127,7 @@ class CallInliner(st.ast_manipulation.RecursiveAstTransformer[typed_ast3]):
 
         last_statement = self._inlined_function.body[-1]
         return_finder = ReturnFinder()
-        return_finder.visit(self._inlined_function)
+        return_finder.visit_index(SyntaxIndex(self._inlined_function))
         _LOG.warning('last statement is: %s', last_statement)
         if len(self._inlined_function.body) == 1 and isinstance(last_statement, typed_ast3.Return):
             self._valid_inlining_contexts |= {t.Any}
@@ -203,7 +209,8 @@ class CallInliner(st.ast_manipulation.RecursiveAstTransformer[typed_ast3]):
             inlined_statements.append(
                 horast_nodes.Comment(' inlined {}'.format(call_code), eol=False))
         for stmt in self._inlined_function.body:
-            stmt = st.augment(copy.deepcopy(stmt), eval_=False)
+            stmt = preserving_annotations(
+                lambda stmt_: st.augment(deepcopy_ast(stmt_), eval_=False), stmt)
             for replacer in replacers:
                 stmt = replacer.visit(stmt)
             if stmt is not None:
@@ -219,13 +226,27 @@ class CallInliner(st.ast_manipulation.RecursiveAstTransformer[typed_ast3]):
             return inlined_statements[0]
         return inlined_statements
 
+    def _find_paths_to_calls(self, target) -> t.Set[int]:
+        """Find ids of calls that may be inlined within the target, and of all their ancestors."""
+        index = SyntaxIndex(target)
+        paths = set()
+        for call in index.find(types=(typed_ast3.Call,), predicate=self._is_target_for_inlining):
+            paths.add(id(call))
+            paths.update(id(_) for _ in index.ancestors(call))
+        return paths
+
     def visit(self, node):
         first_call = False
         if self._body is None:
             first_call = True
             self._body = node.body
+            self._paths_to_calls = self._find_paths_to_calls(node)
             _LOG.warning('%s is the target', node)
-        node = super().visit(node)
+        try:
+            node = super().visit(node)
+        finally:
+            if first_call:
+                self._paths_to_calls = None
         flatten_syntax[typed_ast3](node)
         if first_call:
             if self._omitted_declarations:
@@ -234,7 +255,7 @@ class CallInliner(st.ast_manipulation.RecursiveAstTransformer[typed_ast3]):
                 for orig, repl in reversed(self._omitted_declarations):
                     if any(_ is orig for _ in inserted):
                         continue
-                    intent = getattr(orig, 'fortran_metadata', {}).get('intent', None)
+                    intent = get_annotation(orig, 'fortran_metadata', {}).get('intent', None)
                     if intent in {'in', 'out', 'inout'}:
                         continue
                     _LOG.warning('inserting omitted decl %s', orig)
@@ -243,7 +264,13 @@ class CallInliner(st.ast_manipulation.RecursiveAstTransformer[typed_ast3]):
         return node
 
     def generic_visit(self, node):
-        """Copied implementation from parent class - get rid of it at some point."""
+        """Copied implementation from parent class - get rid of it at some point.
+
+        Subtrees that contain no calls to be inlined are not traversed.
+        """
+        if self._paths_to_calls is not None and isinstance(node, typed_ast3.AST) \
+                and id(node) not in self._paths_to_calls:
+            return node
         if not self._fields_first:
             _LOG.debug('visiting node %s', node)
             node = self.visit_node(node)
@@ -267,8 +294,8 @@ class CallInliner(st.ast_manipulation.RecursiveAstTransformer[typed_ast3]):
         if len(self._inlined_args) != len(call.args):
             # raise ValueError(  # TODO: TMP
             _LOG.warning(
-                'Inlined function has {} parameters: {}, but target call has {} arguments: {}.'
-                .format(len(self._inlined_args), self._inlined_args, len(call.args), call.args))
+                'Inlined function has %i parameters: %s, but target call has %i arguments: %s.',
+                len(self._inlined_args), self._inlined_args, len(call.args), call.args)
         return True
 
     def visit_node(self, node):
@@ -307,39 +334,106 @@ class CallInliner(st.ast_manipulation.RecursiveAstTransformer[typed_ast3]):
 def inline_syntax(target: typed_ast3.FunctionDef, inlined_function: typed_ast3.FunctionDef,
                   globals_=None, *args, **kwargs) -> typed_ast3.FunctionDef:
     if not isinstance(target, st.nodes.StaticallyTypedFunctionDef[typed_ast3]):
-        target = st.augment(target, eval_=False, globals_=globals_)
+        target = preserving_annotations(st.augment, target, eval_=False, globals_=globals_)
     if not isinstance(inlined_function, st.nodes.StaticallyTypedFunctionDef[typed_ast3]):
-        inlined_function = st.augment(inlined_function, eval_=False, globals_=globals_)
+        inlined_function = preserving_annotations(
+            st.augment, inlined_function, eval_=False, globals_=globals_)
     call_inliner = CallInliner(inlined_function, *args, **kwargs)
     target = call_inliner.visit(target)
     assert isinstance(target, typed_ast3.FunctionDef)
     return target
 
 
-def inline(target_function, inlined_function, globals_=None) -> object:
+@functools.lru_cache(maxsize=None)
+def _python_parser() -> Parser:
+    return Parser.find(Language.find('Python 3'))()
+
+
+def _source_hash(code: str) -> str:
+    return hashlib.sha256(code.encode()).hexdigest()
+
+
+class _IdentityKey:
+
+    """Make an unhashable object, like a dict of globals, usable as a cache key by identity.
+
+    The key references the object, so that its id is not reused while the key is cached.
+    """
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return isinstance(other, _IdentityKey) and other.value is self.value
+
+    def __hash__(self):
+        return id(self.value)
+
+
+def _function_syntax(code: str, globals_=None) -> st.nodes.StaticallyTypedFunctionDef[typed_ast3]:
+    """Get parsed and augmented syntax of function, reusing it if the same code was seen before
+    with the same globals.
+
+    The returned syntax is shared and must not be modified.
+    """
+    return _cached_function_syntax(code, _IdentityKey(globals_))
+
+
+@functools.lru_cache(maxsize=256)
+def _cached_function_syntax(code: str, globals_key: _IdentityKey):
+    syntax = _python_parser().parse(code).body[0]
+    return st.augment(syntax, eval_=False, globals_=globals_key.value)
+
+
+@functools.lru_cache(maxsize=256)
+def _inlined_code(target_code: str, inlined_code: str, target_name: str,
+                  globals_key: _IdentityKey) -> t.Tuple[str, str, types.CodeType]:
+    """Inline all calls in the target code and compile the result.
+
+    Return the inlined code, the file name it was compiled with, and the code object.
+    """
+    target_syntax = deepcopy_ast(_function_syntax(target_code, globals_key.value))
+    inlined_syntax = _function_syntax(inlined_code, globals_key.value)
+    target_inlined_syntax = inline_syntax(target_syntax, inlined_syntax, verbose=False)
+    target_inlined_code = horast.unparse(target_inlined_syntax).lstrip()
+    filename = 'transpyle_inlined_{}_{}.py'.format(
+        target_name, _source_hash(target_inlined_code)[:16])
+    code_obj = compile(target_inlined_code, filename=filename, mode='exec')
+    return target_inlined_code, filename, code_obj
+
+
+def _register_source(filename: str, code: str) -> None:
+    """Make in-memory code available to inspect.getsource() and tracebacks."""
+    linecache.cache[filename] = (len(code), None, code.splitlines(keepends=True), filename)
+
+
+def inline(target_function, inlined_function, globals_=None, debug: bool = False) -> object:
     """Inline all calls to given inlined function within the target.
 
     Can be used as decorator.
+
+    Inlining is done in memory, and the resulting code is cached by the source code
+    of both functions and by the globals. The code is written to a file only if debug is True.
     """
     assert isinstance(target_function, types.FunctionType)
     assert isinstance(inlined_function, types.FunctionType)
-    language = Language.find('Python 3')
-    parser = Parser.find(language)()
     target_code = CodeReader.read_function(target_function)
     inlined_code = CodeReader.read_function(inlined_function)
-    target_syntax = parser.parse(target_code).body[0]
-    inlined_syntax = parser.parse(inlined_code).body[0]
-    target_inlined_syntax = inline_syntax(target_syntax, inlined_syntax, globals_=globals_,
-                                          verbose=False)
-    target_inlined_code = horast.unparse(target_inlined_syntax).lstrip()
+    target_inlined_code, filename, code_obj = _inlined_code(
+        target_code, inlined_code, target_function.__name__, _IdentityKey(globals_))
+
+    if debug:
+        with tempfile.NamedTemporaryFile(suffix='.py', delete=False) as output_file:
+            target_inlined_path = pathlib.Path(output_file.name)
+        CodeWriter('.py').write_file(target_inlined_code, target_inlined_path)
+        _LOG.warning('inlined %s into %s, result is in "%s"',
+                     inlined_function.__name__, target_function.__name__, target_inlined_path)
+        code_obj = compile(target_inlined_code, filename=str(target_inlined_path), mode='exec')
+    else:
+        _register_source(filename, target_inlined_code)
 
-    with tempfile.NamedTemporaryFile(suffix='.py', delete=False) as output_file:
-        # TODO: this leaves garbage behind in /tmp/ but is neeeded by subsequent transpiler passes
-        code_writer = CodeWriter('.py')
-        target_inlined_path = pathlib.Path(output_file.name)
-        code_writer.write_file(target_inlined_code, target_inlined_path)
-
-    code_obj = compile(target_inlined_code, filename=str(target_inlined_path), mode='exec')
     if globals_ is None:
         globals_ = {'__builtins__': globals()['__builtins__']}
     locals_ = {}
@@ -349,3 +443,182 @@ def inline(target_function, inlined_function, globals_=None) -> object:
     target_inlined_function = locals_[target_function.__name__]
     assert isinstance(target_inlined_function, types.FunctionType)
     return target_inlined_function
+
+
+SIMPLE_ARGUMENT_TYPES = (
+    typed_ast3.Name, typed_ast3.Num, typed_ast3.Str, typed_ast3.NameConstant,
+    typed_ast3.Attribute, typed_ast3.Subscript, typed_ast3.Index, typed_ast3.Slice,
+    typed_ast3.ExtSlice, typed_ast3.Tuple, typed_ast3.BinOp, typed_ast3.UnaryOp,
+    typed_ast3.BoolOp, typed_ast3.Compare, typed_ast3.expr_context, typed_ast3.operator,
+    typed_ast3.unaryop, typed_ast3.boolop, typed_ast3.cmpop)
+
+TRIVIAL_ARGUMENT_TYPES = (typed_ast3.Name, typed_ast3.Num, typed_ast3.Str, typed_ast3.NameConstant)
+
+
+def _parameter_intents(function: typed_ast3.FunctionDef) -> t.Dict[str, t.Optional[str]]:
+    return {stmt.target.id: get_annotation(stmt, 'fortran_metadata', {}).get('intent', None)
+            for stmt in function.body
+            if isinstance(stmt, typed_ast3.AnnAssign) and isinstance(stmt.target, typed_ast3.Name)}
+
+
+def _may_modify_arguments(function: typed_ast3.FunctionDef) -> bool:
+    """Check if function stores through a subscript or an attribute, or calls a function
+    that is not known to be pure, and therefore may modify objects passed to it."""
+
+    def is_reference(target) -> bool:
+        if isinstance(target, (typed_ast3.Tuple, typed_ast3.List)):
+            return any(is_reference(_) for _ in target.elts)
+        if isinstance(target, typed_ast3.Starred):
+            return is_reference(target.value)
+        return isinstance(target, (typed_ast3.Subscript, typed_ast3.Attribute))
+
+    for node in walk_scope(function):
+        if isinstance(node, (typed_ast3.Assign, typed_ast3.Delete)):
+            targets = node.targets
+        elif isinstance(node, (typed_ast3.AugAssign, typed_ast3.AnnAssign, typed_ast3.For)):
+            targets = [node.target]
+        elif isinstance(node, typed_ast3.withitem) and node.optional_vars is not None:
+            targets = [node.optional_vars]
+        elif isinstance(node, typed_ast3.Call) and call_name(node) not in PURE_FUNCTIONS:
+            return True
+        else:
+            continue
+        if any(is_reference(_) for _ in targets):
+            return True
+    return False
+
+
+class SelectedCallInliner(CallInliner):
+
+    """Inline only the given calls, rather than all calls of the inlined function."""
+
+    def __init__(self, inlined_function: typed_ast3.FunctionDef, calls: t.Set[int],
+                 *args, **kwargs):
+        super().__init__(inlined_function, *args, **kwargs)
+        self._calls = calls
+
+    def _is_target_for_inlining(self, call) -> bool:
+        return id(call) in self._calls and super()._is_target_for_inlining(call)
+
+
+class InliningCostModel:
+
+    """Decide which calls are worth inlining, based on size of callee and frequency of call.
+
+    Only frequently executed calls of small leaf functions are inlined, i.e. calls of functions
+    that don't call other functions defined in the analyzed code. A call is frequent
+    if it is estimated to execute at least min_call_frequency times, which by default means
+    it is within a loop.
+    """
+
+    def __init__(self, max_body_size: int = 40, min_call_frequency: int = 10):
+        self.max_body_size = max_body_size
+        self.min_call_frequency = min_call_frequency
+
+    def is_inlinable(self, graph: CallGraph, name: str) -> bool:
+        """Check if a function can be inlined and is small enough to be worth it."""
+        if not graph.is_leaf(name):
+            return False
+        function = graph.functions[name]
+        args = function.args
+        if function.decorator_list or args.vararg is not None or args.kwarg is not None \
+                or args.kwonlyargs or not function.body:
+            return False
+        if name in stored_names(function):
+            _LOG.debug('not inlining %s: result is assigned to function name', name)
+            return False
+        return body_size(function) <= self.max_body_size
+
+    def _arguments_are_valid(self, site: CallSite, function: typed_ast3.FunctionDef) -> bool:
+        call = site.call
+        params = [_.arg for _ in function.args.args]
+        if call.keywords or len(call.args) != len(params):
+            return False
+        if not all(isinstance(node, SIMPLE_ARGUMENT_TYPES)
+                   for arg in call.args for node in typed_ast3.walk(arg)):
+            return False
+        # arguments are substituted into the inlined body, and therefore evaluated at each use
+        if not all(isinstance(arg, TRIVIAL_ARGUMENT_TYPES) for arg in call.args) \
+                and _may_modify_arguments(function):
+            _LOG.debug('not inlining %s: it may modify values used by its arguments',
+                       site.callee)
+            return False
+        stored = stored_names(function)
+        intents = _parameter_intents(function)
+        for param, arg in zip(params, call.args):
+            if param in stored and (intents.get(param) not in {'out', 'inout'}
+                                    or not isinstance(arg, (typed_ast3.Name,
+                                                            typed_ast3.Subscript))):
+                return False
+        return True
+
+    def _names_are_valid(self, graph: CallGraph, site: CallSite) -> bool:
+        function = graph.functions[site.callee]
+        caller = site.caller
+        caller_locals = {_.arg for _ in caller.args.args} | stored_names(caller)
+        caller_names = caller_locals | {
+            _.id for _ in walk_scope(caller) if isinstance(_, typed_ast3.Name)}
+        callee_locals = stored_names(function) - {_.arg for _ in function.args.args}
+        free_names = graph.free_names(site.callee)
+        if callee_locals & caller_names or free_names & caller_locals:
+            _LOG.debug('not inlining %s into %s: names collide', site.callee, caller.name)
+            return False
+        caller_module = graph.modules[caller.name]
+        if graph.modules[site.callee] is not caller_module \
+                and not free_names <= graph.module_names(caller_module):
+            _LOG.debug('not inlining %s into %s: %s not available', site.callee, caller.name,
+                       free_names - graph.module_names(caller_module))
+            return False
+        return True
+
+    def should_inline(self, graph: CallGraph, site: CallSite) -> bool:
+        """Check if a given call should be inlined."""
+        if site.callee not in graph.functions or site.callee == site.caller.name \
+                or not self.is_inlinable(graph, site.callee) \
+                or graph.call_frequency(site) < self.min_call_frequency:
+            return False
+        return self._arguments_are_valid(site, graph.functions[site.callee]) \
+            and self._names_are_valid(graph, site)
+
+
+def inline_hot_calls(
+        syntax: t.Union[typed_ast3.AST, t.Sequence[typed_ast3.AST]],
+        cost_model: t.Optional[InliningCostModel] = None, verbose: bool = False):
+    """Inline frequently executed calls of small functions in a module or in several modules.
+
+    Functions are processed bottom-up, therefore a function that becomes a leaf after calls
+    within it are inlined can be inlined into its callers as well.
+    """
+    modules = list(syntax) if isinstance(syntax, collections.abc.Sequence) else [syntax]
+    if cost_model is None:
+        cost_model = InliningCostModel()
+    graph = CallGraph(*modules)
+    inlined = 0
+    for name in graph.bottom_up_order():
+        caller = graph.functions[name]
+        attempted = set()
+        while True:
+            sites = [site for site in graph.call_sites[name] if site.callee not in attempted
+                     and cost_model.should_inline(graph, site)]
+            if not sites:
+                break
+            callee = sites[0].callee
+            attempted.add(callee)
+            sites = [_ for _ in sites if _.callee == callee]
+            memo = {}
+            inlined_caller = deepcopy_ast(caller, memo)
+            inliner = SelectedCallInliner(
+                graph.functions[callee], {id(memo[id(site.call)]) for site in sites},
+                verbose=verbose)
+            try:
+                inlined_caller = inliner.visit(inlined_caller)
+            except NotImplementedError as err:
+                _LOG.info('failed to inline %s into %s: %s', callee, name, err)
+                continue
+            for field in caller._fields:
+                setattr(caller, field, getattr(inlined_caller, field))
+            graph.update(caller)
+            inlined += len(sites)
+            _LOG.debug('inlined %i calls of %s into %s', len(sites), callee, name)
+    _LOG.info('inlined %i calls in total', inlined)
+    return syntax
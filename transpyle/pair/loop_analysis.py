@@ -0,0 +1,297 @@
+"""Analysis of dependencies between iterations of loops."""
+
+import logging
+import typing as t
+
+import typed_ast.ast3 as typed_ast3
+
+from .call_graph import LOOP_TYPES, SCOPE_TYPES
+
+_LOG = logging.getLogger(__name__)
+
+PURE_FUNCTIONS = {'abs', 'float', 'int', 'len', 'max', 'min', 'range'} | {
+    'np.{}'.format(_) for _ in (
+        'abs', 'absolute', 'amax', 'amin', 'arccos', 'arcsin', 'arctan', 'conj', 'cos', 'cosh',
+        'exp', 'log', 'log10', 'maximum', 'minimum', 'prod', 'sign', 'sin', 'sinh', 'sqrt', 'sum',
+        'tan', 'tanh')}
+
+REDUCTION_OPERATORS = (typed_ast3.Add, typed_ast3.Sub, typed_ast3.Mult)
+
+CONTROL_FLOW_TYPES = (typed_ast3.Break, typed_ast3.Continue, typed_ast3.Return, typed_ast3.Raise,
+                      typed_ast3.Yield, typed_ast3.YieldFrom)
+"""Nodes that make execution of further iterations depend on the current one."""
+
+
+def call_name(call: typed_ast3.Call) -> t.Optional[str]:
+    """Get name of called function as a string like "f" or "np.sqrt", or None if not simple."""
+    func = call.func
+    if isinstance(func, typed_ast3.Name):
+        return func.id
+    if isinstance(func, typed_ast3.Attribute) and isinstance(func.value, typed_ast3.Name):
+        return '{}.{}'.format(func.value.id, func.attr)
+    return None
+
+
+def is_range_loop(loop: typed_ast3.AST) -> bool:
+    """Check if given node is a for-loop over range() with a simple name as a target."""
+    return isinstance(loop, typed_ast3.For) and isinstance(loop.target, typed_ast3.Name) \
+        and isinstance(loop.iter, typed_ast3.Call) and call_name(loop.iter) == 'range' \
+        and not loop.iter.keywords and 1 <= len(loop.iter.args) <= 3 and not loop.orelse
+
+
+def names_used_outside_loops(tree) -> t.Set[str]:
+    """Find names that are used outside of all for-loops that iterate over them."""
+    used = set()
+
+    def collect(node, bound: t.FrozenSet[str]):
+        if isinstance(node, typed_ast3.For) and isinstance(node.target, typed_ast3.Name):
+            collect(node.iter, bound)
+            for stmt in node.body + node.orelse:
+                collect(stmt, bound | {node.target.id})
+            return
+        if isinstance(node, typed_ast3.AnnAssign) and node.value is None:
+            return  # declarations are not uses
+        if isinstance(node, typed_ast3.Name) and node.id not in bound:
+            used.add(node.id)
+        for child in typed_ast3.iter_child_nodes(node):
+            collect(child, bound)
+
+    collect(tree, frozenset())
+    return used
+
+
+class _AccessCollector:
+
+    """Collect reads and writes of variables in a loop body in the order of evaluation."""
+
+    def __init__(self):
+        self.events = []  # type: t.List[t.Tuple[str, str, typed_ast3.AST, bool]]
+        self.unknown_calls = []
+        self.stale_loads = []
+        self.control_flow = []
+        self._conditional = 0
+        self._inner_loop_targets = set()
+        self._active_loop_targets = []
+
+    def collect_body(self, body):
+        for stmt in body:
+            self.collect(stmt)
+
+    def _store(self, target, stmt):
+        if isinstance(target, typed_ast3.Name):
+            self.events.append(('store', target.id, stmt, self._conditional > 0))
+        elif isinstance(target, typed_ast3.Subscript):
+            self.collect(target.slice)
+            if isinstance(target.value, typed_ast3.Name):
+                self.events.append(('store', target.value.id, target, self._conditional > 0))
+            else:
+                self.events.append(('store', None, target, True))
+        elif isinstance(target, (typed_ast3.Tuple, typed_ast3.List)):
+            for elt in target.elts:
+                self._store(elt, stmt)
+        else:
+            self.events.append(('store', None, target, True))
+
+    def collect(self, node):
+        if isinstance(node, (typed_ast3.Assign, typed_ast3.AnnAssign)):
+            if node.value is None:
+                return
+            self.collect(node.value)
+            for target in getattr(node, 'targets', [getattr(node, 'target', None)]):
+                self._store(target, node)
+            return
+        if isinstance(node, typed_ast3.AugAssign):
+            self.collect(node.value)
+            self._store(node.target, node)
+            return
+        if isinstance(node, (typed_ast3.If, typed_ast3.While, typed_ast3.For)):
+            is_loop = isinstance(node, typed_ast3.For) and isinstance(node.target, typed_ast3.Name)
+            if is_loop:
+                # loop target is always assigned before the body is executed
+                self.collect(node.iter)
+                conditional, self._conditional = self._conditional, 0
+                self._store(node.target, node)
+                self._conditional = conditional
+                self._inner_loop_targets.add(node.target.id)
+                self._active_loop_targets.append(node.target.id)
+            else:
+                self.collect(getattr(node, 'test', getattr(node, 'iter', None)))
+                if isinstance(node, typed_ast3.For):
+                    self._store(node.target, node)
+            self._conditional += 1
+            self.collect_body(node.body)
+            self.collect_body(node.orelse)
+            self._conditional -= 1
+            if is_loop:
+                self._active_loop_targets.pop()
+            return
+        if isinstance(node, CONTROL_FLOW_TYPES):
+            self.control_flow.append(node)
+        if isinstance(node, typed_ast3.Call) and call_name(node) not in PURE_FUNCTIONS:
+            self.unknown_calls.append(node)
+        if isinstance(node, typed_ast3.Subscript):
+            self.collect(node.slice)
+            if isinstance(node.value, typed_ast3.Name):
+                self.events.append(('load', node.value.id, node, False))
+            else:
+                self.collect(node.value)
+            return
+        if isinstance(node, typed_ast3.Name):
+            if node.id in self._inner_loop_targets and node.id not in self._active_loop_targets:
+                self.stale_loads.append(node)
+            self.events.append(('load', node.id, node, False))
+            return
+        for child in typed_ast3.iter_child_nodes(node):
+            self.collect(child)
+
+
+def _is_reduction(stmt, name: str) -> bool:
+    """Check if statement is like: name += expr, or name = name op expr."""
+    if isinstance(stmt, typed_ast3.AugAssign):
+        return isinstance(stmt.op, REDUCTION_OPERATORS)
+    if isinstance(stmt, typed_ast3.Assign) and isinstance(stmt.value, typed_ast3.BinOp) \
+            and isinstance(stmt.value.op, REDUCTION_OPERATORS):
+        left = stmt.value.left
+        return isinstance(left, typed_ast3.Name) and left.id == name \
+            and name not in {_.id for _ in typed_ast3.walk(stmt.value.right)
+                             if isinstance(_, typed_ast3.Name)}
+    return False
+
+
+def _reduction_kind(stmt) -> type:
+    """Get the operator of a reduction statement, treating subtraction as addition."""
+    op = stmt.op if isinstance(stmt, typed_ast3.AugAssign) else stmt.value.op
+    return typed_ast3.Add if isinstance(op, typed_ast3.Sub) else type(op)
+
+
+def loop_iterations_independent(loop: typed_ast3.For,
+                                names_used_after: t.Optional[t.Set[str]] = None) -> bool:
+    """Check if iterations of a given for-loop over range() can be executed in any order.
+
+    This holds when:
+
+    * every array element written in the loop is indexed directly by the loop variable,
+      and the array is read only at the very same index;
+    * every scalar assigned in the loop is either a reduction (like s += x[i]) with the same
+      operator in all statements that assign it, where + and - are compatible, or a private
+      temporary that is assigned before it is read in each iteration and is not used after
+      the loop;
+    * only functions without side effects are called;
+    * there are no break, continue, return, raise or yield in the loop body.
+
+    The analysis is conservative: it may reject independent loops, but never accepts
+    loops with dependencies between iterations.
+    """
+    if not is_range_loop(loop):
+        return False
+    index = loop.target.id
+    collector = _AccessCollector()
+    collector.collect_body(loop.body)
+    if collector.unknown_calls:
+        _LOG.debug('loop over "%s" calls unknown functions: %s', index,
+                   [call_name(_) for _ in collector.unknown_calls])
+        return False
+    if collector.control_flow:
+        _LOG.debug('loop over "%s" contains control flow statements: %s', index,
+                   [type(_).__name__ for _ in collector.control_flow])
+        return False
+    if collector.stale_loads:
+        _LOG.debug('loop over "%s" uses inner loop variables after inner loops', index)
+        return False
+
+    stores = {}  # type: t.Dict[str, list]
+    for kind, name, node, conditional in collector.events:
+        if kind != 'store':
+            continue
+        if name is None or name == index:
+            return False
+        stores.setdefault(name, []).append((node, conditional))
+
+    array_subscripts = {}  # type: t.Dict[str, str]
+    for name, name_stores in stores.items():
+        element_stores = [node for node, _ in name_stores
+                          if isinstance(node, typed_ast3.Subscript)]
+        if not element_stores:
+            continue
+        if len(element_stores) != len(name_stores) \
+                or len({typed_ast3.dump(_.slice) for _ in element_stores}) != 1:
+            return False
+        subscript = element_stores[0].slice
+        if not isinstance(subscript, typed_ast3.Index):
+            return False
+        dims = subscript.value.elts if isinstance(subscript.value, typed_ast3.Tuple) \
+            else [subscript.value]
+        if not any(isinstance(dim, typed_ast3.Name) and dim.id == index for dim in dims):
+            return False
+        array_subscripts[name] = typed_ast3.dump(subscript)
+
+    names_used_after = names_used_after or set()
+    for kind, name, node, _ in collector.events:
+        if kind != 'load' or name not in array_subscripts:
+            continue
+        if not isinstance(node, typed_ast3.Subscript) \
+                or typed_ast3.dump(node.slice) != array_subscripts[name]:
+            return False
+
+    for name, name_stores in stores.items():
+        if name in array_subscripts:
+            continue
+        statements = [node for node, _ in name_stores]
+        if all(_is_reduction(stmt, name) for stmt in statements) \
+                and len({_reduction_kind(_) for _ in statements}) == 1:
+            loads = [node for kind, name_, node, _ in collector.events
+                     if kind == 'load' and name_ == name]
+            if len(loads) == sum(isinstance(_, typed_ast3.Assign) for _ in statements):
+                continue
+        first_kind, _, _, first_conditional = next(
+            event for event in collector.events if event[1] == name)
+        if first_kind == 'store' and not first_conditional and name not in names_used_after:
+            continue
+        _LOG.debug('scalar "%s" carries a dependency between iterations of loop over "%s"',
+                   name, index)
+        return False
+    return True
+
+
+class LoopInfo:
+
+    """Loop in a function, with enclosing loops and independence of its iterations."""
+
+    def __init__(self, loop: typed_ast3.AST, enclosing: t.Sequence[typed_ast3.AST],
+                 independent: bool):
+        self.loop = loop
+        self.enclosing = list(enclosing)
+        self.independent = independent
+
+    @property
+    def depth(self) -> int:
+        return len(self.enclosing)
+
+    def __repr__(self):
+        return 'LoopInfo({}, depth {}, {})'.format(
+            type(self.loop).__name__, self.depth,
+            'independent' if self.independent else 'dependent')
+
+
+def find_loops(function: typed_ast3.AST) -> t.List[LoopInfo]:
+    """Find all loops in a given scope, outer loops first.
+
+    Independence of iterations is checked conservatively: all names used outside of loops
+    anywhere in the scope are treated as used after each loop.
+    """
+    used = names_used_outside_loops(function)
+    loops = []
+
+    def collect(node, enclosing):
+        if isinstance(node, SCOPE_TYPES) and node is not function:
+            return
+        if isinstance(node, LOOP_TYPES):
+            independent = is_range_loop(node) and node.target.id not in used \
+                and loop_iterations_independent(node, used)
+            loops.append(LoopInfo(node, enclosing, independent))
+            enclosing = enclosing + [node]
+        for child in typed_ast3.iter_child_nodes(node):
+            collect(child, enclosing)
+
+    collect(function, [])
+    return loops
@@ -0,0 +1,193 @@
+"""Ordered pipeline of PAIR transformations, with caching of analyses between them."""
+
+import logging
+import time
+import typing as t
+
+import typed_ast.ast3 as typed_ast3
+
+from .constant_folding import fold_constants
+from .dead_code import eliminate_dead_code
+from .inlining import inline_hot_calls
+from .simplification import VariableTypes, nonnegative_names, reduce_strength, simplify
+from .structural_hash import structural_hash, clear_structural_hashes
+from .vectorization import vectorize_loops
+
+_LOG = logging.getLogger(__name__)
+
+ANALYSES = {
+    'types': VariableTypes,
+    'nonnegative names': nonnegative_names
+}  # type: t.Dict[str, t.Callable[[typed_ast3.FunctionDef], t.Any]]
+"""Analyses of a single function that can be requested by passes, by name."""
+
+
+def _fingerprint(function: typed_ast3.FunctionDef) -> bytes:
+    return structural_hash(function)
+
+
+class AnalysisCache:
+
+    """Results of analyses of functions, kept until the analyzed function is modified.
+
+    Results are computed on first request. After each pass, the pass manager calls
+    invalidate(), which drops results only for functions that were modified, replaced
+    or removed by that pass, so that analyses of untouched functions are reused.
+    """
+
+    def __init__(self, analyses: t.Optional[t.Mapping[str, t.Callable]] = None):
+        self.analyses = dict(ANALYSES if analyses is None else analyses)
+        self._results = {}  # type: t.Dict[t.Tuple[str, int], t.Any]
+        self._functions = {}  # type: t.Dict[int, t.Tuple[typed_ast3.FunctionDef, bytes]]
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name: str, function: typed_ast3.FunctionDef) -> t.Any:
+        """Get result of a named analysis of a given function."""
+        assert isinstance(function, typed_ast3.FunctionDef), type(function)
+        if name not in self.analyses:
+            raise KeyError('unknown analysis "{}", available analyses are: {}'.format(
+                name, ', '.join(sorted(self.analyses))))
+        key = (name, id(function))
+        if key in self._results:
+            self.hits += 1
+            return self._results[key]
+        self.misses += 1
+        if id(function) not in self._functions:
+            self._functions[id(function)] = (function, _fingerprint(function))
+        result = self.analyses[name](function)
+        self._results[key] = result
+        return result
+
+    def invalidate(self, syntax: typed_ast3.AST) -> int:
+        """Drop results for functions which are not present unchanged in the given syntax.
+
+        The syntax might have been modified in place, so its cached structural hashes
+        are cleared first. Return number of functions whose analyses were dropped.
+        """
+        clear_structural_hashes(syntax, recursive=True)
+        present = {id(_) for _ in typed_ast3.walk(syntax) if isinstance(_, typed_ast3.FunctionDef)}
+        invalid = {function_id for function_id, (function, fingerprint) in self._functions.items()
+                   if function_id not in present or _fingerprint(function) != fingerprint}
+        for function_id in invalid:
+            del self._functions[function_id]
+        self._results = {key: result for key, result in self._results.items()
+                         if key[1] not in invalid}
+        return len(invalid)
+
+    def clear(self) -> None:
+        self._results.clear()
+        self._functions.clear()
+
+
+class Pass:
+
+    """Named transformation of generalized AST, with its dependencies.
+
+    The transformation takes the AST and returns the transformed AST. Passes listed
+    in requires are always executed before this pass. If analyses are listed, the
+    transformation is called with an additional keyword argument analyses,
+    which is the AnalysisCache of the pass manager.
+    """
+
+    def __init__(self, name: str, transformation: t.Callable[..., t.Any],
+                 requires: t.Sequence[str] = (), analyses: t.Sequence[str] = ()):
+        self.name = name
+        self.transformation = transformation
+        self.requires = list(requires)
+        self.analyses = list(analyses)
+
+    def __call__(self, syntax, analysis_cache: t.Optional[AnalysisCache] = None):
+        if self.analyses and analysis_cache is not None:
+            return self.transformation(syntax, analyses=analysis_cache)
+        return self.transformation(syntax)
+
+    def __repr__(self):
+        return 'Pass({})'.format(self.name)
+
+
+PASSES = {_.name: _ for _ in (
+    Pass('inline-hot-calls', inline_hot_calls),
+    Pass('fold-constants', fold_constants),
+    Pass('eliminate-dead-code', eliminate_dead_code),
+    Pass('reduce-strength', reduce_strength, analyses=['types', 'nonnegative names']),
+    Pass('simplify', simplify, analyses=['types', 'nonnegative names']),
+    Pass('vectorize-loops', vectorize_loops, requires=['fold-constants'],
+         analyses=['nonnegative names']))}  # type: t.Dict[str, Pass]
+"""Passes available by name, for example on the command line."""
+
+
+PassSpecification = t.Union[str, Pass, t.Callable[[t.Any], t.Any]]
+
+
+class PassManager:
+
+    """Apply a sequence of passes to generalized AST, and measure time spent in each of them.
+
+    Passes can be given as names of registered passes, as Pass objects, or as plain callables.
+    Passes required by the given ones are added automatically before them, and each pass
+    is executed at most once per run. Analyses available to passes are ANALYSES, unless
+    a different mapping is given.
+    """
+
+    def __init__(self, passes: t.Sequence[PassSpecification] = (),
+                 registry: t.Optional[t.Mapping[str, Pass]] = None,
+                 analyses: t.Optional[t.Mapping[str, t.Callable]] = None):
+        self.registry = PASSES if registry is None else registry
+        self.passes = self._resolve([self._make_pass(_) for _ in passes])
+        self.analysis_cache = AnalysisCache(analyses)
+        self.timings = []  # type: t.List[t.Tuple[str, float]]
+
+    def _make_pass(self, specification: PassSpecification) -> Pass:
+        if isinstance(specification, Pass):
+            return specification
+        if isinstance(specification, str):
+            if specification not in self.registry:
+                raise KeyError('unknown pass "{}", available passes are: {}'.format(
+                    specification, ', '.join(sorted(self.registry))))
+            return self.registry[specification]
+        assert callable(specification), type(specification)
+        return Pass(getattr(specification, '__name__', repr(specification)), specification)
+
+    def _resolve(self, passes: t.List[Pass]) -> t.List[Pass]:
+        resolved = []  # type: t.List[Pass]
+        active = []  # type: t.List[str]
+
+        def add(pass_: Pass):
+            if any(_ is pass_ for _ in resolved):
+                return
+            if pass_.name in active:
+                raise ValueError('circular dependency between passes: {}'.format(
+                    ' -> '.join(active + [pass_.name])))
+            active.append(pass_.name)
+            for name in pass_.requires:
+                add(self._make_pass(name))
+            active.pop()
+            resolved.append(pass_)
+
+        for pass_ in passes:
+            add(pass_)
+        return resolved
+
+    def run(self, syntax):
+        """Apply all passes in order and return the transformed syntax."""
+        self.timings = []
+        self.analysis_cache.clear()
+        for pass_ in self.passes:
+            start = time.perf_counter()
+            syntax = pass_(syntax, self.analysis_cache)
+            duration = time.perf_counter() - start
+            self.timings.append((pass_.name, duration))
+            invalidated = self.analysis_cache.invalidate(syntax)
+            _LOG.info('pass "%s" took %.3fs, invalidated analyses of %i functions',
+                      pass_.name, duration, invalidated)
+        return syntax
+
+    def report(self) -> str:
+        """Summarize time spent in each pass during the last run."""
+        width = max([len(name) for name, _ in self.timings] + [len('total')])
+        lines = ['{:{}} {:9.3f}s'.format(name, width, duration)
+                 for name, duration in self.timings]
+        lines.append('{:{}} {:9.3f}s'.format(
+            'total', width, sum(duration for _, duration in self.timings)))
+        return '\n'.join(lines)
@@ -0,0 +1,586 @@
+"""Algebraic simplification: strength reduction, loop-invariant code motion and elimination
+of common subexpressions."""
+
+import collections
+import logging
+import math
+import typing as t
+
+import horast
+import horast.nodes as horast_nodes
+import static_typing as st
+import typed_ast.ast3 as typed_ast3
+
+from .ast_annotations import annotate_ast, deepcopy_ast, get_annotation, has_annotation
+from .call_graph import SCOPE_TYPES, stored_names, walk_scope
+from .loop_analysis import PURE_FUNCTIONS, call_name, is_range_loop
+
+_LOG = logging.getLogger(__name__)
+
+SMALL_POWERS = (1, 2, 3, 4)
+"""Integer exponents for which power is replaced by repeated multiplication."""
+
+INTEGER_TYPES = {'int'} | {'np.{}'.format(_) for _ in (
+    'int8', 'int16', 'int32', 'int64', 'intc', 'intp', 'int_')}
+
+FLOAT_TYPES = {'float'} | {'np.{}'.format(_) for _ in (
+    'float16', 'float32', 'float64', 'single', 'double', 'float_')}
+
+SAFE_OPERATORS = (typed_ast3.Add, typed_ast3.Sub, typed_ast3.Mult, typed_ast3.BitAnd)
+"""Operators that never raise, and therefore can be evaluated earlier than originally.
+
+Right shift raises for negative shift counts, so it is safe only if shifting by a literal,
+see is_safe_operation().
+"""
+
+_LAZY_TYPES = (typed_ast3.BoolOp, typed_ast3.IfExp, typed_ast3.Lambda, typed_ast3.ListComp,
+               typed_ast3.SetComp, typed_ast3.DictComp, typed_ast3.GeneratorExp)
+
+_BODY_FIELDS = ('body', 'orelse', 'finalbody')
+
+
+def is_safe_operation(node: typed_ast3.BinOp) -> bool:
+    """Check if binary operation never raises, and therefore can be evaluated earlier."""
+    if isinstance(node.op, typed_ast3.RShift):
+        return isinstance(node.right, typed_ast3.Num) and not isinstance(node.right.n, bool) \
+            and isinstance(node.right.n, int) and node.right.n >= 0
+    return isinstance(node.op, SAFE_OPERATORS)
+
+
+def _type_kind(type_: t.Optional[str]) -> t.Optional[str]:
+    if type_ in INTEGER_TYPES:
+        return 'int'
+    if type_ in FLOAT_TYPES:
+        return 'float'
+    return None
+
+
+def _is_power_of_two(value) -> bool:
+    return not isinstance(value, bool) and isinstance(value, (int, float)) and value > 0 \
+        and math.frexp(value)[0] == 0.5
+
+
+class VariableTypes:
+
+    """Types of scalar variables and element types of arrays, as declared in a function.
+
+    Types are kept as strings like "int" or "np.float32", and only types of numeric
+    expressions whose operands all have a matching type are inferred.
+    """
+
+    def __init__(self, function: t.Optional[typed_ast3.FunctionDef] = None):
+        self.scalars = {}  # type: t.Dict[str, str]
+        self.arrays = {}  # type: t.Dict[str, t.Tuple[int, str]]
+        if function is None:
+            return
+        for arg in function.args.args:
+            if arg.annotation is not None:
+                self._declare(arg.arg, arg.annotation)
+            elif getattr(arg, 'type_comment', None):
+                self._declare(arg.arg, typed_ast3.parse(arg.type_comment, mode='eval').body)
+        for node in walk_scope(function):
+            if isinstance(node, typed_ast3.AnnAssign) and isinstance(node.target, typed_ast3.Name):
+                self._declare(node.target.id, node.annotation)
+            elif isinstance(node, typed_ast3.Assign) and node.type_comment \
+                    and len(node.targets) == 1 and isinstance(node.targets[0], typed_ast3.Name):
+                self._declare(node.targets[0].id,
+                              typed_ast3.parse(node.type_comment, mode='eval').body)
+        for node in walk_scope(function):
+            if is_range_loop(node):
+                self.scalars.setdefault(node.target.id, 'int')
+
+    def _declare(self, name: str, annotation: typed_ast3.AST) -> None:
+        if isinstance(annotation, typed_ast3.Subscript) \
+                and horast.unparse(annotation.value).strip() == 'st.ndarray' \
+                and isinstance(annotation.slice, typed_ast3.Index) \
+                and isinstance(annotation.slice.value, typed_ast3.Tuple) \
+                and len(annotation.slice.value.elts) >= 2 \
+                and isinstance(annotation.slice.value.elts[0], typed_ast3.Num):
+            dims, dtype = annotation.slice.value.elts[:2]
+            self.arrays[name] = (dims.n, horast.unparse(dtype).strip())
+        else:
+            self.scalars[name] = horast.unparse(annotation).strip()
+
+    def of(self, node: typed_ast3.AST) -> t.Optional[str]:
+        """Infer type of a given expression, or return None if it cannot be inferred."""
+        if isinstance(node, typed_ast3.Num):
+            if isinstance(node.n, bool) or not isinstance(node.n, (int, float)):
+                return None
+            return type(node.n).__name__
+        if isinstance(node, typed_ast3.Name):
+            return self.scalars.get(node.id, None)
+        if isinstance(node, typed_ast3.UnaryOp) \
+                and isinstance(node.op, (typed_ast3.USub, typed_ast3.UAdd)):
+            return self.of(node.operand)
+        if isinstance(node, typed_ast3.Subscript) and isinstance(node.value, typed_ast3.Name) \
+                and node.value.id in self.arrays and isinstance(node.slice, typed_ast3.Index):
+            dims, dtype = self.arrays[node.value.id]
+            index = node.slice.value
+            indices = index.elts if isinstance(index, typed_ast3.Tuple) else [index]
+            if len(indices) == dims and all(_type_kind(self.of(_)) == 'int' for _ in indices):
+                return dtype
+            return None
+        if isinstance(node, typed_ast3.BinOp) \
+                and isinstance(node.op, SAFE_OPERATORS + (typed_ast3.RShift,)):
+            left, right = self.of(node.left), self.of(node.right)
+            if left is None or right is None:
+                return None
+            if not isinstance(node.op, (typed_ast3.Add, typed_ast3.Sub, typed_ast3.Mult)) \
+                    and (_type_kind(left) != 'int' or _type_kind(right) != 'int'):
+                return None
+            if left == right:
+                return left
+            for literal, literal_type, other_type in ((node.left, left, right),
+                                                      (node.right, right, left)):
+                if isinstance(literal, typed_ast3.Num) and _type_kind(other_type) is not None \
+                        and (literal_type == 'int' or _type_kind(other_type) == 'float'):
+                    return other_type
+        return None
+
+
+def nonnegative_names(function: typed_ast3.FunctionDef) -> t.Set[str]:
+    """Find variables that are assigned only as targets of loops over non-negative ranges."""
+    loops = collections.defaultdict(list)
+    assigned = {_.arg for _ in function.args.args}
+    for node in walk_scope(function):
+        if isinstance(node, typed_ast3.For) and isinstance(node.target, typed_ast3.Name):
+            loops[node.target.id].append(node)
+        elif isinstance(node, (typed_ast3.Assign, typed_ast3.AugAssign, typed_ast3.AnnAssign,
+                               typed_ast3.AsyncFor, typed_ast3.withitem, typed_ast3.comprehension)):
+            if not isinstance(node, typed_ast3.AnnAssign) or node.value is not None:
+                assigned |= stored_names(node)
+    return {name for name, name_loops in loops.items() if name not in assigned and all(
+        is_range_loop(loop) and _range_is_nonnegative(loop.iter) for loop in name_loops)}
+
+
+def _range_is_nonnegative(call: typed_ast3.Call) -> bool:
+    args = call.args
+    if len(args) == 1:
+        return True
+    if not isinstance(args[0], typed_ast3.Num) or args[0].n < 0:
+        return False
+    return len(args) == 2 or isinstance(args[2], typed_ast3.Num) and args[2].n > 0
+
+
+def is_nonnegative(node: typed_ast3.AST, names: t.Set[str]) -> bool:
+    """Check if expression is provably nonnegative, given names known to be nonnegative."""
+    if isinstance(node, typed_ast3.Num):
+        return not isinstance(node.n, bool) and node.n >= 0
+    if isinstance(node, typed_ast3.Name):
+        return node.id in names
+    if isinstance(node, typed_ast3.BinOp) and isinstance(node.op, (
+            typed_ast3.Add, typed_ast3.Mult, typed_ast3.FloorDiv, typed_ast3.RShift,
+            typed_ast3.BitAnd)):
+        return is_nonnegative(node.left, names) and is_nonnegative(node.right, names)
+    return isinstance(node, typed_ast3.Call) and call_name(node) == 'len'
+
+
+def _is_simple(node: typed_ast3.AST) -> bool:
+    """Check if expression is cheap and free of side effects, so that it can be repeated."""
+    if isinstance(node, (typed_ast3.Name, typed_ast3.Num)):
+        return True
+    if isinstance(node, typed_ast3.Attribute):
+        return _is_simple(node.value)
+    if isinstance(node, typed_ast3.Subscript):
+        return _is_simple(node.value) and isinstance(node.slice, typed_ast3.Index) \
+            and all(not isinstance(_, (typed_ast3.Call,) + _LAZY_TYPES)
+                    for _ in typed_ast3.walk(node.slice))
+    return False
+
+
+class StrengthReducer(st.ast_manipulation.RecursiveAstTransformer[typed_ast3]):
+
+    """Replace expensive arithmetic operations by cheaper equivalent ones.
+
+    * x ** n, for small positive integers n and a simple base, becomes x * x * ... * x;
+    * i // 2 ** k becomes i >> k and i % 2 ** k becomes i & (2 ** k - 1), when i is known
+      to be a non-negative integer, in which case both have the same result in Python,
+      C and Fortran;
+    * x / 2.0 ** k becomes x * 2.0 ** -k, because multiplication by the reciprocal
+      of a power of two is exact.
+    """
+
+    def __init__(self, types: t.Optional[VariableTypes] = None,
+                 nonnegative: t.Optional[t.Set[str]] = None):
+        super().__init__(fields_first=True)
+        self.types = VariableTypes() if types is None else types
+        self.nonnegative = set() if nonnegative is None else nonnegative
+        self.reduced = 0
+
+    def visit_node(self, node):
+        if not isinstance(node, typed_ast3.BinOp) or not isinstance(node.right, typed_ast3.Num):
+            return node
+        reduced = self._reduce(node.left, node.op, node.right.n)
+        if reduced is None:
+            return node
+        self.reduced += 1
+        return reduced
+
+    def _reduce(self, left, op, value) -> t.Optional[typed_ast3.AST]:
+        if isinstance(value, bool):
+            return None
+        if isinstance(op, typed_ast3.Pow) and isinstance(value, int) \
+                and value in SMALL_POWERS and _is_simple(left):
+            result = left
+            for _ in range(value - 1):
+                result = typed_ast3.BinOp(left=result, op=typed_ast3.Mult(),
+                                          right=deepcopy_ast(left))
+            return result
+        is_integer = _type_kind(self.types.of(left)) == 'int' \
+            and is_nonnegative(left, self.nonnegative)
+        if isinstance(op, (typed_ast3.FloorDiv, typed_ast3.Mod)) and is_integer \
+                and isinstance(value, int) and _is_power_of_two(value):
+            if isinstance(op, typed_ast3.FloorDiv):
+                return typed_ast3.BinOp(left=left, op=typed_ast3.RShift(),
+                                        right=typed_ast3.Num(n=value.bit_length() - 1))
+            return typed_ast3.BinOp(left=left, op=typed_ast3.BitAnd(),
+                                    right=typed_ast3.Num(n=value - 1))
+        if isinstance(op, typed_ast3.Div) and _is_power_of_two(value) \
+                and (isinstance(value, float) or _type_kind(self.types.of(left)) == 'float'):
+            return typed_ast3.BinOp(left=left, op=typed_ast3.Mult(),
+                                    right=typed_ast3.Num(n=1.0 / value))
+        return None
+
+
+def _expression_fields(statement: typed_ast3.AST) -> t.List[t.Tuple[typed_ast3.AST, str]]:
+    """List places in a statement (excluding nested statements) where expressions are read.
+
+    Those are all expressions evaluated when the statement is executed, except for targets
+    of assignments -- but including indices of subscripted targets.
+    """
+    fields = []
+
+    def add_target(target):
+        if isinstance(target, typed_ast3.Subscript):
+            fields.append((target, 'slice'))
+        elif isinstance(target, (typed_ast3.Tuple, typed_ast3.List)):
+            for elt in target.elts:
+                add_target(elt)
+
+    if isinstance(statement, (typed_ast3.Assign, typed_ast3.AugAssign, typed_ast3.AnnAssign)):
+        if statement.value is not None:
+            fields.append((statement, 'value'))
+        for target in getattr(statement, 'targets', [getattr(statement, 'target', None)]):
+            add_target(target)
+    elif isinstance(statement, (typed_ast3.Expr, typed_ast3.Return)) \
+            and statement.value is not None:
+        fields.append((statement, 'value'))
+    elif isinstance(statement, (typed_ast3.If, typed_ast3.While, typed_ast3.Assert)):
+        fields.append((statement, 'test'))
+    elif isinstance(statement, typed_ast3.For):
+        fields.append((statement, 'iter'))
+    return fields
+
+
+def _map_expression(node: typed_ast3.AST, function: t.Callable) -> typed_ast3.AST:
+    """Apply function top-down to all subexpressions that are always evaluated.
+
+    If the function returns a different node, its subexpressions are not visited.
+    """
+    mapped = function(node)
+    if mapped is not node or isinstance(node, _LAZY_TYPES):
+        return mapped
+    for field, value in typed_ast3.iter_fields(node):
+        if isinstance(node, typed_ast3.Call) and field == 'func' \
+                or isinstance(node, typed_ast3.Attribute) and field == 'value' \
+                or isinstance(node, typed_ast3.Subscript) and field == 'value':
+            continue
+        if isinstance(value, list):
+            setattr(node, field, [_map_expression(_, function)
+                                  if isinstance(_, typed_ast3.AST) else _ for _ in value])
+        elif isinstance(value, typed_ast3.AST):
+            setattr(node, field, _map_expression(value, function))
+    return node
+
+
+def _impure_calls(node: typed_ast3.AST) -> t.List[typed_ast3.Call]:
+    return [_ for _ in walk_scope(node)
+            if isinstance(_, typed_ast3.Call) and call_name(_) not in PURE_FUNCTIONS]
+
+
+def _names_passed_to(calls: t.List[typed_ast3.Call]) -> t.Set[str]:
+    return {arg.id.lower() for call in calls for arg in call.args + [_.value for _ in call.keywords]
+            if isinstance(arg, typed_ast3.Name)}
+
+
+def _names_in(node: typed_ast3.AST) -> t.Set[str]:
+    return {_.id.lower() for _ in typed_ast3.walk(node) if isinstance(_, typed_ast3.Name)}
+
+
+class _FunctionSimplification:
+
+    """Loop-invariant code motion and common subexpression elimination within one function.
+
+    New variables are declared at the beginning of the function, in the same style as existing
+    declarations, so that they can be translated to statically typed languages.
+    """
+
+    def __init__(self, function: typed_ast3.FunctionDef, prefix: str = 'cse'):
+        self.function = function
+        self.types = VariableTypes(function)
+        self.prefix = prefix
+        self._used_names = _names_in(function) | {_.arg.lower() for _ in function.args.args} \
+            | {function.name.lower()}
+        self.local_names = {_.lower() for _ in stored_names(function)} \
+            | {_.arg.lower() for _ in function.args.args}
+        self.declarations = []  # type: t.List[typed_ast3.AnnAssign]
+        self.hoisted = 0
+        self.eliminated = 0
+
+    def _new_variable(self, type_: str) -> str:
+        index = 0
+        while '{}_{}'.format(self.prefix, index) in self._used_names:
+            index += 1
+        name = '{}_{}'.format(self.prefix, index)
+        self._used_names.add(name)
+        self.local_names.add(name)
+        self.types.scalars[name] = type_
+        declaration = typed_ast3.AnnAssign(
+            target=typed_ast3.Name(id=name, ctx=typed_ast3.Store()),
+            annotation=typed_ast3.parse(type_, mode='eval').body, value=None, simple=1)
+        if any(get_annotation(_, 'fortran_metadata', {}).get('is_declaration', False)
+               for _ in self.function.body):
+            annotate_ast(declaration, 'fortran_metadata', {'is_declaration': True})
+        self.declarations.append(declaration)
+        return name
+
+    def _is_candidate(self, node: typed_ast3.AST, allow_subscripts: bool) -> bool:
+        """Check if expression is worth storing in a variable, and safe to evaluate earlier."""
+        if not isinstance(node, (typed_ast3.BinOp, typed_ast3.UnaryOp)):
+            return False
+        has_operation = False
+        for child in typed_ast3.walk(node):
+            if isinstance(child, typed_ast3.BinOp):
+                if not is_safe_operation(child):
+                    return False
+                has_operation = True
+            elif isinstance(child, typed_ast3.UnaryOp):
+                if not isinstance(child.op, (typed_ast3.USub, typed_ast3.UAdd)):
+                    return False
+            elif isinstance(child, typed_ast3.Subscript):
+                if not allow_subscripts or not isinstance(child.value, typed_ast3.Name):
+                    return False
+            elif not isinstance(child, (typed_ast3.Name, typed_ast3.Num, typed_ast3.Index,
+                                        typed_ast3.Tuple, typed_ast3.expr_context,
+                                        typed_ast3.operator, typed_ast3.unaryop)):
+                return False
+        return has_operation and bool(_names_in(node)) and self.types.of(node) is not None
+
+    def _loop_stores(self, loop: typed_ast3.AST) -> t.Set[str]:
+        """Find names whose values might change during execution of a loop."""
+        stores = {_.lower() for _ in stored_names(loop)}
+        calls = _impure_calls(loop)
+        if calls:
+            stores |= _names_passed_to(calls)
+            stores |= _names_in(loop) - self.local_names
+        return stores
+
+    def _hoist_expression(self, node: typed_ast3.AST, loops: list) -> typed_ast3.AST:
+        if not self._is_candidate(node, allow_subscripts=False):
+            return node
+        names = _names_in(node)
+        # stores in a loop include stores in all loops nested in it
+        for _, stores, assignments, variables in loops:
+            if names & stores:
+                continue
+            key = typed_ast3.dump(node)
+            if key not in variables:
+                variables[key] = self._new_variable(self.types.of(node))
+                assignments.append(typed_ast3.Assign(
+                    targets=[typed_ast3.Name(id=variables[key], ctx=typed_ast3.Store())],
+                    value=node, type_comment=None))
+                self.hoisted += 1
+            return typed_ast3.Name(id=variables[key], ctx=typed_ast3.Load())
+        return node
+
+    def hoist(self, body: t.List[typed_ast3.AST],
+              loops: t.List[t.Tuple[typed_ast3.AST, t.Set[str], list, dict]]):
+        """Move loop-invariant expressions before the outermost loop in which they are invariant.
+
+        Expressions are moved only if they cannot raise, because the loop might not execute.
+        Arguments of range() are not moved, as they are evaluated only once per loop anyway.
+        """
+        new_body = []
+        for statement in body:
+            if isinstance(statement, SCOPE_TYPES):
+                new_body.append(statement)
+                continue
+            if isinstance(statement, (typed_ast3.For, typed_ast3.While)):
+                context = (statement, self._loop_stores(statement), [], {})
+                if isinstance(statement, typed_ast3.For) and not is_range_loop(statement):
+                    statement.iter = _map_expression(
+                        statement.iter, lambda _: self._hoist_expression(_, loops))
+                elif isinstance(statement, typed_ast3.While):
+                    statement.test = _map_expression(
+                        statement.test, lambda _: self._hoist_expression(_, loops + [context]))
+                statement.body = self.hoist(statement.body, loops + [context])
+                statement.orelse = self.hoist(statement.orelse, loops)
+                new_body += context[2]
+                new_body.append(statement)
+                continue
+            if loops:
+                for node, field in _expression_fields(statement):
+                    setattr(node, field, _map_expression(
+                        getattr(node, field), lambda _: self._hoist_expression(_, loops)))
+            for field in _BODY_FIELDS:
+                if isinstance(getattr(statement, field, None), list):
+                    setattr(statement, field, self.hoist(getattr(statement, field), loops))
+            new_body.append(statement)
+        return new_body
+
+    def eliminate(self, body: t.List[typed_ast3.AST]) -> t.List[typed_ast3.AST]:
+        """Compute each repeated expression in a sequence of statements only once."""
+        versions = collections.defaultdict(int)  # type: t.Dict[str, int]
+        memory_version = 0
+        nonlocal_version = 0
+        occurrences = collections.defaultdict(list)  # type: t.Dict[tuple, list]
+        sizes = {}  # type: t.Dict[tuple, int]
+        for index, statement in enumerate(body):
+            if isinstance(statement, SCOPE_TYPES):
+                continue
+            calls = [_ for node, field in _expression_fields(statement)
+                     for _ in _impure_calls(getattr(node, field))]
+            volatile = _names_passed_to(calls)
+
+            def collect(node, ancestors):
+                if isinstance(node, _LAZY_TYPES):
+                    return
+                if self._is_candidate(node, allow_subscripts=True):
+                    names = _names_in(node)
+                    has_subscripts = any(isinstance(_, typed_ast3.Subscript)
+                                         for _ in typed_ast3.walk(node))
+                    nonlocal_names = names - self.local_names
+                    if not names & volatile and not (calls and (has_subscripts or nonlocal_names)):
+                        key = (typed_ast3.dump(node),
+                               tuple(sorted((_, versions[_]) for _ in names)),
+                               memory_version if has_subscripts else None,
+                               nonlocal_version if nonlocal_names else None)
+                        occurrences[key].append((index, node, ancestors))
+                        sizes[key] = sum(1 for _ in typed_ast3.walk(node))
+                        ancestors += (id(node),)
+                for field, value in typed_ast3.iter_fields(node):
+                    if isinstance(node, typed_ast3.Call) and field == 'func':
+                        continue
+                    for child in value if isinstance(value, list) else [value]:
+                        if isinstance(child, typed_ast3.AST):
+                            collect(child, ancestors)
+
+            for node, field in _expression_fields(statement):
+                collect(getattr(node, field), ())
+            for field in _BODY_FIELDS:
+                if isinstance(getattr(statement, field, None), list):
+                    setattr(statement, field, self.eliminate(getattr(statement, field)))
+            all_calls = _impure_calls(statement)
+            for name in stored_names(statement) | _names_passed_to(all_calls):
+                versions[name.lower()] += 1
+            if all_calls:
+                nonlocal_version += 1
+            if all_calls or any(isinstance(_, (typed_ast3.Subscript, typed_ast3.Attribute))
+                                for node in walk_scope(statement)
+                                for target in _assignment_targets(node)
+                                for _ in typed_ast3.walk(target)):
+                memory_version += 1
+
+        replacements = {}  # type: t.Dict[int, str]
+        definitions = collections.defaultdict(list)  # type: t.Dict[int, list]
+        replaced = set()  # type: t.Set[int]
+        for key in sorted(occurrences, key=lambda _: -sizes[_]):
+            effective = [(index, node) for index, node, ancestors in occurrences[key]
+                         if not replaced.intersection(ancestors)]
+            if len(effective) < 2:
+                continue
+            first_index, first_node = effective[0]
+            name = self._new_variable(self.types.of(first_node))
+            definitions[first_index].append(typed_ast3.Assign(
+                targets=[typed_ast3.Name(id=name, ctx=typed_ast3.Store())],
+                value=deepcopy_ast(first_node), type_comment=None))
+            for _, node in effective:
+                replacements[id(node)] = name
+                replaced.add(id(node))
+            self.eliminated += len(effective) - 1
+        if not replacements:
+            return body
+
+        def replace(node):
+            if id(node) in replacements:
+                return typed_ast3.Name(id=replacements[id(node)], ctx=typed_ast3.Load())
+            return node
+
+        new_body = []
+        for index, statement in enumerate(body):
+            new_body += definitions[index]
+            if not isinstance(statement, SCOPE_TYPES):
+                for node, field in _expression_fields(statement):
+                    setattr(node, field, _map_expression(getattr(node, field), replace))
+            new_body.append(statement)
+        return new_body
+
+    def declare(self) -> None:
+        """Insert declarations of all new variables after the existing declarations."""
+        if not self.declarations:
+            return
+        body = self.function.body
+        index = 0
+        for i, statement in enumerate(body):
+            if isinstance(statement, (horast_nodes.Comment, horast_nodes.Directive,
+                                      typed_ast3.Import, typed_ast3.ImportFrom)) \
+                    or isinstance(statement, typed_ast3.AnnAssign) \
+                    and (statement.value is None or has_annotation(statement, 'fortran_metadata')) \
+                    or isinstance(statement, typed_ast3.Assign) \
+                    and get_annotation(statement, 'fortran_metadata', {}).get('is_constant') \
+                    or isinstance(statement, typed_ast3.Expr) and (
+                        i == 0 and isinstance(statement.value, typed_ast3.Str)
+                        or has_annotation(statement.value, 'is_statement')):
+                if not isinstance(statement, (horast_nodes.Comment, horast_nodes.Directive,
+                                              typed_ast3.Expr)) or i == 0:
+                    index = i + 1
+                continue
+            break
+        while index < len(body) and isinstance(body[index], horast_nodes.Comment) \
+                and body[index].comment.startswith(' Fortran metadata:'):
+            index += 1
+        self.function.body = body[:index] + self.declarations + body[index:]
+
+
+def _assignment_targets(statement: typed_ast3.AST) -> t.List[typed_ast3.AST]:
+    if isinstance(statement, typed_ast3.Assign):
+        return statement.targets
+    if isinstance(statement, (typed_ast3.AugAssign, typed_ast3.AnnAssign, typed_ast3.For)):
+        return [statement.target]
+    return []
+
+
+def reduce_strength(syntax: typed_ast3.AST, analyses=None) -> typed_ast3.AST:
+    """Replace expensive arithmetic operations by cheaper equivalent ones.
+
+    If an analysis cache of a pass manager is given, types and non-negative names
+    of each function are taken from it.
+    """
+    functions = [_ for _ in typed_ast3.walk(syntax) if isinstance(_, typed_ast3.FunctionDef)]
+    for function in functions:
+        if analyses is None:
+            reducer = StrengthReducer(VariableTypes(function), nonnegative_names(function))
+        else:
+            reducer = StrengthReducer(analyses.get('types', function),
+                                      analyses.get('nonnegative names', function))
+        function.body = [reducer.visit(_) for _ in function.body]
+    if not functions:
+        syntax = StrengthReducer().visit(syntax)
+    return syntax
+
+
+def simplify(syntax: typed_ast3.AST, hoist_invariants: bool = True,
+             eliminate_subexpressions: bool = True, analyses=None) -> typed_ast3.AST:
+    """Apply strength reduction, loop-invariant code motion and elimination of common
+    subexpressions to all functions in the given syntax."""
+    syntax = reduce_strength(syntax, analyses)
+    for function in [_ for _ in typed_ast3.walk(syntax) if isinstance(_, typed_ast3.FunctionDef)]:
+        simplification = _FunctionSimplification(function)
+        if hoist_invariants:
+            function.body = simplification.hoist(function.body, [])
+        if eliminate_subexpressions:
+            function.body = simplification.eliminate(function.body)
+        simplification.declare()
+        _LOG.debug('in "%s", hoisted %i loop invariants and eliminated %i subexpressions',
+                   function.name, simplification.hoisted, simplification.eliminated)
+    return syntax
@@ -0,0 +1,67 @@
+"""Merkle-style structural hashes of AST, for fast equality checks and deduplication."""
+
+import hashlib
+import typing as t
+
+import typed_ast.ast3 as typed_ast3
+
+DIGEST_SIZE = 16
+
+_CACHE_ATTRIBUTE = '_structural_hash'
+
+
+def structural_hash(node: typed_ast3.AST, refresh: bool = False, cache: bool = True) -> bytes:
+    """Compute digest of a tree that depends only on its structure, like typed_ast3.dump().
+
+    Two trees have equal digests if and only if their dumps are equal (barring collisions
+    of a 128-bit hash). Node positions and annotations, like fortran_metadata, are ignored.
+
+    Digests are cached on the nodes, unless cache is unset. A cached digest is returned
+    without visiting the subtree, therefore after a tree is modified in place, digests
+    of the modified nodes and of their ancestors must be dropped by clear_structural_hashes().
+    SyntaxIndex and the pass manager do that on every modification they make or observe.
+    If refresh is set, cached digests are ignored and recomputed.
+    """
+    assert isinstance(node, typed_ast3.AST), type(node)
+    if not refresh:
+        cached = getattr(node, _CACHE_ATTRIBUTE, None)
+        if cached is not None:
+            return cached
+    digest = hashlib.blake2b(type(node).__name__.encode(), digest_size=DIGEST_SIZE)
+    for name, value in typed_ast3.iter_fields(node):
+        digest.update(b'\0' + name.encode())
+        for item in value if isinstance(value, list) else [value]:
+            if isinstance(item, typed_ast3.AST):
+                digest.update(b'\1' + structural_hash(item, refresh, cache))
+            else:
+                digest.update(b'\2' + repr(item).encode())
+        if isinstance(value, list):
+            digest.update(b'\3')
+    result = digest.digest()
+    if cache:
+        setattr(node, _CACHE_ATTRIBUTE, result)
+    return result
+
+
+def clear_structural_hashes(*nodes: typed_ast3.AST, recursive: bool = False) -> None:
+    """Drop cached digests of given nodes, and optionally of all their descendants."""
+    for node in nodes:
+        for node_ in typed_ast3.walk(node) if recursive else [node]:
+            if hasattr(node_, _CACHE_ATTRIBUTE):
+                delattr(node_, _CACHE_ATTRIBUTE)
+
+
+def find_identical_subtrees(*trees: typed_ast3.AST, types: tuple = (typed_ast3.stmt,)) \
+        -> t.List[t.List[typed_ast3.AST]]:
+    """Group structurally identical nodes of given types found in one or more trees.
+
+    Only groups with at least two nodes are returned, in order of their first occurrence.
+    All digests in the trees are recomputed, so stale cached digests do not matter.
+    """
+    groups = {}  # type: t.Dict[bytes, t.List[typed_ast3.AST]]
+    for tree in trees:
+        structural_hash(tree, refresh=True)
+        for node in typed_ast3.walk(tree):
+            if isinstance(node, types):
+                groups.setdefault(getattr(node, _CACHE_ATTRIBUTE), []).append(node)
+    return [group for group in groups.values() if len(group) > 1]
@@ -0,0 +1,446 @@
+"""Vectorization of element-wise and reduction loops into NumPy whole-array expressions."""
+
+import logging
+import typing as t
+
+import horast.nodes as horast_nodes
+import static_typing as st
+import typed_ast.ast3 as typed_ast3
+
+from .ast_annotations import deepcopy_ast
+from .loop_analysis import call_name, names_used_outside_loops
+from .simplification import is_nonnegative, nonnegative_names
+
+_LOG = logging.getLogger(__name__)
+
+ARRAY_CONSTRUCTORS = {'array', 'empty', 'empty_like', 'full', 'full_like', 'ones', 'ones_like',
+                      'zeros', 'zeros_like'}
+
+ELEMENTWISE_FUNCTIONS = {'abs'} | {'np.{}'.format(_) for _ in (
+    'abs', 'absolute', 'arccos', 'arcsin', 'arctan', 'conj', 'cos', 'cosh', 'exp', 'log',
+    'log10', 'maximum', 'minimum', 'sign', 'sin', 'sinh', 'sqrt', 'tan', 'tanh')}
+
+REDUCTION_OPERATORS = {typed_ast3.Add: 'sum', typed_ast3.Sub: 'sum', typed_ast3.Mult: 'prod'}
+
+REDUCTION_FUNCTIONS = {'max': 'amax', 'min': 'amin', 'np.maximum': 'amax', 'np.minimum': 'amin'}
+
+
+class NotVectorizable(Exception):
+
+    """Raised when a loop cannot be safely rewritten into whole-array expressions."""
+
+
+def _is_st_ndarray(annotation) -> bool:
+    return isinstance(annotation, typed_ast3.Subscript) \
+        and isinstance(annotation.value, typed_ast3.Attribute) \
+        and isinstance(annotation.value.value, typed_ast3.Name) \
+        and annotation.value.value.id == 'st' and annotation.value.attr == 'ndarray'
+
+
+def _names_in(tree) -> t.Set[str]:
+    return {node.id for node in typed_ast3.walk(tree) if isinstance(node, typed_ast3.Name)}
+
+
+def _make_numpy_call(function: str, *args) -> typed_ast3.Call:
+    return typed_ast3.Call(
+        func=typed_ast3.Attribute(value=typed_ast3.Name(id='np', ctx=typed_ast3.Load()),
+                                  attr=function, ctx=typed_ast3.Load()),
+        args=list(args), keywords=[])
+
+
+def _make_offset(base: t.Optional[typed_ast3.AST], op: typed_ast3.operator,
+                 offset: typed_ast3.AST,
+                 nonnegative: t.Optional[t.Set[str]] = None) -> typed_ast3.AST:
+    """Create an expression equivalent to: base op offset, folding integer literals.
+
+    If names known to be nonnegative are given, the result must be provably nonnegative,
+    because a negative slice bound would silently wrap around to the end of the array.
+    """
+    result = _make_offset_expression(base, op, offset)
+    if nonnegative is not None and not is_nonnegative(result, nonnegative):
+        raise NotVectorizable('slice bound {} might be negative and wrap around'
+                              .format(typed_ast3.dump(result)))
+    return result
+
+
+def _make_offset_expression(base, op, offset):
+    if base is None:
+        base = typed_ast3.Num(n=0)
+    if isinstance(base, typed_ast3.Num) and isinstance(offset, typed_ast3.Num):
+        value = base.n + offset.n if isinstance(op, typed_ast3.Add) else base.n - offset.n
+        if value < 0:
+            raise NotVectorizable('negative slice bound {} would wrap around'.format(value))
+        return typed_ast3.Num(n=value)
+    if isinstance(offset, typed_ast3.Num) and offset.n == 0:
+        return deepcopy_ast(base)
+    if isinstance(offset, typed_ast3.Num) and isinstance(base, typed_ast3.BinOp) \
+            and isinstance(base.op, (typed_ast3.Add, typed_ast3.Sub)) \
+            and isinstance(base.right, typed_ast3.Num):
+        total = (base.right.n if isinstance(base.op, typed_ast3.Add) else -base.right.n) \
+            + (offset.n if isinstance(op, typed_ast3.Add) else -offset.n)
+        if total == 0:
+            return deepcopy_ast(base.left)
+        return typed_ast3.BinOp(
+            left=deepcopy_ast(base.left), op=typed_ast3.Add() if total > 0 else typed_ast3.Sub(),
+            right=typed_ast3.Num(n=abs(total)))
+    return typed_ast3.BinOp(left=deepcopy_ast(base), op=op, right=deepcopy_ast(offset))
+
+
+def collect_arrays(tree) -> t.Set[str]:
+    """Find names of all variables in the given scope that are known to be NumPy arrays.
+
+    Those are variables annotated with st.ndarray and variables initialized by a NumPy array
+    constructor such as np.zeros().
+    """
+    arrays = set()
+    for node in typed_ast3.walk(tree):
+        if isinstance(node, typed_ast3.arg) and _is_st_ndarray(node.annotation):
+            arrays.add(node.arg)
+        elif isinstance(node, typed_ast3.AnnAssign) and isinstance(node.target, typed_ast3.Name) \
+                and _is_st_ndarray(node.annotation):
+            arrays.add(node.target.id)
+        elif isinstance(node, typed_ast3.Assign) and isinstance(node.value, typed_ast3.Call) \
+                and len(node.targets) == 1 and isinstance(node.targets[0], typed_ast3.Name):
+            name = call_name(node.value)
+            if name is not None and name.startswith('np.') and name[3:] in ARRAY_CONSTRUCTORS:
+                arrays.add(node.targets[0].id)
+    return arrays
+
+
+class _LoopVectorization:
+
+    """Rewriting of a single for-loop over range() into a sequence of whole-array statements."""
+
+    def __init__(self, loop: typed_ast3.For, arrays: t.Set[str],
+                 nonnegative: t.Set[str] = frozenset()):
+        if not isinstance(loop.target, typed_ast3.Name):
+            raise NotVectorizable('loop target is not a simple name')
+        if loop.orelse:
+            raise NotVectorizable('loop has an else clause')
+        self.index = loop.target.id
+        self.arrays = arrays
+        self.nonnegative = nonnegative
+        self.lower, self.upper, self.step = self._range_bounds(loop.iter)
+        self.written_arrays = {}  # type: t.Dict[str, str]
+        self.reduced_names = set()  # type: t.Set[str]
+
+    def _range_bounds(self, iter_):
+        if not isinstance(iter_, typed_ast3.Call) or call_name(iter_) != 'range' \
+                or iter_.keywords or not 1 <= len(iter_.args) <= 3:
+            raise NotVectorizable('loop does not iterate over range()')
+        args = iter_.args
+        if len(args) == 1:
+            return None, args[0], None
+        if len(args) == 2:
+            return args[0], args[1], None
+        step = args[2]
+        if not isinstance(step, typed_ast3.Num) or step.n <= 0:
+            raise NotVectorizable('only constant positive loop steps are supported')
+        return args[0], args[1], step
+
+    def _analyze_writes(self, statements):
+        for stmt in statements:
+            if isinstance(stmt, typed_ast3.Assign):
+                if len(stmt.targets) != 1:
+                    raise NotVectorizable('multiple assignment targets')
+                target = stmt.targets[0]
+            elif isinstance(stmt, typed_ast3.AugAssign):
+                target = stmt.target
+            else:
+                raise NotVectorizable('unsupported statement {}'.format(type(stmt).__name__))
+            if isinstance(target, typed_ast3.Subscript) \
+                    and isinstance(target.value, typed_ast3.Name) \
+                    and target.value.id in self.arrays and self.index in _names_in(target):
+                name = target.value.id
+                subscript = typed_ast3.dump(target.slice)
+                if self.written_arrays.setdefault(name, subscript) != subscript:
+                    raise NotVectorizable('array "{}" is written at different indices'.format(name))
+            elif isinstance(target, typed_ast3.Name) and target.id != self.index \
+                    and target.id not in self.arrays:
+                if target.id in self.reduced_names:
+                    raise NotVectorizable('scalar "{}" is assigned more than once'
+                                          .format(target.id))
+                self.reduced_names.add(target.id)
+            else:
+                raise NotVectorizable('unsupported assignment target')
+        written = set(self.written_arrays) | self.reduced_names
+        for bound in (self.lower, self.upper):
+            if bound is not None and _names_in(bound) & written:
+                raise NotVectorizable('loop bounds depend on values modified in the loop')
+
+    def _index_offset(self, node) -> t.Optional[t.Tuple[typed_ast3.operator, typed_ast3.AST]]:
+        """Match "i", "i + c", "c + i" or "i - c", where i is the loop index."""
+        if isinstance(node, typed_ast3.Name) and node.id == self.index:
+            return typed_ast3.Add(), typed_ast3.Num(n=0)
+        if not isinstance(node, typed_ast3.BinOp) \
+                or not isinstance(node.op, (typed_ast3.Add, typed_ast3.Sub)):
+            return None
+        left, right = node.left, node.right
+        if isinstance(left, typed_ast3.Name) and left.id == self.index \
+                and self.index not in _names_in(right):
+            return node.op, right
+        if isinstance(node.op, typed_ast3.Add) and isinstance(right, typed_ast3.Name) \
+                and right.id == self.index and self.index not in _names_in(left):
+            return node.op, left
+        return None
+
+    def _index_slice(self, op, offset) -> typed_ast3.Slice:
+        lower = None if self.lower is None and isinstance(offset, typed_ast3.Num) \
+            and offset.n == 0 else _make_offset(self.lower, op, offset, self.nonnegative)
+        upper = _make_offset(self.upper, op, offset)
+        if not is_nonnegative(upper, self.nonnegative):
+            # in empty loops the upper bound might be negative and wrap around
+            upper = typed_ast3.Call(func=typed_ast3.Name(id='max', ctx=typed_ast3.Load()),
+                                    args=[upper, typed_ast3.Num(n=0)], keywords=[])
+        step = deepcopy_ast(self.step)
+        return typed_ast3.Slice(lower=lower, upper=upper, step=step)
+
+    def _vectorize_subscript(self, node: typed_ast3.Subscript):
+        slice_ = node.slice
+        if isinstance(slice_, typed_ast3.Index) and isinstance(slice_.value, typed_ast3.Tuple):
+            dims = [typed_ast3.Index(value=_) for _ in slice_.value.elts]
+        elif isinstance(slice_, typed_ast3.ExtSlice):
+            dims = list(slice_.dims)
+        else:
+            dims = [slice_]
+        new_dims = []
+        sliced_dims = 0
+        index_dim = None
+        for dim in dims:
+            if isinstance(dim, typed_ast3.Slice):
+                if self.index in _names_in(dim):
+                    raise NotVectorizable('loop index used in a slice')
+                new_dims.append(deepcopy_ast(dim))
+                sliced_dims += 1
+                continue
+            assert isinstance(dim, typed_ast3.Index), type(dim)
+            if self.index not in _names_in(dim):
+                new_dims.append(deepcopy_ast(dim))
+                continue
+            offset = self._index_offset(dim.value)
+            if offset is None or index_dim is not None:
+                raise NotVectorizable('unsupported use of loop index in subscript')
+            new_dims.append(self._index_slice(*offset))
+            index_dim = sliced_dims
+            sliced_dims += 1
+        if len(new_dims) == 1:
+            new_slice = new_dims[0]
+        elif all(isinstance(_, typed_ast3.Index) for _ in new_dims):
+            new_slice = typed_ast3.Index(value=typed_ast3.Tuple(
+                elts=[_.value for _ in new_dims], ctx=typed_ast3.Load()))
+        else:
+            new_slice = typed_ast3.ExtSlice(dims=new_dims)
+        vectorized = typed_ast3.Subscript(value=deepcopy_ast(node.value), slice=new_slice,
+                                          ctx=node.ctx)
+        return vectorized, (sliced_dims, index_dim)
+
+    @staticmethod
+    def _merge_layouts(*layouts):
+        """Ensure that all array-valued operands broadcast along the loop dimension."""
+        array_layouts = {_ for _ in layouts if _ is not None}
+        if len(array_layouts) > 1:
+            raise NotVectorizable('operands have incompatible shapes: {}'.format(array_layouts))
+        return array_layouts.pop() if array_layouts else None
+
+    def vectorize_expression(self, node):
+        """Return vectorized expression and its layout (None for scalar-valued expressions).
+
+        Layout is a pair: number of sliced dimensions and the position of the loop dimension
+        among them.
+        """
+        names = _names_in(node)
+        if names & self.reduced_names:
+            raise NotVectorizable('reduction variable used inside an expression')
+        if self.index not in names:
+            subscripted = {id(_.value) for _ in typed_ast3.walk(node)
+                           if isinstance(_, typed_ast3.Subscript)}
+            for subnode in typed_ast3.walk(node):
+                if isinstance(subnode, typed_ast3.Name) and subnode.id in self.arrays \
+                        and id(subnode) not in subscripted:
+                    raise NotVectorizable('whole array "{}" used in an expression'
+                                          .format(subnode.id))
+                if isinstance(subnode, typed_ast3.Slice):
+                    raise NotVectorizable('loop-invariant array slice used in an expression')
+                if isinstance(subnode, typed_ast3.Subscript) \
+                        and isinstance(subnode.value, typed_ast3.Name) \
+                        and subnode.value.id in self.written_arrays:
+                    raise NotVectorizable('array modified in the loop is read at another index')
+                if isinstance(subnode, typed_ast3.Call) \
+                        and call_name(subnode) not in ELEMENTWISE_FUNCTIONS:
+                    raise NotVectorizable('call to unknown function')
+            return deepcopy_ast(node), None
+        if isinstance(node, typed_ast3.Name):
+            assert node.id == self.index
+            arange = _make_numpy_call('arange', *[
+                deepcopy_ast(_) for _ in (
+                    typed_ast3.Num(n=0) if self.lower is None else self.lower,
+                    self.upper, self.step) if _ is not None])
+            return arange, (1, 0)
+        if isinstance(node, typed_ast3.Subscript):
+            if not isinstance(node.value, typed_ast3.Name) or node.value.id not in self.arrays:
+                raise NotVectorizable('loop index used to subscript a non-array')
+            name = node.value.id
+            if name in self.written_arrays \
+                    and typed_ast3.dump(node.slice) != self.written_arrays[name]:
+                raise NotVectorizable('array "{}" is read and written at different indices'
+                                      .format(name))
+            return self._vectorize_subscript(node)
+        if isinstance(node, typed_ast3.BinOp):
+            if isinstance(node.op, typed_ast3.MatMult):
+                raise NotVectorizable('matrix multiplication is not element-wise')
+            left, left_layout = self.vectorize_expression(node.left)
+            right, right_layout = self.vectorize_expression(node.right)
+            return typed_ast3.BinOp(left=left, op=node.op, right=right), \
+                self._merge_layouts(left_layout, right_layout)
+        if isinstance(node, typed_ast3.UnaryOp):
+            if isinstance(node.op, typed_ast3.Not):
+                raise NotVectorizable('logical negation is not element-wise')
+            operand, layout = self.vectorize_expression(node.operand)
+            return typed_ast3.UnaryOp(op=node.op, operand=operand), layout
+        if isinstance(node, typed_ast3.Call):
+            if call_name(node) not in ELEMENTWISE_FUNCTIONS or node.keywords:
+                raise NotVectorizable('call to unknown function')
+            args, layouts = [], []
+            for arg in node.args:
+                arg, layout = self.vectorize_expression(arg)
+                args.append(arg)
+                layouts.append(layout)
+            return typed_ast3.Call(func=deepcopy_ast(node.func), args=args, keywords=[]), \
+                self._merge_layouts(*layouts)
+        raise NotVectorizable('unsupported expression {}'.format(type(node).__name__))
+
+    def _vectorize_reduction(self, stmt):
+        """Rewrite s += a[i], s = s * a[i], s = max(s, a[i]) and similar into NumPy reductions."""
+        if isinstance(stmt, typed_ast3.AugAssign):
+            if type(stmt.op) not in REDUCTION_OPERATORS:
+                raise NotVectorizable('unsupported reduction operator')
+            value, layout = self.vectorize_expression(stmt.value)
+            if layout is None:
+                raise NotVectorizable('reduced value does not depend on the loop index')
+            return typed_ast3.AugAssign(
+                target=deepcopy_ast(stmt.target), op=stmt.op,
+                value=_make_numpy_call(REDUCTION_OPERATORS[type(stmt.op)], value))
+        target = stmt.targets[0]
+        value = stmt.value
+
+        def is_accumulator(node) -> bool:
+            return isinstance(node, typed_ast3.Name) and node.id == target.id
+
+        if isinstance(value, typed_ast3.BinOp) and type(value.op) in REDUCTION_OPERATORS:
+            if is_accumulator(value.left):
+                reduced = value.right
+            elif is_accumulator(value.right) and not isinstance(value.op, typed_ast3.Sub):
+                reduced = value.left
+            else:
+                raise NotVectorizable('assignment is not a reduction')
+            reduced, layout = self.vectorize_expression(reduced)
+            if layout is None:
+                raise NotVectorizable('reduced value does not depend on the loop index')
+            return typed_ast3.Assign(targets=[deepcopy_ast(target)], value=typed_ast3.BinOp(
+                left=deepcopy_ast(target), op=value.op,
+                right=_make_numpy_call(REDUCTION_OPERATORS[type(value.op)], reduced)),
+                                     type_comment=None)
+        if isinstance(value, typed_ast3.Call) and call_name(value) in REDUCTION_FUNCTIONS \
+                and len(value.args) == 2 and not value.keywords:
+            matches = [is_accumulator(_) for _ in value.args]
+            if matches.count(True) != 1:
+                raise NotVectorizable('assignment is not a reduction')
+            reduced = value.args[1 - matches.index(True)]
+            reduced, layout = self.vectorize_expression(reduced)
+            if layout is None:
+                raise NotVectorizable('reduced value does not depend on the loop index')
+            reduction = _make_numpy_call(REDUCTION_FUNCTIONS[call_name(value)], reduced)
+            reduction.keywords.append(
+                typed_ast3.keyword(arg='initial', value=deepcopy_ast(target)))
+            return typed_ast3.Assign(targets=[deepcopy_ast(target)], value=reduction,
+                                     type_comment=None)
+        raise NotVectorizable('assignment is not a reduction')
+
+    def _vectorize_elementwise(self, stmt):
+        target = stmt.targets[0] if isinstance(stmt, typed_ast3.Assign) else stmt.target
+        new_target, target_layout = self._vectorize_subscript(target)
+        value, layout = self.vectorize_expression(stmt.value)
+        self._merge_layouts(target_layout, layout)
+        if isinstance(stmt, typed_ast3.AugAssign):
+            return typed_ast3.AugAssign(target=new_target, op=stmt.op, value=value)
+        return typed_ast3.Assign(targets=[new_target], value=value, type_comment=None)
+
+    def vectorize(self, body: t.List[typed_ast3.stmt]) -> t.List[typed_ast3.stmt]:
+        comments = [stmt for stmt in body if isinstance(stmt, horast_nodes.Comment)]
+        statements = [stmt for stmt in body if not isinstance(
+            stmt, (horast_nodes.Comment, typed_ast3.Pass))]
+        if not statements:
+            raise NotVectorizable('loop has no statements')
+        self._analyze_writes(statements)
+        vectorized = []
+        for stmt in statements:
+            target = stmt.targets[0] if isinstance(stmt, typed_ast3.Assign) else stmt.target
+            if isinstance(target, typed_ast3.Name):
+                vectorized.append(self._vectorize_reduction(stmt))
+            else:
+                vectorized.append(self._vectorize_elementwise(stmt))
+        return comments + vectorized
+
+
+class LoopVectorizer(st.ast_manipulation.RecursiveAstTransformer[typed_ast3]):
+
+    """Rewrite element-wise and reduction loops over NumPy arrays into slice-based expressions.
+
+    Only loops over range() with a constant positive step are considered, and only when every
+    statement in the body is either an element-wise assignment to an array indexed by the loop
+    variable (optionally offset by a loop-invariant value) or a sum, product, min or max
+    reduction into a scalar. Loops that carry dependencies between iterations, use the loop
+    variable after the loop, or call functions that are not known to be element-wise, are
+    left untouched.
+
+    Arrays are recognized by st.ndarray annotations and by NumPy array constructors.
+    Loop index offset by a loop-invariant value is vectorized only if the resulting lower
+    slice bound is provably nonnegative, see nonnegative_names(). Upper slice bounds,
+    unless provably nonnegative as well, are clamped at zero.
+
+    If an analysis cache of a pass manager is given, non-negative names of each function
+    are taken from it.
+    """
+
+    def __init__(self, analyses=None):
+        super().__init__(fields_first=True)
+        self._analyses = analyses
+        self._scopes = []
+
+    def visit(self, node):
+        if not isinstance(node, (typed_ast3.Module, typed_ast3.FunctionDef)):
+            return super().visit(node)
+        arrays = collect_arrays(node)
+        if self._scopes:
+            arrays |= self._scopes[-1][0]
+        if not isinstance(node, typed_ast3.FunctionDef):
+            nonnegative = set()
+        elif self._analyses is None:
+            nonnegative = nonnegative_names(node)
+        else:
+            nonnegative = self._analyses.get('nonnegative names', node)
+        self._scopes.append((arrays, names_used_outside_loops(node), nonnegative))
+        try:
+            return super().visit(node)
+        finally:
+            self._scopes.pop()
+
+    def visit_node(self, node):
+        if not isinstance(node, typed_ast3.For) or not self._scopes:
+            return node
+        arrays, used_outside_loops, nonnegative = self._scopes[-1]
+        if isinstance(node.target, typed_ast3.Name) and node.target.id in used_outside_loops:
+            _LOG.debug('not vectorizing loop over "%s": variable is used after the loop',
+                       node.target.id)
+            return node
+        try:
+            vectorized = _LoopVectorization(node, arrays, nonnegative).vectorize(node.body)
+        except NotVectorizable as err:
+            _LOG.debug('not vectorizing loop: %s', err)
+            return node
+        return vectorized
+
+
+def vectorize_loops(syntax: typed_ast3.AST, analyses=None) -> typed_ast3.AST:
+    """Rewrite all vectorizable loops in the given syntax into NumPy whole-array expressions."""
+    return LoopVectorizer(analyses).visit(syntax)
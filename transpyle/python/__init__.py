@@ -11,18 +11,19 @@ from ..general import \
     CodeReader, Language, Parser, AstGeneralizer, IdentityAstGeneralizer, Unparser, Translator, \
     AutoTranspiler, Binder
 from .parser import TypedPythonParserWithComments
-from .unparser import TypedPythonUnparserWithComments
+from .unparser import TypedPythonUnparserWithComments, NumbaPythonUnparser
 from .translator import PythonTranslator
 
 __all__ = [
-    'TypedPythonParserWithComments', 'TypedPythonUnparserWithComments', 'PythonTranslator',
-    'transpile']
+    'TypedPythonParserWithComments', 'TypedPythonUnparserWithComments', 'NumbaPythonUnparser',
+    'PythonTranslator', 'transpile']
 
 _LOG = logging.getLogger(__name__)
 
 Language.register(Language(['Python 3.5'], ['.py']), ['Python 3.5'])
 Language.register(Language(['Python 3.6'], ['.py']), ['Python 3.6', 'Python 3', 'Python'])
 Language.register(Language(['Python 3.7'], ['.py']), ['Python 3.7'])
+Language.register(Language(['Python+Numba'], ['.py']), ['Python+Numba', 'Numba'])
 
 Parser.register(TypedPythonParserWithComments,
                 (Language.find('Python 3.5'), Language.find('Python 3.6'),
@@ -44,6 +45,8 @@ Unparser.register(TypedPythonUnparserWithComments,
                   (Language.find('Python 3.5'), Language.find('Python 3.6'),
                    Language.find('Python 3.7')))
 
+Unparser.register(NumbaPythonUnparser, (Language.find('Python+Numba'),))
+
 Translator.register(PythonTranslator, (Language.find('Python 3.5'), Language.find('Python 3.6'),
                                        Language.find('Python 3.6')))
 
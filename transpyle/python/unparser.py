@@ -3,6 +3,7 @@
 import ast
 import logging
 import re
+import typing as t
 
 import astunparse
 import horast
@@ -10,14 +11,65 @@ import typed_ast.ast3
 import typed_astunparse
 
 from ..general import Language, Unparser
+from ..pair.ast_annotations import deepcopy_ast
+from ..pair.loop_analysis import is_range_loop, loop_iterations_independent, \
+    names_used_outside_loops
 
 _LOG = logging.getLogger(__name__)
 
+PYTHON_NUMBA_TYPES = {
+    'bool': 'boolean',
+    'int': 'int64',
+    'float': 'float64',
+    'complex': 'complex128',
+    'np.bool_': 'boolean',
+    'np.int8': 'int8',
+    'np.int16': 'int16',
+    'np.int32': 'int32',
+    'np.int64': 'int64',
+    'np.uint8': 'uint8',
+    'np.uint16': 'uint16',
+    'np.uint32': 'uint32',
+    'np.uint64': 'uint64',
+    'np.single': 'float32',
+    'np.float32': 'float32',
+    'np.double': 'float64',
+    'np.float64': 'float64',
+    'np.complex64': 'complex64',
+    'np.complex128': 'complex128'}
+
+
+def numba_type(annotation: typed_ast.ast3.AST) -> t.Optional[str]:
+    """Translate a PAIR type annotation into Numba type name, or None if it's not supported.
+
+    Scalar types like int and np.float64 are supported, as well as st.ndarray of those.
+    """
+    if isinstance(annotation, typed_ast.ast3.Name):
+        return PYTHON_NUMBA_TYPES.get(annotation.id)
+    if isinstance(annotation, typed_ast.ast3.Attribute) \
+            and isinstance(annotation.value, typed_ast.ast3.Name):
+        return PYTHON_NUMBA_TYPES.get('{}.{}'.format(annotation.value.id, annotation.attr))
+    if isinstance(annotation, typed_ast.ast3.Subscript) \
+            and isinstance(annotation.value, typed_ast.ast3.Attribute) \
+            and isinstance(annotation.value.value, typed_ast.ast3.Name) \
+            and annotation.value.value.id == 'st' and annotation.value.attr == 'ndarray' \
+            and isinstance(annotation.slice, typed_ast.ast3.Index) \
+            and isinstance(annotation.slice.value, typed_ast.ast3.Tuple) \
+            and len(annotation.slice.value.elts) >= 2:
+        dimensions, data_type = annotation.slice.value.elts[:2]
+        data_type = numba_type(data_type)
+        if not isinstance(dimensions, typed_ast.ast3.Num) or data_type is None:
+            return None
+        return '{}[{}]'.format(data_type, ', '.join(':' for _ in range(dimensions.n)))
+    return None
+
 
 class NativePythonUnparser(Unparser):
 
     """Generate Python 3 source code from native AST using astunparse package."""
 
+    parallel_unparsing = True
+
     def __init__(self):
         super().__init__(Language.find('Python 3'))
 
@@ -44,3 +96,136 @@ class TypedPythonUnparserWithComments(TypedPythonUnparser):
     def unparse(self, tree: typed_ast.ast3.AST) -> str:
         code = horast.unparse(tree)
         return code
+
+
+class NumbaPythonUnparser(TypedPythonUnparserWithComments):
+
+    """Generate Python 3 code in which all module-level functions are compiled by Numba.
+
+    Functions are decorated with numba.njit and, if types of all parameters and of the return
+    value are known, with an explicit signature. When parallel is enabled, outermost loops
+    whose iterations are independent are executed via numba.prange.
+    """
+
+    def __init__(self, parallel: bool = False):
+        super().__init__()
+        self.language = Language.find('Python+Numba')
+        self.parallel = parallel
+
+    def unparse(self, tree: typed_ast.ast3.AST) -> str:
+        return super().unparse(self._accelerated(tree))
+
+    def unparse_in_parallel(self, tree: typed_ast.ast3.AST, workers: t.Optional[int] = None,
+                            **kwargs) -> str:
+        return super().unparse_in_parallel(self._accelerated(tree), workers, **kwargs)
+
+    def _unparse_unit(self, tree: typed_ast.ast3.AST, **kwargs) -> str:
+        return super().unparse(tree, **kwargs)
+
+    def _accelerated(self, tree: typed_ast.ast3.AST) -> typed_ast.ast3.AST:
+        tree = deepcopy_ast(tree)
+        if isinstance(tree, typed_ast.ast3.FunctionDef):
+            self._accelerate(tree)
+        elif isinstance(tree, typed_ast.ast3.Module):
+            functions = [_ for _ in tree.body if isinstance(_, typed_ast.ast3.FunctionDef)]
+            for function in functions:
+                self._accelerate(function)
+            if functions:
+                self._ensure_numba_import(tree)
+        return tree
+
+    @staticmethod
+    def _ensure_numba_import(module: typed_ast.ast3.Module) -> None:
+        index = None
+        for i, stmt in enumerate(module.body):
+            if isinstance(stmt, typed_ast.ast3.Import):
+                if any(_.name == 'numba' and _.asname is None for _ in stmt.names):
+                    return
+                index = i + 1
+            elif isinstance(stmt, typed_ast.ast3.ImportFrom):
+                index = i + 1
+            elif isinstance(stmt, (typed_ast.ast3.FunctionDef, typed_ast.ast3.ClassDef)):
+                break
+        if index is None:
+            first = module.body[0] if module.body else None
+            has_docstring = isinstance(first, typed_ast.ast3.Expr) \
+                and isinstance(first.value, typed_ast.ast3.Str)
+            index = 1 if has_docstring else 0
+        module.body.insert(index, typed_ast.ast3.Import(
+            names=[typed_ast.ast3.alias(name='numba', asname=None)]))
+
+    def signature(self, function: typed_ast.ast3.FunctionDef) -> t.Optional[str]:
+        """Create explicit Numba signature of a function, or None if some types are unknown.
+
+        Types of parameters without annotations are looked up in variable annotations
+        in the function body, as created when generalizing Fortran declarations.
+        """
+        args = function.args
+        if args.vararg is not None or args.kwarg is not None or args.kwonlyargs:
+            return None
+        declarations = {
+            stmt.target.id: stmt.annotation for stmt in function.body
+            if isinstance(stmt, typed_ast.ast3.AnnAssign)
+            and isinstance(stmt.target, typed_ast.ast3.Name)}
+        arg_types = []
+        for arg in args.args:
+            annotation = arg.annotation if arg.annotation is not None \
+                else declarations.get(arg.arg)
+            arg_type = None if annotation is None else numba_type(annotation)
+            if arg_type is None:
+                return None
+            arg_types.append(arg_type)
+        returns = function.returns
+        if returns is None:
+            return None
+        if isinstance(returns, typed_ast.ast3.NameConstant) and returns.value is None:
+            return_type = 'void'
+        else:
+            return_type = numba_type(returns)
+            if return_type is None:
+                return None
+        return '{}({})'.format(return_type, ', '.join(arg_types))
+
+    def _parallelize_loops(self, body: list, names_used_later: t.Set[str]) -> int:
+        parallelized = 0
+        for i, stmt in enumerate(body):
+            used_later = set(names_used_later)
+            for later_stmt in body[i + 1:]:
+                used_later |= names_used_outside_loops(later_stmt)
+            if is_range_loop(stmt):
+                if stmt.target.id not in used_later \
+                        and loop_iterations_independent(stmt, used_later):
+                    stmt.iter.func = typed_ast.ast3.Attribute(
+                        value=typed_ast.ast3.Name(id='numba', ctx=typed_ast.ast3.Load()),
+                        attr='prange', ctx=typed_ast.ast3.Load())
+                    parallelized += 1
+            elif isinstance(stmt, (typed_ast.ast3.If, typed_ast.ast3.With)):
+                parallelized += self._parallelize_loops(stmt.body, used_later)
+                parallelized += self._parallelize_loops(getattr(stmt, 'orelse', []), used_later)
+        return parallelized
+
+    def _accelerate(self, function: typed_ast.ast3.FunctionDef) -> None:
+        for decorator in function.decorator_list:
+            if isinstance(decorator, typed_ast.ast3.Call):
+                decorator = decorator.func
+            if isinstance(decorator, typed_ast.ast3.Attribute) \
+                    and isinstance(decorator.value, typed_ast.ast3.Name) \
+                    and decorator.value.id == 'numba':
+                _LOG.debug('function %s is already compiled by Numba', function.name)
+                return
+        signature = self.signature(function)
+        if signature is None:
+            _LOG.info('types of function %s are not fully known, Numba will infer them',
+                      function.name)
+        keywords = []
+        if self.parallel:
+            parallelized = self._parallelize_loops(function.body, set())
+            _LOG.debug('parallelized %i loops in function %s', parallelized, function.name)
+            keywords.append(typed_ast.ast3.keyword(
+                arg='parallel', value=typed_ast.ast3.NameConstant(value=True)))
+        function.decorator_list.append(typed_ast.ast3.Call(
+            func=typed_ast.ast3.Attribute(
+                value=typed_ast.ast3.Name(id='numba', ctx=typed_ast.ast3.Load()),
+                attr='njit', ctx=typed_ast.ast3.Load()),
+            args=[] if signature is None else [typed_ast.ast3.Str(s=signature)],
+            keywords=keywords))